@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""CLI app to compare the memory used by parsed cases as dicts and as
+records.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(sys.argv[0])))
+from docket import corpus
+from docket import vtr
+
+
+def measure(lines, records, results):
+    """Parse the lines, keeping all of the cases, and report how much
+    the peak RSS of the process grew (in KB on Linux).
+    """
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    parser = vtr.Parser(records=records)
+    cases = list(parser.parse(lines))
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((len(cases), after - before))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the memory used by parsed cases as dicts '
+        'and as records',
+        )
+    parser.add_argument('-v', dest='verbosity', default=[None],
+                        action='append_const', const=None,
+                        help='Increase verbosity',
+                        )
+    parser.add_argument('-q', dest='verbosity', action='store_const',
+                        const=[],
+                        help='Quiet mode',
+                        )
+    parser.add_argument('--cases', dest='num_cases', action='store',
+                        type=int, default=50000,
+                        help='Number of cases to generate',
+                        )
+    parser.add_argument('--seed', dest='seed', action='store',
+                        type=int, default=0,
+                        help='Seed for the corpus generator',
+                        )
+    args = parser.parse_args()
+
+    verbosity = len(args.verbosity)
+    if verbosity < 0:
+        verbosity = 0
+    if verbosity > 2:
+        verbosity = 2
+    level = {0: logging.WARNING,
+             1: logging.INFO,
+             2: logging.DEBUG,
+             }[verbosity]
+    logging.basicConfig(level=level,
+                        format='%(levelname)-8s %(name)s %(message)s',
+                        )
+    log = logging.getLogger('benchmark_memory')
+    # Parse errors are not interesting here.
+    logging.getLogger('docket.vtr').setLevel(logging.CRITICAL)
+
+    log.info('generating %d cases', args.num_cases)
+    lines = list(corpus.Generator(args.seed).lines(args.num_cases))
+
+    # Measure each mode in a new process so the peak RSS of one does
+    # not hide the other.
+    usage = {}
+    for name, records in [('dicts', False), ('records', True)]:
+        log.info('parsing into %s', name)
+        results = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=measure,
+                                       args=(lines, records, results))
+        proc.start()
+        num_cases, usage[name] = results.get()
+        proc.join()
+        print '%-8s %8d cases %10d KB %8.0f bytes/case' % (
+            name, num_cases, usage[name],
+            1024.0 * usage[name] / (num_cases or 1),
+            )
+    if usage['dicts']:
+        print 'records use %.0f%% of the memory of dicts' % (
+            100.0 * usage['records'] / usage['dicts'])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""CLI app to measure the throughput of the VTR parser on a generated
+corpus.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(sys.argv[0])))
+from docket import benchmark
+from docket import corpus
+from docket import vtr
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure the throughput of the VTR parser',
+        )
+    parser.add_argument('-v', dest='verbosity', default=[None],
+                        action='append_const', const=None,
+                        help='Increase verbosity',
+                        )
+    parser.add_argument('-q', dest='verbosity', action='store_const',
+                        const=[],
+                        help='Quiet mode',
+                        )
+    parser.add_argument('--engine', dest='engines', action='append',
+                        default=[],
+                        choices=sorted(vtr.ENGINES),
+                        help='Engine to measure (default: all of them)',
+                        )
+    parser.add_argument('--cases', dest='num_cases', action='store',
+                        type=int, default=20000,
+                        help='Number of cases to generate',
+                        )
+    parser.add_argument('--seed', dest='seed', action='store',
+                        type=int, default=0,
+                        help='Seed for the corpus generator',
+                        )
+    parser.add_argument('--error-rate', dest='error_rate', action='store',
+                        type=float, default=0.01,
+                        help='Fraction of the lines to make malformed',
+                        )
+    parser.add_argument('--repeat', dest='repeat', action='store',
+                        type=int, default=3,
+                        help='Number of runs to take the best time from',
+                        )
+    parser.add_argument('--skim', dest='skim', action='store',
+                        help='Comma separated keywords to parse, skipping '
+                        'the other lines',
+                        )
+    parser.add_argument('--fields', dest='fields', action='store_true',
+                        default=False,
+                        help='Show the time spent on each type of line',
+                        )
+    parser.add_argument('--baseline', dest='baseline', action='store',
+                        help='JSON file with the results to compare with',
+                        )
+    parser.add_argument('--save-baseline', dest='save_baseline',
+                        action='store_true', default=False,
+                        help='Write the results to the baseline file',
+                        )
+    parser.add_argument('--tolerance', dest='tolerance', action='store',
+                        type=float, default=0.1,
+                        help='Fraction of the baseline a result may be '
+                        'worse by before it is a regression',
+                        )
+    args = parser.parse_args()
+
+    verbosity = len(args.verbosity)
+    if verbosity < 0:
+        verbosity = 0
+    if verbosity > 2:
+        verbosity = 2
+    level = {0: logging.WARNING,
+             1: logging.INFO,
+             2: logging.DEBUG,
+             }[verbosity]
+    logging.basicConfig(level=level,
+                        format='%(levelname)-8s %(name)s %(message)s',
+                        )
+    log = logging.getLogger('benchmark_parser')
+    # The malformed lines would be logged as errors.
+    logging.getLogger('docket.vtr').setLevel(logging.CRITICAL)
+
+    if args.save_baseline and not args.baseline:
+        parser.error('--save-baseline requires --baseline')
+    engines = args.engines or sorted(vtr.ENGINES)
+    keywords = args.skim.split(',') if args.skim is not None else None
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'corpus.vtr')
+        log.info('generating %d cases in %s', args.num_cases, filename)
+        corpus.write_corpus(filename, args.num_cases,
+                            seed=args.seed, error_rate=args.error_rate)
+        results = {}
+        for engine in engines:
+            log.info('measuring %s', engine)
+            # Use a new process for each engine so the peak memory
+            # of one run does not hide the next.
+            pool = multiprocessing.Pool(1)
+            try:
+                results[engine] = pool.apply(
+                    benchmark.run,
+                    (filename, engine, args.repeat, keywords),
+                    )
+            finally:
+                pool.terminate()
+                pool.join()
+    finally:
+        shutil.rmtree(tmpdir)
+
+    print '%-10s %8s %8s %7s %12s %10s %10s' % (
+        'engine', 'lines', 'cases', 'errors', 'lines/sec', 'cases/sec',
+        'peak KB')
+    for engine in engines:
+        print '%(engine)-10s %(lines)8d %(cases)8d %(errors)7d ' \
+            '%(lines_per_sec)12.1f %(cases_per_sec)10.1f ' \
+            '%(peak_rss_kb)10d' % results[engine]
+    if args.fields:
+        for engine in engines:
+            print
+            print engine
+            for line in vtr.format_parse_stats(results[engine]['fields']):
+                print (u'  %s' % line).encode('utf-8')
+
+    if not args.baseline:
+        return 0
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        log.info('saved baseline to %s', args.baseline)
+        return 0
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    regressions = []
+    for engine in engines:
+        if engine not in baseline:
+            log.warning('no baseline for %s', engine)
+            continue
+        regressions.extend(benchmark.compare(results[engine],
+                                             baseline[engine],
+                                             args.tolerance))
+    for r in regressions:
+        print 'REGRESSION:', r
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""CLI app to compare the output of the VTR parsing engines.
+"""
+
+import argparse
+import codecs
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(sys.argv[0])))
+from docket import vtr
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='CLI app to check VTR parsing engines against pyparsing',
+        )
+    parser.add_argument('filenames', nargs='+')
+    parser.add_argument('-v', dest='verbosity', default=[None],
+                        action='append_const', const=None,
+                        help='Increase verbosity',
+                        )
+    parser.add_argument('-q', dest='verbosity', action='store_const',
+                        const=[],
+                        help='Quiet mode',
+                        )
+    parser.add_argument('--engine', dest='engine', action='store',
+                        default='regex',
+                        choices=sorted(e for e in vtr.ENGINES
+                                       if e != 'pyparsing'),
+                        help='Engine to compare with the pyparsing engine',
+                        )
+    args = parser.parse_args()
+
+    verbosity = len(args.verbosity)
+    if verbosity < 0:
+        verbosity = 0
+    if verbosity > 2:
+        verbosity = 2
+    level = {0: logging.WARNING,
+             1: logging.INFO,
+             2: logging.DEBUG,
+             }[verbosity]
+    logging.basicConfig(level=level,
+                        format='%(levelname)-8s %(name)s %(message)s',
+                        )
+    # The parsers log every bad line, which is not interesting here.
+    logging.getLogger('docket.vtr').setLevel(logging.CRITICAL)
+    log = logging.getLogger('compare_engines')
+
+    num_differences = 0
+    for name in args.filenames:
+        log.info('comparing engines on %s', name)
+        with codecs.open(name, 'r', encoding='utf-8') as f:
+            differences = vtr.compare_engines(f, engine=args.engine)
+        for d in differences:
+            print ('%s: %s' % (name, d)).encode('utf-8')
+        num_differences += len(differences)
+    log.info('Found %d differences', num_differences)
+    return 1 if num_differences else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
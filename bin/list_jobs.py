@@ -7,9 +7,26 @@ import logging
 import os
 import sys
 
-from pymongo import Connection
-
 sys.path.append(os.path.dirname(os.path.dirname(sys.argv[0])))
+from docket.db import get_connection, get_job_rates
+
+
+def describe_job(job):
+    "Return the status and results of a job for the listing."
+    parts = [job.get('status', '-')]
+    rates = get_job_rates(job)
+    if rates:
+        parts.append('%.1fs' % rates['elapsed'])
+    if job.get('num_cases') is not None:
+        parts.append('%d cases' % job['num_cases'])
+    if job.get('num_written') is not None:
+        parts.append('%d written' % job['num_written'])
+    if job.get('num_errors') is not None:
+        parts.append('%d errors' % job['num_errors'])
+    if rates:
+        parts.append('%.1f cases/s' % rates['cases_per_second'])
+        parts.append('%.2f MB/s' % (rates['bytes_per_second'] / 2.0 ** 20))
+    return '  '.join(parts)
 
 
 def main():
@@ -28,6 +45,12 @@ def main():
                         default='docket',
                         help='Database name',
                         )
+    parser.add_argument('--host', dest='host', action='store',
+                        help='Database server host name',
+                        )
+    parser.add_argument('--port', dest='port', action='store', type=int,
+                        help='Database server port',
+                        )
     args = parser.parse_args()
 
     verbosity = len(args.verbosity)
@@ -44,13 +67,13 @@ def main():
                         )
     log = logging.getLogger('list_jobs')
 
-    conn = Connection()
+    conn = get_connection(args.host, args.port)
     db = getattr(conn, args.database)
 
     results = db.jobs.find({}).sort([('start', -1)])
     n = 0
     for job in results:
-        print job['start'], job['_id']
+        print job['start'], job['_id'], describe_job(job)
         n += 1
     log.debug('Found %d results', n)
     return 0
@@ -5,8 +5,11 @@
 import argparse
 import csv
 import logging
+import os
+import sys
 
-from pymongo import Connection
+sys.path.append(os.path.dirname(os.path.dirname(sys.argv[0])))
+from docket.db import get_connection
 
 
 def main():
@@ -26,6 +29,12 @@ def main():
                         default='docket',
                         help='Database name',
                         )
+    parser.add_argument('--host', dest='host', action='store',
+                        help='Database server host name',
+                        )
+    parser.add_argument('--port', dest='port', action='store', type=int,
+                        help='Database server port',
+                        )
     parser.add_argument('--reset-db', dest='reset_db', action='store_true',
                         default=False,
                         help='Reset (drop) the database before loading data',
@@ -48,13 +57,11 @@ def main():
 
     if args.reset_db:
         log.info('Resetting the database...')
-        conn = Connection()
+        conn = get_connection(args.host, args.port)
         db = getattr(conn, args.database)
         db.drop_collection('violation_codes')
-        conn.disconnect()
-        del conn
 
-    conn = Connection()
+    conn = get_connection(args.host, args.port)
     db = getattr(conn, args.database)
     violation_codes = db.violation_codes
 
@@ -5,22 +5,29 @@
 import argparse
 import datetime
 import logging
+import multiprocessing
 import os
 import sys
 import uuid
 
-from pymongo import Connection, ASCENDING
+from celery.exceptions import TimeoutError
+from pymongo import ASCENDING
 
 sys.path.append(os.path.dirname(os.path.dirname(sys.argv[0])))
+from docket import batch
 from docket import db
 from docket import tasks
+from docket import vtr
 
 
 def main():
     parser = argparse.ArgumentParser(
         description='CLI app to load VTR files into the docket database',
         )
-    parser.add_argument('filenames', nargs='+')
+    parser.add_argument('filenames', nargs='+',
+                        help='VTR files, which may be compressed with '
+                        'gzip, bzip2, or xz',
+                        )
     parser.add_argument('-v', dest='verbosity', default=[None],
                         action='append_const', const=None,
                         help='Increase verbosity',
@@ -33,11 +40,79 @@ def main():
                         default='docket',
                         help='Database name',
                         )
+    parser.add_argument('--host', dest='host', action='store',
+                        help='Database server host name',
+                        )
+    parser.add_argument('--port', dest='port', action='store', type=int,
+                        help='Database server port',
+                        )
+    parser.add_argument('--pool-size', dest='pool_size', action='store',
+                        type=int, default=db.POOL_SIZE,
+                        help='Number of connections each process keeps '
+                        'open to the database server',
+                        )
     parser.add_argument('--reset-db', dest='reset_db', action='store_true',
                         default=False,
                         help='Reset (drop) the database before loading data',
                         )
+    parser.add_argument('--engine', dest='engine', action='store',
+                        default='pyparsing',
+                        choices=sorted(vtr.ENGINES),
+                        help='Which VTR parsing engine to use',
+                        )
+    parser.add_argument('--trace', dest='trace', action='store_true',
+                        default=False,
+                        help='Show where the time goes while parsing',
+                        )
+    parser.add_argument('--max-errors', dest='max_errors', action='store',
+                        type=int, default=10000,
+                        help='Number of parse errors to record for each file '
+                        '(the rest are counted)',
+                        )
+    parser.add_argument('--cache-dir', dest='cache_dir', action='store',
+                        help='Directory on the workers for saving parsed '
+                        'files, to skip parsing them again if they have '
+                        'not changed',
+                        )
+    parser.add_argument('--line-ranges', dest='line_ranges',
+                        action='store_true', default=False,
+                        help='Store where the lines of each case are '
+                        'in the input file instead of copies of the lines',
+                        )
+    parser.add_argument('--batch-size', dest='batch_size', action='store',
+                        type=int, default=batch.BATCH_SIZE,
+                        help='Number of cases or participants to write to '
+                        'the database at a time',
+                        )
+    parser.add_argument('--write-queue', dest='write_queue_size',
+                        action='store', type=int,
+                        default=batch.WRITE_QUEUE_SIZE,
+                        help='Number of batches that can wait to be written '
+                        'by a separate thread while parsing continues '
+                        '(0 writes them between parsing)',
+                        )
+    parser.add_argument('--chunk-size', dest='chunk_size', action='store',
+                        type=int, default=None,
+                        help='Split each file into chunks of about this '
+                        'many lines, loaded by separate tasks '
+                        '(--trace and --cache-dir are not used)',
+                        )
+    parser.add_argument('--local-workers', dest='local_workers',
+                        action='store', type=int, default=0,
+                        help='Load the files in this many processes here '
+                        'instead of sending them to the celery workers, '
+                        'so no message broker is needed',
+                        )
+    parser.add_argument('--timeout', dest='timeout', action='store',
+                        type=float, default=3600,
+                        help='Seconds to wait for each file to be loaded '
+                        'before giving up on it (the job record shows '
+                        'whether it finished later)',
+                        )
     args = parser.parse_args()
+    if args.local_workers and args.chunk_size:
+        parser.error('--chunk-size needs the celery workers, '
+                     'it cannot be used with --local-workers')
 
     verbosity = len(args.verbosity)
     if verbosity < 0:
@@ -53,7 +128,14 @@ def main():
                         )
     log = logging.getLogger('vtr_loader')
 
-    conn = Connection()
+    # Start the local workers before connecting to the database, so
+    # they do not begin with copies of the connection.
+    if args.local_workers:
+        pool = multiprocessing.Pool(args.local_workers)
+    else:
+        pool = None
+
+    conn = db.get_connection(args.host, args.port, args.pool_size)
     database = getattr(conn, args.database)
 
     if args.reset_db:
@@ -62,14 +144,7 @@ def main():
 
     ## Participants collection
     log.info('indexing participants')
-
-    # for upsert
-    database.participants.create_index([
-            ('case', ASCENDING),
-            ('encoding', ASCENDING),
-            ('full_name', ASCENDING),
-            ('role', ASCENDING),
-            ])
+    db.index_participants(database.participants)
 
     ## Case collection
     log.info('indexing cases')
@@ -77,11 +152,16 @@ def main():
     # for browse
     database.cases.create_index('date')
     database.cases.create_index('location')
+    # for incremental loads
+    database.cases.create_index('filename')
     database.cases.create_index([
             ('book', ASCENDING),
             ('page', ASCENDING),
             ])
 
+    # for merging the results of the chunks of a file
+    database.chunks.create_index('job_id')
+
     # Get full paths to the input filenames
     filenames = [os.path.abspath(f)
                  for f in args.filenames
@@ -89,7 +169,11 @@ def main():
 
     # Start the tasks to parse the input files
     task_results = []
-    db_factory = db.DBFactory(args.database)
+    db_factory = db.DBFactory(args.database,
+                              host=args.host,
+                              port=args.port,
+                              pool_size=args.pool_size,
+                              )
     for name in filenames:
 
         job_id = unicode(uuid.uuid4())
@@ -101,25 +185,93 @@ def main():
         database.jobs.insert({'_id': job_id,
                               'start': job_start,
                               'filename': name,
+                              'status': 'queued',
                               })
 
         error_handler = db.ErrorHandler(db_factory, job_id, name)
 
-        parse_task = tasks.parse_file.delay(
-            filename=os.path.abspath(name),
-            db_factory=db_factory,
-            load_job_id=job_id,
-            error_handler=error_handler,
-            )
+        if args.chunk_size:
+            parse_task = tasks.start_chunks(
+                filename=name,
+                db_factory=db_factory,
+                load_job_id=job_id,
+                error_handler=error_handler,
+                chunk_size=args.chunk_size,
+                engine=args.engine,
+                line_ranges=args.line_ranges,
+                max_errors=args.max_errors,
+                batch_size=args.batch_size,
+                write_queue_size=args.write_queue_size,
+                )
+        else:
+            options = dict(
+                filename=os.path.abspath(name),
+                db_factory=db_factory,
+                load_job_id=job_id,
+                error_handler=error_handler,
+                engine=args.engine,
+                trace=args.trace,
+                line_ranges=args.line_ranges,
+                max_errors=args.max_errors,
+                cache_dir=args.cache_dir,
+                batch_size=args.batch_size,
+                write_queue_size=args.write_queue_size,
+                )
+            if pool is not None:
+                # Calling the task runs it in the pool process.
+                parse_task = pool.apply_async(tasks.parse_file, (), options)
+            else:
+                parse_task = tasks.parse_file.delay(**options)
 
-        task_results.append((name, parse_task))
+        task_results.append((name, job_id, parse_task))
 
-    for name, tr in task_results:
+    for name, job_id, tr in task_results:
         log.debug('waiting for %s', name)
-        file_results = tr.get()
-        log.info('%s: processed %d cases', name, file_results['num_cases'])
+        try:
+            file_results = tr.get(timeout=args.timeout)
+        except (TimeoutError, multiprocessing.TimeoutError):
+            log.error('%s: gave up waiting for job %s after %s seconds',
+                      name, job_id, args.timeout)
+            continue
+        log.info('%s: processed %d cases%s', name, file_results['num_cases'],
+                 ' from the parse cache' if file_results.get('cached') else '')
+        case_counts = file_results.get('case_counts')
+        if case_counts:
+            log.info('%s: %d added, %d changed, %d unchanged, %d moved, '
+                     '%d removed',
+                     name, case_counts['added'], case_counts['changed'],
+                     case_counts['unchanged'], case_counts.get('moved', 0),
+                     case_counts['removed'])
+        if file_results.get('num_errors'):
+            log.warning('%s: %d parse errors', name,
+                        file_results['num_errors'])
+        date_cache = file_results.get('date_cache')
+        if date_cache:
+            lookups = date_cache['hits'] + date_cache['misses']
+            log.info('%s: date cache hit rate %.1f%% (%d lookups)',
+                     name,
+                     (100.0 * date_cache['hits'] / lookups) if lookups else 0,
+                     lookups,
+                     )
+        stage_times = file_results.get('stage_times')
+        if stage_times:
+            log.info('%s: parse stage %.2fs busy, %.2fs waiting; '
+                     'write stage %.2fs busy, %.2fs waiting',
+                     name,
+                     stage_times['parse_busy'], stage_times['parse_wait'],
+                     stage_times['write_busy'], stage_times['write_wait'],
+                     )
+        parse_stats = file_results.get('parse_stats')
+        if parse_stats:
+            print '%s:' % name
+            for line in vtr.format_parse_stats(parse_stats):
+                print (u'  %s' % line).encode('utf-8')
         for e in file_results['errors']:
             log.error('%s: %s', name, e)
 
+    if pool is not None:
+        pool.close()
+        pool.join()
+
 if __name__ == '__main__':
     main()
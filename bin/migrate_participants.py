@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""CLI app to convert the participants in the database from one
+document per encoding to one document per participant.
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import sys
+
+from pymongo import ASCENDING
+
+sys.path.append(os.path.dirname(os.path.dirname(sys.argv[0])))
+from docket import batch
+from docket import db
+from docket import tasks
+
+# The converted participants are written here, and the collection is
+# renamed when they are all written.
+NEW_COLLECTION = 'participants_converted'
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert the participants in the docket database '
+        'to one document per participant. Do not load files while '
+        'this runs.',
+        )
+    parser.add_argument('-v', dest='verbosity', default=[None],
+                        action='append_const', const=None,
+                        help='Increase verbosity',
+                        )
+    parser.add_argument('-q', dest='verbosity', action='store_const',
+                        const=[],
+                        help='Quiet mode',
+                        )
+    parser.add_argument('--db', dest='database', action='store',
+                        default='docket',
+                        help='Database name',
+                        )
+    parser.add_argument('--host', dest='host', action='store',
+                        help='Database server host name',
+                        )
+    parser.add_argument('--port', dest='port', action='store', type=int,
+                        help='Database server port',
+                        )
+    parser.add_argument('--batch-size', dest='batch_size', action='store',
+                        type=int, default=batch.BATCH_SIZE,
+                        help='Number of participants to write at a time',
+                        )
+    args = parser.parse_args()
+
+    verbosity = len(args.verbosity)
+    if verbosity < 0:
+        verbosity = 0
+    if verbosity > 2:
+        verbosity = 2
+    level = {0: logging.WARNING,
+             1: logging.INFO,
+             2: logging.DEBUG,
+             }[verbosity]
+    logging.basicConfig(level=level,
+                        format='%(levelname)-8s %(name)s %(message)s',
+                        )
+    log = logging.getLogger('migrate_participants')
+
+    conn = db.get_connection(args.host, args.port)
+    database = getattr(conn, args.database)
+    new = database[NEW_COLLECTION]
+    new.drop()
+
+    errors = []
+    writer = batch.BatchWriter(
+        new,
+        replace_field='case',
+        batch_size=args.batch_size,
+        error_handler=errors.append,
+        describe=lambda p: 'participant %s for case %s' % (p['full_name'],
+                                                          p['case']),
+        )
+    num_read = [0]
+    num_converted = 0
+
+    def read_all():
+        # The old participants of a case are next to each other when
+        # sorted by case.
+        for doc in database.participants.find().sort([('case', ASCENDING)]):
+            num_read[0] += 1
+            yield doc
+
+    log.info('converting participants')
+    for case_id, docs in itertools.groupby(read_all(), lambda d: d['case']):
+        for doc in tasks.upgrade_participants(docs):
+            writer.add(doc)
+            num_converted += 1
+    writer.flush()
+    log.info('read %d documents, wrote %d', num_read[0], writer.num_written)
+
+    if errors:
+        log.error('%d participants could not be converted, '
+                  'leaving the participants collection as it was',
+                  len(errors))
+        return 1
+
+    # The old participants are dropped by the rename, so make sure the
+    # server has every converted one first. The inserts are
+    # acknowledged (see batch.BatchWriter), so this should not happen.
+    num_stored = new.count()
+    if num_stored != num_converted:
+        log.error('%d participants were converted, but %d were stored, '
+                  'leaving the participants collection as it was',
+                  num_converted, num_stored)
+        return 1
+
+    log.info('indexing participants')
+    db.index_participants(new)
+    new.rename('participants', dropTarget=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,10 +8,9 @@ import logging
 import os
 import sys
 
-from pymongo import Connection
-
 sys.path.append(os.path.dirname(os.path.dirname(sys.argv[0])))
-from docket.encodings import ENCODERS
+from docket.db import get_connection
+from docket.encodings import ENCODERS, make_name_query
 
 
 def main():
@@ -30,6 +29,12 @@ def main():
                         default='docket',
                         help='Database name',
                         )
+    parser.add_argument('--host', dest='host', action='store',
+                        help='Database server host name',
+                        )
+    parser.add_argument('--port', dest='port', action='store', type=int,
+                        help='Database server port',
+                        )
     parser.add_argument('-f', '--first', dest='first', action='store',
                         default=None,
                         help='First name',
@@ -71,18 +76,14 @@ def main():
                         )
     log = logging.getLogger('vtr_loader')
 
-    # Build the search query
+    # Build the search queries. The names are found in the
+    # participants, and the dates in the cases.
+    name_query = make_name_query(args.encoding,
+                                 first_name=args.first,
+                                 middle_name=args.middle,
+                                 last_name=args.last,
+                                 )
     query = {}
-    encoder = ENCODERS[args.encoding]
-    if args.first:
-        key = 'participants.first_name_%s' % args.encoding
-        query[key] = encoder(args.first)
-    if args.middle:
-        key = 'participants.middle_name_%s' % args.encoding
-        query[key] = encoder(args.middle)
-    if args.last:
-        key = 'participants.last_name_%s' % args.encoding
-        query[key] = encoder(args.last)
     if args.start_date:
         start = datetime.datetime.strptime(args.start_date, '%Y-%m-%d')
         ad = query.setdefault('arrest_date', {})
@@ -92,14 +93,20 @@ def main():
         ad = query.setdefault('arrest_date', {})
         ad['$lte'] = stop
 
-    log.debug('query=%r', query)
+    log.debug('name_query=%r query=%r', name_query, query)
 
-    if not query:
+    if not (name_query or query):
         log.error('Provide at least one search parameter')
         return 1
 
-    conn = Connection()
+    conn = get_connection(args.host, args.port)
     db = getattr(conn, args.database)
+    if name_query:
+        case_ids = set(p['case']
+                       for p in db.participants.find(name_query,
+                                                     fields=['case'])
+                       )
+        query['_id'] = {'$in': sorted(case_ids)}
     results = db.cases.find(query)
 
     n = 0
@@ -7,9 +7,8 @@ import json
 import os
 import sys
 
-from pymongo import Connection
-
 sys.path.append(os.path.dirname(os.path.dirname(sys.argv[0])))
+from docket.db import get_connection, get_job_rates
 
 
 def main():
@@ -24,17 +23,28 @@ def main():
                         default='docket',
                         help='Database name',
                         )
+    parser.add_argument('--host', dest='host', action='store',
+                        help='Database server host name',
+                        )
+    parser.add_argument('--port', dest='port', action='store', type=int,
+                        help='Database server port',
+                        )
     parser.add_argument('job', action='store',
                         help='Job ID',
                         )
     args = parser.parse_args()
 
-    conn = Connection()
+    conn = get_connection(args.host, args.port)
     db = getattr(conn, args.database)
 
     results = db.jobs.find({'_id': args.job})
     for job in results:
-        job['start'] = job['start'].isoformat()
+        rates = get_job_rates(job)
+        if rates:
+            job.update(rates)
+        for name in ['start', 'end']:
+            if job.get(name):
+                job[name] = job[name].isoformat()
         job['errors'] = list(db.errors.find({'job_id': args.job}))
         print json.dumps(job,
                          sort_keys=True,
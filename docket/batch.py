@@ -0,0 +1,202 @@
+"""Write documents to the database in batches.
+"""
+
+import logging
+import Queue
+import sys
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+# Number of documents to send to the database at a time
+BATCH_SIZE = 500
+
+# Number of batches that can be waiting for the write thread
+WRITE_QUEUE_SIZE = 4
+
+
+class WriteQueue(object):
+    """Writes batches in a separate thread, so the database can work
+    while the next batch is being built.
+
+    At most size batches wait to be written. When the queue is full,
+    put() blocks until the write thread catches up. The time each side
+    spends working and waiting is kept in busy and waited, by stage.
+    """
+
+    def __init__(self, size=WRITE_QUEUE_SIZE):
+        self.queue = Queue.Queue(size)
+        self.busy = {'parse': 0.0, 'write': 0.0}
+        self.waited = {'parse': 0.0, 'write': 0.0}
+        self.error = None
+        self.started = time.time()
+        self.thread = threading.Thread(target=self._run,
+                                       name='write-queue')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, func, *args):
+        "Queue a call to be made by the write thread."
+        start = time.time()
+        self.queue.put((func, args))
+        self.waited['parse'] += time.time() - start
+
+    def _run(self):
+        while True:
+            start = time.time()
+            item = self.queue.get()
+            now = time.time()
+            self.waited['write'] += now - start
+            if item is None:
+                break
+            func, args = item
+            try:
+                func(*args)
+            except Exception:
+                # Keep taking batches so put() does not block forever.
+                log.exception('Error in the write thread')
+                if self.error is None:
+                    self.error = sys.exc_info()
+            self.busy['write'] += time.time() - now
+
+    def close(self):
+        """Wait for the queued batches to be written, and stop the
+        thread. An unexpected error from a write is raised here.
+        """
+        start = time.time()
+        self.queue.put(None)
+        self.thread.join()
+        self.waited['parse'] += time.time() - start
+        self.busy['parse'] = (time.time() - self.started -
+                              self.waited['parse'])
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+
+    def stats(self):
+        "Return the busy and waiting times for each stage."
+        return {'parse_busy': self.busy['parse'],
+                'parse_wait': self.waited['parse'],
+                'write_busy': self.busy['write'],
+                'write_wait': self.waited['write'],
+                }
+
+
+class BatchWriter(object):
+    """Replaces documents in a collection, a batch at a time.
+
+    replace_field names the field that identifies the documents being
+    replaced, such as '_id' for cases or 'case' for participants. The
+    first time a value of the field is seen, the documents already in
+    the collection with that value are removed, and then the new
+    documents are inserted. Each batch takes one remove and one
+    acknowledged insert. replace() removes the documents with a value
+    even if no new ones are added for it.
+
+    If a batch cannot be written, the documents are saved one at a
+    time, and each one that fails is reported to the error_handler
+    with the description produced by describe(doc).
+
+    If there is a write_queue (see WriteQueue), the batches are written
+    by its thread, in the order they are flushed.
+
+    The time spent writing is added up in write_time.
+    """
+
+    def __init__(self, collection, replace_field='_id',
+                 batch_size=BATCH_SIZE, error_handler=None,
+                 describe=repr, write_queue=None):
+        self.collection = collection
+        self.replace_field = replace_field
+        self.batch_size = batch_size
+        self.error_handler = error_handler
+        self.describe = describe
+        self.write_queue = write_queue
+        self.pending = []
+        self.removals = []
+        self.replaced = set()
+        self.num_written = 0
+        self.num_batches = 0
+        self.write_time = 0.0
+
+    def add(self, doc):
+        "Queue a document, writing the batch when it is full."
+        self.pending.append(doc)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def replace(self, value):
+        """Remove the documents with value in the replace_field in the
+        next batch, whether or not any new ones are added for it.
+        """
+        if value in self.replaced:
+            return
+        self.replaced.add(value)
+        self.removals.append(value)
+        if len(self.removals) >= self.batch_size:
+            self.flush()
+
+    def report(self, message):
+        log.error('%s', message)
+        if self.error_handler is not None:
+            self.error_handler(message)
+
+    def flush(self):
+        "Write the queued documents, or pass them to the write_queue."
+        if not self.pending and not self.removals:
+            return
+        docs = self.pending
+        self.pending = []
+        values = self.removals
+        self.removals = []
+        self.num_batches += 1
+        field = self.replace_field
+        for doc in docs:
+            value = doc[field]
+            if value not in self.replaced:
+                self.replaced.add(value)
+                values.append(value)
+        if self.write_queue is None:
+            self._write(docs, values)
+        else:
+            self.write_queue.put(self._write, docs, values)
+
+    def _write(self, docs, values):
+        start = time.time()
+        try:
+            self._write_batch(docs, values)
+        finally:
+            self.write_time += time.time() - start
+
+    def _write_batch(self, docs, values):
+        field = self.replace_field
+        if values:
+            try:
+                self.collection.remove({field: {'$in': values}})
+            except Exception as err:
+                self.report('Could not remove old documents from %s: %s' %
+                            (self.collection.name, err))
+        if not docs:
+            return
+        # The server stops at the first document it rejects, such as
+        # one with a duplicate _id, so the insert is acknowledged to
+        # find out when to save the rest one at a time.
+        try:
+            self.collection.insert(docs, safe=True)
+        except Exception as err:
+            log.warning('Could not write a batch of %d documents to %s, '
+                        'retrying one at a time: %s',
+                        len(docs), self.collection.name, err)
+            # insert() gave each document an _id before sending them,
+            # so saving replaces the ones that were written.
+            for doc in docs:
+                try:
+                    self.collection.save(doc, safe=True)
+                except Exception as err:
+                    self.report('Could not store %s: %s' %
+                                (self.describe(doc), err))
+                else:
+                    self.num_written += 1
+        else:
+            self.num_written += len(docs)
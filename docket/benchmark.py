@@ -0,0 +1,77 @@
+"""Measure how fast the VTR parser is.
+"""
+
+import resource
+import timeit
+
+from docket import source, vtr
+
+
+def run(filename, engine='pyparsing', repeat=3, keywords=None):
+    """Parse the file and return a dict with the throughput, the peak
+    memory use, and the per-field stats from a traced run. If keywords
+    is set, the parser skims the file (see vtr.Parser).
+
+    The time is the best of repeat runs without tracing, because
+    tracing adds its own overhead. The peak memory is for the whole
+    process, so run each benchmark in a new process.
+    """
+    with source.MappedFile(filename) as f:
+        num_lines = sum(1 for line in f)
+    best = None
+    for i in range(repeat):
+        parser = vtr.Parser(engine=engine, keywords=keywords,
+                            max_errors=0)
+        with source.MappedFile(filename) as f:
+            start = timeit.default_timer()
+            num_cases = sum(1 for case in parser.parse(f))
+            elapsed = timeit.default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    num_errors = parser.error_count
+    parser = vtr.Parser(engine=engine, keywords=keywords, trace=True,
+                        max_errors=0)
+    with source.MappedFile(filename) as f:
+        for case in parser.parse(f):
+            pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'engine': engine,
+            'lines': num_lines,
+            'cases': num_cases,
+            'errors': num_errors,
+            'seconds': best,
+            'lines_per_sec': num_lines / best if best else 0.0,
+            'cases_per_sec': num_cases / best if best else 0.0,
+            'peak_rss_kb': peak,
+            'fields': parser.stats.as_dict(),
+            }
+
+
+# Measurements compared with the baseline, and whether bigger is better
+MEASUREMENTS = [('lines_per_sec', True),
+                ('cases_per_sec', True),
+                ('peak_rss_kb', False),
+                ]
+
+
+def compare(result, baseline, tolerance=0.1):
+    """Return a list of messages describing the measurements in result
+    that are worse than baseline by more than tolerance (a fraction of
+    the baseline value).
+    """
+    regressions = []
+    for name, bigger_is_better in MEASUREMENTS:
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        actual = result[name]
+        if bigger_is_better:
+            worse = actual < expected * (1 - tolerance)
+        else:
+            worse = actual > expected * (1 + tolerance)
+        if worse:
+            regressions.append('%s %s: %.1f, baseline %.1f (%+.1f%%)' % (
+                result['engine'], name, actual, expected,
+                100.0 * (actual - expected) / expected,
+                ))
+    return regressions
@@ -0,0 +1,107 @@
+"""Keep track of the books loaded into the database.
+
+Each book document has a list of 'files', with the cases found in the
+book by the last load of each file: the number of cases and the range
+of their pages and dates. A book is usually in one file, but may be
+split across several. summarize() combines them.
+"""
+
+import collections
+
+
+class BookStats(object):
+    """Collects the statistics for the books in one file as its cases
+    are parsed.
+    """
+
+    def __init__(self):
+        self.books = collections.OrderedDict()
+
+    def add(self, case):
+        "Count a case."
+        stats = self.books.get(case['book'])
+        if stats is None:
+            stats = self.books[case['book']] = {
+                'num_cases': 0,
+                'first_page': None,
+                'last_page': None,
+                'first_date': None,
+                'last_date': None,
+                }
+        stats['num_cases'] += 1
+        for name, value in [('page', case['page']),
+                            ('date', case.get('date')),
+                            ]:
+            if value is None:
+                continue
+            first = 'first_' + name
+            if stats[first] is None or value < stats[first]:
+                stats[first] = value
+            last = 'last_' + name
+            if stats[last] is None or value > stats[last]:
+                stats[last] = value
+
+    def merge(self, book, other):
+        """Add the statistics for a book collected from another part of
+        the file.
+        """
+        stats = self.books.get(book)
+        if stats is None:
+            self.books[book] = dict(other)
+            return
+        stats['num_cases'] += other['num_cases']
+        for name, choose in [('first_page', min),
+                             ('last_page', max),
+                             ('first_date', min),
+                             ('last_date', max),
+                             ]:
+            values = [v for v in (stats[name], other[name]) if v is not None]
+            stats[name] = choose(values) if values else None
+
+
+def update_books(db, stats, filename, load_job_id):
+    """Save the statistics for the books in filename, replacing the
+    ones from the last time it was loaded.
+
+    This takes two updates for each book, and one more to remove the
+    file from books it no longer has cases for.
+    """
+    for book, book_stats in stats.books.items():
+        file_stats = {'filename': filename,
+                      'load_job_id': load_job_id,
+                      }
+        file_stats.update(book_stats)
+        db.books.update({'_id': book},
+                        {'$pull': {'files': {'filename': filename}}},
+                        )
+        db.books.update({'_id': book},
+                        {'$set': {'year': int(book.split('/')[0]),
+                                  'number': book.split('/')[1],
+                                  },
+                         '$addToSet': {'load_jobs': load_job_id},
+                         '$push': {'files': file_stats},
+                         },
+                        upsert=True,
+                        )
+    db.books.update({'_id': {'$nin': list(stats.books)},
+                     'files.filename': filename,
+                     },
+                    {'$pull': {'files': {'filename': filename}}},
+                    multi=True,
+                    )
+
+
+def summarize(book):
+    """Return the statistics for all of the cases in a book document,
+    combining the files it was loaded from.
+    """
+    files = book.get('files', [])
+    summary = {'num_cases': sum(f['num_cases'] for f in files)}
+    for name, choose in [('first_page', min),
+                         ('last_page', max),
+                         ('first_date', min),
+                         ('last_date', max),
+                         ]:
+        values = [f[name] for f in files if f.get(name) is not None]
+        summary[name] = choose(values) if values else None
+    return summary
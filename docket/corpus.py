@@ -0,0 +1,191 @@
+# -*- encoding: utf-8 -*-
+"""Generate synthetic VTR input for tests and benchmarks.
+"""
+
+import codecs
+import random
+
+
+FIRST_NAMES = [u'Charley', u'Tom', u'William', u'Mary', u'Henry', u'Lula',
+               u'J. T.', u'A. J.', u'Renée', u'Bob', u'Sam', u'Annie']
+LAST_NAMES = [u'Thomas', u'Lane', u'Griffith', u'Hamilton', u'Watson',
+              u'Brown', u'Barnett', u'Lambert', u'Williams', u'Smith']
+TITLES = [u'Mr.', u'Mrs.', u'Miss', u'Dr.', u'Rev.']
+SUFFIXES = [u'Jr.', u'Sr.', u'III']
+STREETS = [u'Hoyt Street', u'College & River Streets', u'Broad Street',
+           u'Foundry Street', u'Oconee Street', u'Hancock Avenue']
+MONTHS = [u'Jan', u'Feb', u'Mar', u'Apr', u'May', u'Jun', u'July', u'Aug',
+          u'Sept', u'Oct', u'Nov', u'Dec']
+VIOLATIONS = [u'360', u'361', u'362', u'400', u'417', u'501']
+VEHICLES = [u'buggy', u'wagon', u'bicycle', u'automobile abc 123']
+NOTES = [u'paid', u'illegible', u'see next page',
+         u'Paid back by J. W. Barnett of the above fine',
+         u'Turned over to Streets']
+SENTENCE_TYPES = [u'C', u'F', u'J', u'L', u'M', u'P', u'PD', u'R', u'W']
+
+# Lines that do not parse, either because the value is wrong or
+# because the keyword is not known.
+MALFORMED = [u'ad 31 Foo 1903',
+             u'hd 12',
+             u'p maybe',
+             u'o nothing',
+             u'g x',
+             u'r q',
+             u'sr o',
+             u'd (note)',
+             u'x unknown keyword',
+             u'cx 1',
+             u'sc',
+             ]
+
+
+class Generator(object):
+    """Make up cases that look like the transcriptions.
+
+    Every field the parser knows about is used, with the variations
+    found in the real files. About error_rate of the lines are
+    replaced with malformed lines. The same seed always produces the
+    same lines.
+    """
+
+    def __init__(self, seed=0, error_rate=0.0, cases_per_page=8,
+                 pages_per_book=300):
+        self.random = random.Random(seed)
+        self.error_rate = error_rate
+        self.cases_per_page = cases_per_page
+        self.pages_per_book = pages_per_book
+
+    def name(self):
+        r = self.random
+        name = u'%s %s' % (r.choice(FIRST_NAMES), r.choice(LAST_NAMES))
+        if r.random() < 0.05:
+            name += u' alias=%s' % r.choice(LAST_NAMES)
+        if r.random() < 0.1:
+            name += u' title=%s' % r.choice(TITLES)
+        if r.random() < 0.05:
+            name += u' suffix=%s' % r.choice(SUFFIXES)
+        if r.random() < 0.05:
+            name += u' (%s)' % r.choice(NOTES)
+        return name
+
+    def date(self, year):
+        r = self.random
+        return u'%d %s %d' % (r.randint(1, 28), r.choice(MONTHS), year)
+
+    def note(self):
+        return u'(%s)' % self.random.choice(NOTES)
+
+    def amount(self):
+        r = self.random
+        if r.random() < 0.2:
+            return u'%.2f' % (r.randint(1, 3000) / 100.0)
+        return unicode(r.randint(1, 30))
+
+    def sentence_rendered(self):
+        r = self.random
+        choice = r.random()
+        if choice < 0.05:
+            return u'sr o %s' % self.note()
+        if choice < 0.1:
+            return u'sr %s' % r.choice([u'Guilty', u'Dismissed', u'PD'])
+        line = u'sr %s %s' % (self.amount(), r.choice(SENTENCE_TYPES))
+        if r.random() < 0.1:
+            line += u' ' + self.note()
+        return line
+
+    def sentence_served(self, year):
+        r = self.random
+        choice = r.random()
+        if choice < 0.1:
+            return u'ss W %s' % self.note()
+        if choice < 0.2:
+            return u'ss 1 %s' % self.date(year)
+        line = u'ss %s %s' % (self.amount(), r.choice(SENTENCE_TYPES))
+        if r.random() < 0.5:
+            line += u' ' + self.date(year)
+        if r.random() < 0.3:
+            line += u' ' + self.note()
+        return line
+
+    def sentence_contempt(self):
+        r = self.random
+        line = u'sc %s' % self.amount()
+        if r.random() < 0.5:
+            line += u' ' + r.choice(SENTENCE_TYPES)
+        if r.random() < 0.2:
+            line += u' ' + self.note()
+        return line
+
+    def case(self, number, year):
+        "Return the lines for one case."
+        r = self.random
+        lines = [u'c %d' % number,
+                 u'ad %s' % self.date(year),
+                 u'hd %s' % self.date(year),
+                 u'd %s' % self.name(),
+                 ]
+        if r.random() < 0.1:
+            lines.append(u'dv %s' % r.choice(VEHICLES))
+        violation = u'v %s' % r.choice(VIOLATIONS)
+        if r.random() < 0.1:
+            violation += u' ' + self.note()
+        lines.append(violation)
+        lines.append(u'l %s' % r.choice(STREETS))
+        lines.append(u'ao %s' % self.name())
+        for i in range(r.randint(0, 3)):
+            lines.append(u'w %s' % self.name())
+        for i in range(r.choice([0, 0, 0, 1, 2])):
+            lines.append(u'dw %s' % self.name())
+        if r.random() < 0.1:
+            lines.append(u'op %s' % self.name())
+        lines.append(u'p %s' % r.choice([u'guilty', u'g', u'ng', u'nc',
+                                          u'not guilty']))
+        for i in range(r.choice([1, 1, 1, 2])):
+            lines.append(self.sentence_rendered())
+        if r.random() < 0.5:
+            lines.append(self.sentence_served(year))
+        if r.random() < 0.1:
+            lines.append(self.sentence_contempt())
+        for i in range(r.choice([0, 0, 0, 1, 2])):
+            lines.append(u'n %s' % r.choice(NOTES))
+        lines.append(u'o %s' % r.choice([u'guilty', u'dismissed', u'ng',
+                                          u'suspended', u'd']))
+        lines.append(u'g %s' % r.choice(u'mfMF'))
+        lines.append(u'r %s' % r.choice(u'wcWC'))
+        if self.error_rate:
+            # Leave the case line alone, so the number of cases does
+            # not change.
+            for i in range(1, len(lines)):
+                if r.random() < self.error_rate:
+                    lines[i] = r.choice(MALFORMED)
+        return lines
+
+    def lines(self, num_cases):
+        "Generate the lines for num_cases cases."
+        book_number = 0
+        year = 1900
+        page = self.pages_per_book
+        case_number = 0
+        for i in xrange(num_cases):
+            if i % self.cases_per_page == 0:
+                page += 1
+                if page > self.pages_per_book:
+                    book_number += 1
+                    year += 1
+                    page = 1
+                    yield u'b %d/%d' % (year, book_number)
+                yield u''
+                yield u'pg %d' % page
+            case_number += 1
+            for line in self.case(case_number, year):
+                yield line
+
+
+def write_corpus(filename, num_cases, seed=0, error_rate=0.0):
+    """Write a VTR file with num_cases made up cases.
+    """
+    generator = Generator(seed, error_rate)
+    with codecs.open(filename, 'w', encoding='utf-8') as f:
+        for line in generator.lines(num_cases):
+            f.write(line)
+            f.write(u'\n')
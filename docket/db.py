@@ -1,33 +1,178 @@
+import collections
+import os
+import threading
+
 from pymongo import Connection
 
+from docket.encodings import ENCODERS, encoded_field
+
+# Where the database server is. None means the pymongo default.
+HOST = None
+PORT = None
+
+# Number of sockets each connection keeps open to the server
+POOL_SIZE = 10
+
+# Number of different error messages to save up before writing them
+ERROR_BUFFER_SIZE = 500
+
+# Number of line numbers to record for each error message
+MAX_ERROR_LINES = 1000
+
+# The open connections, by process id and server. A child process
+# made by fork (such as a celery worker) opens its own instead of
+# using its parent's sockets.
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def get_connection(host=HOST, port=PORT, pool_size=POOL_SIZE):
+    """Return the connection to the database server for this process,
+    opening it the first time.
+    """
+    pid = os.getpid()
+    key = (pid, host, port, pool_size)
+    with _connections_lock:
+        conn = _connections.get(key)
+        if conn is None:
+            for old_key in list(_connections):
+                if old_key[0] != pid:
+                    del _connections[old_key]
+            conn = _connections[key] = Connection(host, port,
+                                                  max_pool_size=pool_size)
+    return conn
+
+
+def index_participants(participants):
+    """Create the indexes for loading and searching the participants
+    collection.
+    """
+    # for replacing the participants of a case
+    participants.create_index('case')
+    # for search
+    for encoding in ENCODERS:
+        for field in ['first_name', 'last_name']:
+            participants.create_index(encoded_field(encoding, field))
+
+
+def get_job_rates(job):
+    """Return the number of seconds a finished load job took, and the
+    cases and bytes it loaded per second, or None if it has not
+    finished.
+    """
+    if not job.get('end'):
+        return None
+    elapsed = (job['end'] - job['start']).total_seconds()
+    if elapsed <= 0:
+        return None
+    return {'elapsed': elapsed,
+            'cases_per_second': (job.get('num_cases') or 0) / elapsed,
+            'bytes_per_second': (job.get('bytes_read') or 0) / elapsed,
+            }
+
 
 class DBFactory(object):
+    """Opens the database in whichever process it is used in, sharing
+    the connection with everything else in the process.
+    """
 
-    def __init__(self, dbname):
+    def __init__(self, dbname, host=HOST, port=PORT, pool_size=POOL_SIZE):
         self.dbname = dbname
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
 
     @property
     def conn(self):
-        return Connection()
+        return get_connection(self.host, self.port, self.pool_size)
 
     def __call__(self):
         return getattr(self.conn, self.dbname)
 
 
 class ErrorHandler(object):
+    """Records the errors for a load job.
+
+    The messages are saved up and written buffer_size at a time, and
+    when flush() is called at the end of the job. A message reported
+    more than once is stored once, with the number of times it was
+    reported and up to max_lines of the line numbers given with it.
+
+    Errors may be reported from more than one thread (see
+    batch.WriteQueue).
+    """
 
-    def __init__(self, db_factory, job_id, filename):
+    def __init__(self, db_factory, job_id, filename,
+                 buffer_size=ERROR_BUFFER_SIZE, max_lines=MAX_ERROR_LINES):
         self.db_factory = db_factory
         self.job_id = job_id
         self.filename = filename
+        self.buffer_size = buffer_size
+        self.max_lines = max_lines
+        # message -> [count, lines] not written yet
+        self.pending = collections.OrderedDict()
+        # message -> number of lines written
+        self.written = {}
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # The handler is sent to the workers, but the lock cannot be.
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
 
     @property
     def db(self):
         return self.db_factory()
 
-    def __call__(self, message):
-        self.db.errors.insert(
-            {'job_id': self.job_id,
-             'filename': self.filename,
-             'message': message,
-             })
+    def __call__(self, message, line=None):
+        with self.lock:
+            self._add(message, line)
+
+    def _add(self, message, line):
+        entry = self.pending.get(message)
+        if entry is None:
+            if len(self.pending) >= self.buffer_size:
+                self._flush()
+            entry = self.pending[message] = [0, []]
+        entry[0] += 1
+        if line is not None:
+            room = self.max_lines - self.written.get(message, 0)
+            if len(entry[1]) < room:
+                entry[1].append(line)
+
+    def flush(self):
+        "Write the saved messages."
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        pending = self.pending
+        self.pending = collections.OrderedDict()
+        errors = self.db.errors
+        new = []
+        for message, (count, lines) in pending.items():
+            if message in self.written:
+                errors.update({'job_id': self.job_id,
+                               'message': message,
+                               },
+                              {'$inc': {'count': count},
+                               '$pushAll': {'lines': lines},
+                               },
+                              )
+            else:
+                new.append({'job_id': self.job_id,
+                            'filename': self.filename,
+                            'message': message,
+                            'count': count,
+                            'lines': lines,
+                            })
+            self.written[message] = self.written.get(message, 0) + len(lines)
+        if new:
+            errors.insert(new)
@@ -39,3 +39,25 @@ ENCODERS = {
     'nysiis': nysiis,
     'normalized': normalize,
     }
+
+
+def encoded_field(encoding, field):
+    "Return the name of the participant field with the encoded names."
+    return 'encoded.%s.%s' % (encoding, field)
+
+
+def make_name_query(encoding, **names):
+    """Return a query for the participants with names that match the
+    given first_name, middle_name, or last_name using the encoding.
+    """
+    encoder = ENCODERS[encoding]
+    q = {}
+    for field, name in names.items():
+        if not name:
+            continue
+        encoded = filter(bool, encoder(name))
+        if len(encoded) == 1:
+            q[encoded_field(encoding, field)] = encoded[0]
+        else:
+            q[encoded_field(encoding, field)] = {'$in': encoded}
+    return q
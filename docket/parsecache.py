@@ -0,0 +1,179 @@
+"""Cache the results of parsing VTR files on disk.
+
+The cases and errors parsed from a file are saved under a key made
+from the contents of the file, the parser version, and the parser
+options. Parsing the same input again reads them back instead of
+running the parser.
+
+Each cache file is a series of zlib compressed blocks, each holding a
+series of pickles. The blocks are written as the cases are parsed, and
+read back one at a time, so the whole file is never in memory.
+"""
+
+import cPickle as pickle
+import cStringIO
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import zlib
+
+from docket import vtr
+
+
+log = logging.getLogger(__name__)
+
+# Bytes to read at a time when hashing input files
+BLOCK_SIZE = 1024 * 1024
+
+# Uncompressed bytes of pickles in each block of a cache file
+CACHE_BLOCK_SIZE = 1024 * 1024
+
+# Identifies the format of a cache file
+MAGIC = 'VTRCACHE1\n'
+
+# Each block starts with the length of the compressed data
+BLOCK_HEADER = struct.Struct('>I')
+
+# Markers for the items in a cache file
+CASE = 'c'
+ERROR = 'e'
+END = 'end'
+
+
+class BlockWriter(object):
+    """Write pickled items to a cache file in compressed blocks.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.f.write(MAGIC)
+        self._start_block()
+
+    def _start_block(self):
+        self.buffer = cStringIO.StringIO()
+        self.pickler = pickle.Pickler(self.buffer, pickle.HIGHEST_PROTOCOL)
+
+    def dump(self, item):
+        self.pickler.dump(item)
+        if self.buffer.tell() >= CACHE_BLOCK_SIZE:
+            self.flush()
+
+    def flush(self):
+        data = self.buffer.getvalue()
+        if data:
+            compressed = zlib.compress(data, 1)
+            self.f.write(BLOCK_HEADER.pack(len(compressed)))
+            self.f.write(compressed)
+        self._start_block()
+
+
+def read_blocks(f):
+    """Generate the items from a cache file written by a BlockWriter.
+    """
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError('Not a parse cache file')
+    while True:
+        header = f.read(BLOCK_HEADER.size)
+        if not header:
+            break
+        size, = BLOCK_HEADER.unpack(header)
+        data = zlib.decompress(f.read(size))
+        buffer = cStringIO.StringIO(data)
+        unpickler = pickle.Unpickler(buffer)
+        while buffer.tell() < len(data):
+            yield unpickler.load()
+
+
+def hash_file(filename):
+    "Return the SHA1 hex digest of the contents of the file."
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+class ParseCache(object):
+    """Parse results saved in a directory.
+    """
+
+    def __init__(self, directory, version=vtr.PARSER_VERSION):
+        self.directory = directory
+        self.version = version
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Another worker may have created it first
+            if not os.path.isdir(directory):
+                raise
+
+    def key(self, filename, parser):
+        """Return the cache key for parsing filename with parser.
+        """
+        options = (self.version,
+                   parser.engine,
+                   parser.records,
+                   sorted(parser.keywords or []),
+                   # The source file is part of the output
+                   parser.source,
+                   hash_file(filename),
+                   )
+        return hashlib.sha1(repr(options)).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.vtrcache')
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def parse(self, filename, parser, lines, key=None):
+        """Return the cases from parsing lines, which are read from
+        filename. key is the result of key(), if it is already known.
+
+        If the results are in the cache the errors are passed to the
+        parser's add_error() as they are read, so they are reported the
+        same way as when the file is parsed. Otherwise the parser is
+        used and the results are saved as they are produced.
+        """
+        if key is None:
+            key = self.key(filename, parser)
+        if key in self:
+            log.info('reading %s from the parse cache', filename)
+            return self._read(key, parser)
+        return self._write(key, parser, lines)
+
+    def _read(self, key, parser):
+        with open(self.path(key), 'rb') as f:
+            for kind, value in read_blocks(f):
+                if kind == CASE:
+                    yield value
+                elif kind == ERROR:
+                    parser.add_error(*value)
+
+    def _write(self, key, parser, lines):
+        fd, tmpname = tempfile.mkstemp(dir=self.directory,
+                                       suffix='.tmp')
+        complete = False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                writer = BlockWriter(f)
+                parser.error_recorder = lambda err: writer.dump((ERROR, err))
+                try:
+                    for case in parser.parse(lines):
+                        writer.dump((CASE, case))
+                        yield case
+                finally:
+                    parser.error_recorder = None
+                writer.dump((END, None))
+                writer.flush()
+            # Only keep complete results.
+            os.rename(tmpname, self.path(key))
+            complete = True
+        finally:
+            if not complete:
+                os.unlink(tmpname)
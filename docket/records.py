@@ -0,0 +1,141 @@
+"""Compact records for the cases produced by the VTR parser.
+
+The records use __slots__, so they take much less memory than the
+dicts the parser builds by default. They support the dict methods the
+parser uses to fill them in, and to_document() converts them to the
+dicts stored in the database.
+"""
+
+
+class Record(object):
+    """Base class for records with a fixed set of fields.
+
+    A field that has never been set is missing, like a key that is not
+    in a dict, and it is left out of the document.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        self.update(fields)
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        try:
+            setattr(self, name, value)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __contains__(self, name):
+        return hasattr(self, name)
+
+    def __eq__(self, other):
+        if not isinstance(other, Record):
+            return NotImplemented
+        return self.to_document() == other.to_document()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __getstate__(self):
+        return dict(self.items())
+
+    def __setstate__(self, state):
+        self.update(state)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__,
+                           ', '.join('%s=%r' % i
+                                     for i in sorted(self.items())))
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def setdefault(self, name, default=None):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            self[name] = default
+            return default
+
+    def update(self, fields):
+        for name, value in fields.items():
+            self[name] = value
+
+    def items(self):
+        "Return the (name, value) pairs for the fields that are set."
+        missing = object()
+        return [(name, value)
+                for name, value in ((n, getattr(self, n, missing))
+                                    for n in self.__slots__)
+                if value is not missing
+                ]
+
+    def to_document(self):
+        "Return the record as a dict, converting any nested records."
+        doc = {}
+        for name, value in self.items():
+            if isinstance(value, list):
+                value = [v.to_document() if isinstance(v, Record) else v
+                         for v in value]
+            doc[name] = value
+        return doc
+
+
+class Participant(Record):
+    "A person named in a case."
+    __slots__ = ('role',
+                 'full_name',
+                 'first_name',
+                 'middle_name',
+                 'last_name',
+                 'title',
+                 'alias',
+                 'suffix',
+                 'note',
+                 )
+
+
+class Sentence(Record):
+    "A sentence rendered, served, or for contempt."
+    __slots__ = ('type',
+                 'units',
+                 'amount',
+                 'date',
+                 'note',
+                 )
+
+
+class Case(Record):
+    "A case, with its participants and sentences."
+    __slots__ = ('book',
+                 'page',
+                 'number',
+                 'year',
+                 'arrest_date',
+                 'hearing_date',
+                 'defendant',
+                 'participants',
+                 'vehicle',
+                 'violation',
+                 'violation_note',
+                 'location',
+                 'plea',
+                 'outcome',
+                 'gender',
+                 'race',
+                 'sentence_rendered',
+                 'sentence_served',
+                 'sentence_contempt',
+                 'note',
+                 'lines',
+                 'content_hash',
+                 )
@@ -4,6 +4,7 @@ import datetime
 from .app import app, mongo
 from .filters import date
 from .nav import set_navbar_active
+from ..books import summarize
 
 from flask import render_template, g
 from flask.ext.pymongo import ASCENDING
@@ -39,8 +40,16 @@ def browse_date(year=None, month=None, day=None):
         date_range = unicode(year)
     else:
         # Show the list of years and months
-        books = mongo.db.books.find()
-        years = sorted(set(b['year'] for b in books))
+        # Use the dates of the cases in each book, since they do not
+        # always fall in the year the book is named for.
+        years = set()
+        for b in mongo.db.books.find():
+            years.add(b['year'])
+            summary = summarize(b)
+            if summary['first_date'] and summary['last_date']:
+                years.update(range(summary['first_date'].year,
+                                   summary['last_date'].year + 1))
+        years = sorted(years)
         return render_template('browse_date.html',
                                years=years,
                                )
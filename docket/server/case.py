@@ -1,4 +1,5 @@
 from .app import app, mongo
+from ..source import read_lines
 
 from flask import render_template, request
 from flask.ext.pymongo import ASCENDING
@@ -16,10 +17,19 @@ def case(caseid):
     job = mongo.db.jobs.find_one({'_id': case['load_job_id']})
     app.logger.debug('args: %r', request.args)
     user_debug = bool(request.args.get('debug', False))
+    debug = app.debug or user_debug
+    lines = []
+    if debug:
+        try:
+            lines = read_lines(case.get('lines', []))
+        except (IOError, OSError) as err:
+            app.logger.warning('Could not read lines for %s: %s',
+                               caseid, err)
     return render_template('case.html',
                            case=case,
                            violation=violation,
                            cases_on_page=cases_on_page,
-                           debug=(app.debug or user_debug),
+                           debug=debug,
                            job=job,
+                           lines=lines,
                            )
@@ -3,7 +3,7 @@ import urllib
 from .app import app, mongo, MIN_NAME_LENGTH, MAX_SEARCH_HISTORY
 from .filters import participant_search_url
 from .nav import set_navbar_active
-from ..encodings import ENCODERS
+from ..encodings import make_name_query
 
 from flask import request, session, render_template
 from flask.ext.pymongo import ASCENDING
@@ -35,29 +35,11 @@ class SearchForm(Form):
                            )
 
 
-def make_encoded_expression(field, encoded):
-    encoded = filter(bool, encoded)
-    if len(encoded) == 1:
-        return {field: encoded[0]}
-    return {'$or': [{field: e} for e in encoded]}
-
-
 def make_query_for_encoding(form, encoding):
-    encoder = ENCODERS[encoding]
-    q = {}
-    if form.first_name.data:
-        q.update(make_encoded_expression('first_name',
-                                         encoder(form.first_name.data),
-                                         )
-                 )
-    if form.last_name.data:
-        q.update(make_encoded_expression('last_name',
-                                         encoder(form.last_name.data),
-                                         )
-                 )
-    if q:
-        q['encoding'] = encoding
-    return q
+    return make_name_query(encoding,
+                           first_name=form.first_name.data,
+                           last_name=form.last_name.data,
+                           )
 
 
 @app.route('/search')
@@ -93,7 +75,9 @@ def search():
 
             #session['search_history'] = []  # useful for clearing the history
             search_terms = dict((n, getattr(form, n).data)
-                                for n in q.keys()
+                                for n in ['first_name', 'last_name',
+                                          'encoding']
+                                if getattr(form, n).data
                                 )
             display_terms = {}
             display_terms.update(search_terms)
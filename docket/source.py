@@ -0,0 +1,191 @@
+"""Read VTR input files.
+
+Files compressed with gzip, bzip2, or xz are recognized by their
+first bytes and decompressed as they are read. xz needs the lzma
+module (backports.lzma on Python 2).
+"""
+
+import bz2
+import contextlib
+import gzip
+import mmap
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+
+def open_xz(filename):
+    if lzma is None:
+        raise IOError('Reading %s needs the lzma module' % filename)
+    return lzma.LZMAFile(filename, 'rb')
+
+# The first bytes of each compressed format, and the function to open
+# a file of that format for reading the uncompressed data.
+COMPRESSED_FORMATS = [
+    ('\x1f\x8b', gzip.GzipFile),
+    ('BZh', bz2.BZ2File),
+    ('\xfd7zXZ\x00', open_xz),
+    ]
+
+
+def get_opener(filename):
+    """Return the function to open filename for reading its
+    uncompressed data, or None if the file is not compressed.
+    """
+    with open(filename, 'rb') as f:
+        start = f.read(6)
+    for magic, opener in COMPRESSED_FORMATS:
+        if start.startswith(magic):
+            return opener
+    return None
+
+
+def open_raw(filename):
+    "Open filename for reading its uncompressed bytes."
+    opener = get_opener(filename)
+    if opener is None:
+        return open(filename, 'rb')
+    return opener(filename)
+
+
+def split_lines(text):
+    # splitlines() breaks lines at carriage returns, form feeds, and
+    # the other unicode line boundaries, just like codecs does.
+    return text.splitlines(True)
+
+
+class MappedFile(object):
+    """Read the lines of a text file through a memory map.
+
+    Line boundaries are found in the raw bytes, and only a block of
+    lines at a time is decoded, so memory use does not grow with the
+    size of the file. The lines are split the same way as when
+    iterating over codecs.open(), so the line numbers match. The
+    encoding must be ASCII compatible, like UTF-8.
+    """
+
+    # Bytes to decode at a time
+    block_size = 1024 * 1024
+
+    def __init__(self, filename, encoding='utf-8'):
+        self.filename = filename
+        self.encoding = encoding
+        self._file = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __iter__(self):
+        m = self._map
+        if m is None:
+            return
+        encoding = self.encoding
+        block_size = self.block_size
+        size = m.size()
+        start = 0
+        while start < size:
+            # Decode a block of whole lines at a time. Ending the
+            # block after a newline means a multi-byte character or
+            # a \r\n pair is never split.
+            end = m.rfind('\n', start, start + block_size) + 1
+            if end <= start:
+                end = m.find('\n', start + block_size)
+                end = size if end < 0 else end + 1
+            text = m[start:end].decode(encoding)
+            start = end
+            for line in split_lines(text):
+                yield line
+
+
+class CompressedFile(object):
+    """Read the lines of a compressed text file as it is decompressed.
+
+    The lines are split the same way as by MappedFile, so the line
+    numbers match those of the uncompressed file. opener is one of the
+    functions in COMPRESSED_FORMATS.
+    """
+
+    # Uncompressed bytes to decode at a time
+    block_size = 1024 * 1024
+
+    def __init__(self, filename, opener, encoding='utf-8'):
+        self.filename = filename
+        self.encoding = encoding
+        self._file = opener(filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def __iter__(self):
+        encoding = self.encoding
+        leftover = ''
+        while True:
+            data = self._file.read(self.block_size)
+            if not data:
+                break
+            # Hold back the partial line at the end of the block, so
+            # a multi-byte character or a \r\n pair is never split.
+            data = leftover + data
+            end = data.rfind('\n') + 1
+            leftover = data[end:]
+            for line in split_lines(data[:end].decode(encoding)):
+                yield line
+        if leftover:
+            for line in split_lines(leftover.decode(encoding)):
+                yield line
+
+
+def open_lines(filename, encoding='utf-8'):
+    """Return a MappedFile or CompressedFile for reading the lines of
+    filename, depending on whether it is compressed.
+    """
+    opener = get_opener(filename)
+    if opener is None:
+        return MappedFile(filename, encoding)
+    return CompressedFile(filename, opener, encoding)
+
+
+def read_lines(lines, encoding='utf-8'):
+    """Return the (line number, text) pairs for the lines recorded
+    with a case.
+
+    A Parser with a source records where the lines are in the source
+    file instead of copying them, and they are read back here. The
+    offsets in a compressed file are in the uncompressed data. Lists
+    of copied lines are returned as they are.
+    """
+    if not isinstance(lines, dict):
+        return lines
+    with contextlib.closing(open_raw(lines['source'])) as f:
+        f.seek(lines['start'])
+        data = f.read(lines['end'] - lines['start'])
+    text = data.decode(encoding)
+    return [(num, line.strip())
+            for num, line in enumerate(text.splitlines(), lines['first'])
+            ]
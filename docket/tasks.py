@@ -1,116 +1,828 @@
-import codecs
+import collections
+import datetime
+import functools
+import os
+import time
 
 from celery.task import task
+from celery.utils import uuid
 
-from docket import vtr, encodings
+from docket import vtr, batch, books, encodings, parsecache, source
 
 
 @task
-def parse_file(filename, db_factory, load_job_id, error_handler):
+def parse_file(filename, db_factory, load_job_id, error_handler,
+               engine='pyparsing', trace=False,
+               line_ranges=False, max_errors=None, cache_dir=None,
+               batch_size=batch.BATCH_SIZE,
+               write_queue_size=batch.WRITE_QUEUE_SIZE):
     """Parse the named VTR file and load the data into the database.
+
+    To spread a large file across the workers, see start_chunks().
+
+    If trace is set, the parser counts and times the lines of each
+    type, and the results include the 'parse_stats'.
+
+    If line_ranges is set, the cases refer to the range of lines in
+    the file instead of holding copies of them (see
+    source.read_lines()).
+
+    Parse errors are passed to the error_handler as they are found,
+    with the line number as the line argument. If max_errors is set,
+    only that many are reported, and the rest are counted. The results
+    only include the errors that stopped the file from being read, and
+    the counts. If the error_handler has a flush() method, it is
+    called at the end (see db.ErrorHandler).
+
+    Cases already loaded from the file with the same content hash are
+    not written again (unless they have moved), and cases that are no
+    longer in the file are deleted. The 'case_counts' in the results
+    and the job record say how many cases were added, changed,
+    unchanged, moved, and removed.
+
+    If cache_dir is set, the parsed cases are saved there, and they are
+    read back instead of parsing the file again if its contents have not
+    changed (see parsecache.ParseCache).
+
+    Compressed files are decompressed as they are parsed (see
+    source.open_lines()).
+
+    The cases and participants are written batch_size at a time (see
+    CaseLoader). The books are written once, at the end, with the
+    number of cases and the range of pages and dates in each (see
+    books.update_books()). The statistics are also in the 'books' in
+    the results.
+
+    The batches are written by a separate thread while the file is
+    parsed, with up to write_queue_size of them waiting (see
+    batch.WriteQueue). The 'stage_times' in the results say how long
+    the parsing and writing were busy and waiting for each other. If
+    write_queue_size is 0, the batches are written between parsing.
+
+    The job record is marked 'running' when the task starts. At the
+    end it gets the status ('done', or 'failed' if the file could not
+    be read or loaded), the counts, the number of bytes read, and the time spent
+    parsing, encoding, and writing (see job_record()).
     """
     db = db_factory()
     log = parse_file.get_logger()
     log.info('loading from %s', filename)
+    date_cache_start = vtr.DATE_CACHE.stats()
+    parse_stats = None
+    line_source = filename if line_ranges else None
+    errors = []
+    num_errors = dropped_errors = 0
+    cached = False
+    loader = CaseLoader(db, filename, load_job_id, error_handler,
+                        batch_size=batch_size,
+                        write_queue_size=write_queue_size)
+    case_counts = loader.case_counts
+    error_sink = functools.partial(report_parse_error,
+                                   error_handler, filename)
+    status = 'done'
+    bytes_read = None
+    set_job_status(db, load_job_id, 'running')
+
     try:
-        num_cases = 0
-        with codecs.open(filename, 'r', encoding='utf-8') as f:
-            parser = vtr.Parser()
-            for case in parser.parse(f):
-                log.info('New case: %s/%s', case['book'], case['number'])
-                num_cases += 1
-
-                # Store the book
-                try:
-                    db.books.update({'_id': case['book']},
-                                    {'$set': {'year': int(case['book'].split('/')[0]),
-                                              'number': case['book'].split('/')[1],
-                                              },
-                                     '$addToSet': {'load_jobs': load_job_id,
-                                                   },
-                                     },
-                                    upsert=True,
-                                    )
-                except Exception as err:
-                    log.error('Could not store book %s: %s', case['book'], err)
-                    error_handler(unicode(err))
-
-                # Store the case
-                case['_id'] = '%s/%s' % (case['book'], case['number'])
-                # associate the case record with the job for auditing
-                case['load_job_id'] = load_job_id
-                # pick a "date" for the case
-                case['date'] = case.get('hearing_date') or case.get('arrest_date')
-                try:
-                    db.cases.update({'_id': case['_id']},
-                                    case,
-                                    upsert=True,
-                                    )
-                except Exception as err:
-                    log.error('Could not store case %s: %s', case['_id'], err)
-                    error_handler(unicode(err))
-
-                # Add participant info
-
-                # index for upsert
-                for p in get_encoded_participants(case, error_handler):
-                    #log.info('new participant: %r', p)
-                    p['case_id'] = case['_id']
-                    p['case_number'] = case['number']
-                    p['date'] = case['date']
-                    try:
-                        db.participants.update(
-                            {'case': case['_id'],
-                             'encoding': p['encoding'],
-                             'full_name': p['full_name'],
-                             'role': p['role'],
-                             },
-                            p,
-                            upsert=True,
-                            )
-                    except Exception as err:
-                        log.error('Could not store participant %s for case %s: %s',
-                                  p['_id'], case['_id'], err)
-                        error_handler(unicode(err))
-
-            # Handle errors that did not result in new case records.
-            errors = ['Parse error at %s:%s "%s" (%s)' % \
-                          (filename, num, line, err)
-                      for num, line, err in parser.errors
-                      ]
-            for e in errors:
-                error_handler(e)
-    except (OSError, IOError) as err:
-        msg = unicode(err)
-        errors = [msg]
+        # The cases loaded from this file before, and their content
+        # hashes, to find the ones that changed.
+        loader.find_stored()
+        with source.open_lines(filename) as f:
+            parser = vtr.Parser(engine=engine, trace=trace,
+                                source=line_source,
+                                error_sink=error_sink,
+                                max_errors=max_errors,
+                                )
+            if cache_dir:
+                cache = parsecache.ParseCache(cache_dir)
+                key = cache.key(filename, parser)
+                cached = key in cache
+                cases = cache.parse(filename, parser, f, key)
+            else:
+                cases = parser.parse(f)
+            loader.load(cases)
+            bytes_read = os.path.getsize(filename)
+
+            try:
+                books.update_books(db, loader.book_stats, filename,
+                                   load_job_id)
+            except Exception as err:
+                log.error('Could not store books: %s', err)
+                error_handler(unicode(err))
+
+            # Whatever is left was not in the file this time.
+            case_counts['removed'] = remove_cases(
+                db, sorted(loader.stored_hashes), error_handler)
+
+            num_errors = parser.error_count
+            dropped_errors = parser.dropped_errors
+            if dropped_errors:
+                msg = '%d more parse errors were not reported' % \
+                    dropped_errors
+                errors.append(msg)
+                error_handler(msg)
+            if parser.stats is not None:
+                parse_stats = parser.stats.as_dict()
+                for line in parser.stats.report():
+                    log.info('%s', line)
+    except Exception as err:
+        if isinstance(err, (OSError, IOError, EOFError)):
+            msg = unicode(err)
+        else:
+            log.exception('Could not load %s', filename)
+            msg = 'Could not load %s: %s' % (filename, err)
+        errors.append(msg)
         error_handler(msg)
-    return {'errors': errors,
-            'num_cases': num_cases,
-            }
+        status = 'failed'
+    try:
+        # The date cache lives as long as the worker process, so
+        # report only the lookups made while loading this file.
+        date_cache = vtr.DATE_CACHE.stats()
+        date_cache['hits'] -= date_cache_start['hits']
+        date_cache['misses'] -= date_cache_start['misses']
+        log.info('date cache: %(hits)d hits, %(misses)d misses', date_cache)
+        log.info('cases: %(added)d added, %(changed)d changed, '
+                 '%(unchanged)d unchanged, %(moved)d moved, '
+                 '%(removed)d removed', case_counts)
+        results = {'status': status,
+                   'errors': errors,
+                   'num_errors': num_errors,
+                   'dropped_errors': dropped_errors,
+                   'num_cases': loader.num_cases,
+                   'num_written': loader.num_written,
+                   'bytes_read': bytes_read,
+                   'times': loader.times(),
+                   'cached': cached,
+                   'case_counts': case_counts,
+                   'books': dict(loader.book_stats.books),
+                   'date_cache': date_cache,
+                   'parse_stats': parse_stats,
+                   'stage_times': loader.stage_times,
+                   }
+        log.info('times: %(parse).2fs parsing, %(encode).2fs encoding, '
+                 '%(write).2fs writing', results['times'])
+        try:
+            db.jobs.update({'_id': load_job_id},
+                           {'$set': job_record(results)},
+                           )
+        except Exception as err:
+            log.error('Could not update job %s: %s', load_job_id, err)
+            error_handler(unicode(err))
+    finally:
+        flush_errors(error_handler, load_job_id)
+    return results
+
+
+# The results of a load that are saved in its job record. The error
+# messages are in the errors collection.
+JOB_RESULTS = ['status', 'num_errors', 'dropped_errors',
+               'num_cases', 'num_written', 'bytes_read', 'times',
+               'case_counts', 'stage_times',
+               ]
+
+
+def job_record(results):
+    """Return the values to set in the job record at the end of a load
+    from its results.
+    """
+    record = dict((name, results.get(name)) for name in JOB_RESULTS)
+    record['end'] = datetime.datetime.utcnow()
+    return record
+
+
+def set_job_status(db, load_job_id, status):
+    "Record that a job has moved on to status."
+    try:
+        db.jobs.update({'_id': load_job_id}, {'$set': {'status': status}})
+    except Exception as err:
+        parse_file.get_logger().error('Could not update job %s: %s',
+                                      load_job_id, err)
+
+
+def start_chunks(filename, db_factory, load_job_id, error_handler,
+                 chunk_size=vtr.CHUNK_SIZE, engine='pyparsing',
+                 line_ranges=False, max_errors=None,
+                 batch_size=batch.BATCH_SIZE,
+                 write_queue_size=batch.WRITE_QUEUE_SIZE):
+    """Split the named VTR file into chunks of about chunk_size lines
+    at book and page lines (see vtr.split_chunks()), and start a
+    load_chunk task for each one, so a large file is loaded by as many
+    workers as there are.
+
+    Each chunk task saves its results in the chunks collection and
+    counts itself done in the job record, and the last one to finish
+    starts finish_chunks to merge them. The AsyncResult for that task
+    is returned, and its result is the same as the one from
+    parse_file().
+
+    The file is read here, so call this where the file is, such as in
+    the program starting the job. max_errors applies to each chunk.
+    """
+    db = db_factory()
+    bytes_read = os.path.getsize(filename)
+    line_source = filename if line_ranges else None
+    callback_id = uuid()
+    num_chunks = 0
+    with source.open_lines(filename) as f:
+        for chunk in vtr.split_chunks(f, chunk_size,
+                                      engine=engine,
+                                      source=line_source,
+                                      ):
+            load_chunk.delay(chunk,
+                             filename=filename,
+                             db_factory=db_factory,
+                             load_job_id=load_job_id,
+                             error_handler=error_handler,
+                             callback_id=callback_id,
+                             max_errors=max_errors,
+                             batch_size=batch_size,
+                             write_queue_size=write_queue_size,
+                             )
+            num_chunks += 1
+    # The chunks may all be done already, so the number of them is
+    # set the same way they count themselves as done.
+    job = db.jobs.find_and_modify({'_id': load_job_id},
+                                  {'$set': {'num_chunks': num_chunks,
+                                            'bytes_read': bytes_read,
+                                            'status': 'running',
+                                            },
+                                   },
+                                  new=True,
+                                  )
+    _finish_if_done(job, callback_id, filename, db_factory, load_job_id,
+                    error_handler)
+    return finish_chunks.AsyncResult(callback_id)
+
+
+def _finish_if_done(job, callback_id, filename, db_factory, load_job_id,
+                    error_handler):
+    # The last update of the job to see all of the chunks done starts
+    # the callback. The updates are atomic, so only one of them does.
+    if job.get('num_chunks') is None:
+        return
+    if job.get('chunks_done', 0) < job['num_chunks']:
+        return
+    finish_chunks.apply_async(
+        (),
+        {'filename': filename,
+         'db_factory': db_factory,
+         'load_job_id': load_job_id,
+         'error_handler': error_handler,
+         },
+        task_id=callback_id,
+        )
+
+
+@task
+def load_chunk(chunk, filename, db_factory, load_job_id, error_handler,
+               callback_id, max_errors=None, batch_size=batch.BATCH_SIZE,
+               write_queue_size=batch.WRITE_QUEUE_SIZE):
+    """Parse one chunk of a VTR file and load its cases into the
+    database, then save the results in the chunks collection. See
+    start_chunks().
+
+    The cases found are stamped with the job id (see
+    CaseLoader.mark_unchanged()), so finish_chunks can find the ones
+    that are no longer in the file. The chunk is counted as done even
+    if it fails, so the job is always finished.
+    """
+    log = load_chunk.get_logger()
+    log.info('loading lines %s-%s of %s', chunk.start, chunk.end or 'end',
+             filename)
+    errors = []
+    result = {'job_id': load_job_id,
+              'start': chunk.start,
+              'errors': errors,
+              }
+    loader = collector = None
+    try:
+        db = db_factory()
+        loader = CaseLoader(db, filename, load_job_id, error_handler,
+                            batch_size=batch_size,
+                            write_queue_size=write_queue_size)
+        collector = vtr.ErrorCollector(
+            functools.partial(report_parse_error, error_handler, filename),
+            max_errors,
+            )
+        start = time.time()
+        cases, parse_errors = vtr.parse_chunk(chunk)
+        loader.parse_time += time.time() - start
+        for err in parse_errors:
+            collector.add_error(*err)
+        loader.find_stored([get_case_id(c) for c in cases])
+        loader.load(cases)
+        loader.mark_unchanged()
+    except Exception as err:
+        msg = 'Could not load lines %s-%s of %s: %s' % \
+            (chunk.start, chunk.end or 'end', filename, err)
+        log.error('%s', msg)
+        errors.append(msg)
+        error_handler(msg)
+    if collector is not None:
+        result['num_errors'] = collector.error_count
+        result['dropped_errors'] = collector.dropped_errors
+    if loader is not None:
+        result.update({'num_cases': loader.num_cases,
+                       'num_found': len(loader.seen_cases),
+                       'num_written': loader.num_written,
+                       'times': loader.times(),
+                       'case_counts': loader.case_counts,
+                       # A list keeps the books in order.
+                       'books': loader.book_stats.books.items(),
+                       })
+    flush_errors(error_handler, load_job_id)
+    try:
+        db = db_factory()
+        # finish_chunks notices the results that are missing.
+        try:
+            db.chunks.insert(result, safe=True)
+        except Exception as err:
+            log.error('Could not save the results of lines %s-%s of %s: %s',
+                      chunk.start, chunk.end or 'end', filename, err)
+        job = db.jobs.find_and_modify({'_id': load_job_id},
+                                      {'$inc': {'chunks_done': 1}},
+                                      new=True,
+                                      )
+        _finish_if_done(job, callback_id, filename, db_factory, load_job_id,
+                        error_handler)
+    except Exception as err:
+        log.error('Could not record lines %s-%s of %s for job %s: %s',
+                  chunk.start, chunk.end or 'end', filename, load_job_id,
+                  err)
+    return result
+
+
+def merge_chunk_results(results):
+    """Combine the results of the load_chunk tasks for a file.
+
+    A chunk that failed before it could count anything only has its
+    errors.
+    """
+    merged = {'errors': [],
+              'num_errors': 0,
+              'dropped_errors': 0,
+              'num_cases': 0,
+              'num_found': 0,
+              'num_written': 0,
+              'times': {'parse': 0.0, 'encode': 0.0, 'write': 0.0},
+              'cached': False,
+              'case_counts': {'added': 0, 'changed': 0, 'unchanged': 0,
+                              'moved': 0, 'removed': 0},
+              'date_cache': None,
+              'parse_stats': None,
+              'stage_times': None,
+              }
+    book_stats = books.BookStats()
+    for result in sorted(results, key=lambda r: r['start']):
+        merged['errors'].extend(result['errors'])
+        for name in ['num_errors', 'dropped_errors', 'num_cases',
+                     'num_found', 'num_written']:
+            merged[name] += result.get(name, 0)
+        for name, seconds in result.get('times', {}).items():
+            merged['times'][name] += seconds
+        for name, count in result.get('case_counts', {}).items():
+            merged['case_counts'][name] += count
+        for book, stats in result.get('books', []):
+            book_stats.merge(book, stats)
+    merged['books'] = book_stats
+    return merged
+
+
+@task
+def finish_chunks(filename, db_factory, load_job_id, error_handler):
+    """Merge the results of the load_chunk tasks for a file, remove
+    the cases that are no longer in it, and write the books and the
+    merged results to the job record. See start_chunks().
+
+    The job is 'failed' if any of the chunks could not be loaded, and
+    then no cases are removed, or if the results could not be merged.
+    The times are the totals for all of the chunks.
+    """
+    db = db_factory()
+    log = finish_chunks.get_logger()
+    results = merge_chunk_results([])
+    results['books'] = {}
+    results['bytes_read'] = None
+    try:
+        job = db.jobs.find_one({'_id': load_job_id})
+        chunk_results = list(db.chunks.find({'job_id': load_job_id}))
+        log.info('merging %d chunks of %s', len(chunk_results), filename)
+        results = merge_chunk_results(chunk_results)
+        book_stats = results['books']
+        results['books'] = dict(book_stats.books)
+        results['bytes_read'] = job.get('bytes_read')
+        missing = job['num_chunks'] - len(chunk_results)
+        if missing:
+            msg = 'The results of %d chunks of %s are missing' % (
+                missing, filename)
+            results['errors'].append(msg)
+            error_handler(msg)
+        results['status'] = 'failed' if results['errors'] else 'done'
+        # Each chunk stamped the cases it found with the job id.
+        seen = {'filename': filename, 'last_load_job_id': load_job_id}
+        num_stamped = db.cases.find(seen).count()
+        # Each chunk wrote its own copy, so there is no telling which
+        # one was kept.
+        if results['num_found'] > num_stamped:
+            msg = '%d cases are in %s more than once' % (
+                results['num_found'] - num_stamped, filename)
+            log.error('%s', msg)
+            error_handler(msg)
+        try:
+            books.update_books(db, book_stats, filename, load_job_id)
+        except Exception as err:
+            log.error('Could not store books: %s', err)
+            error_handler(unicode(err))
+        # The cases of a chunk that failed were not all seen, so they
+        # cannot be told apart from the ones that are gone.
+        if results['status'] == 'done':
+            removed = sorted(
+                c['_id']
+                for c in db.cases.find(
+                    {'filename': filename,
+                     'last_load_job_id': {'$ne': load_job_id},
+                     },
+                    fields=[])
+                )
+            results['case_counts']['removed'] = remove_cases(
+                db, removed, error_handler)
+        if results['dropped_errors']:
+            msg = '%d more parse errors were not reported' % \
+                results['dropped_errors']
+            results['errors'].append(msg)
+            error_handler(msg)
+    except Exception as err:
+        log.exception('Could not finish loading %s', filename)
+        msg = 'Could not finish loading %s: %s' % (filename, err)
+        results['errors'].append(msg)
+        error_handler(msg)
+        results['status'] = 'failed'
+    try:
+        log.info('cases: %(added)d added, %(changed)d changed, '
+                 '%(unchanged)d unchanged, %(moved)d moved, '
+                 '%(removed)d removed', results['case_counts'])
+        try:
+            db.jobs.update({'_id': load_job_id},
+                           {'$set': job_record(results)},
+                           )
+            db.chunks.remove({'job_id': load_job_id})
+        except Exception as err:
+            log.error('Could not update job %s: %s', load_job_id, err)
+            error_handler(unicode(err))
+    finally:
+        flush_errors(error_handler, load_job_id)
+    return results
+
+
+class CaseLoader(object):
+    """Writes parsed cases and their participants to the database.
+
+    Cases already loaded from the file with the same content hash and
+    position (see find_stored()) are skipped, and the rest are written
+    batch_size at a time (see batch.BatchWriter). A case with the same
+    text that has moved in the file is 'moved': the case is written
+    again so its lines are right, but its participants are not. The
+    ids of the stored cases that are found are removed from
+    stored_hashes, so the ones left at the end were not found. Only
+    the first copy of a case is written.
+
+    The cases written are stamped with the job id in last_load_job_id.
+    mark_unchanged() stamps the rest.
+
+    The number of cases, the case_counts, and the statistics for the
+    books (see books.BookStats) are collected along the way.
+
+    If write_queue_size is set, the batches are written by a separate
+    thread (see batch.WriteQueue) while load() runs, and flush() waits
+    for it and sets stage_times. The thread is only started by load(),
+    so nothing is left running if the loader is never used.
+
+    The time spent parsing, encoding names, and writing is added up
+    (see times()). With the write thread, writing overlaps the others.
+    """
+
+    def __init__(self, db, filename, load_job_id, error_handler,
+                 batch_size=batch.BATCH_SIZE, write_queue_size=0):
+        self.db = db
+        self.filename = filename
+        self.load_job_id = load_job_id
+        self.error_handler = error_handler
+        self.batch_size = batch_size
+        self.stored_hashes = {}
+        self.stored_positions = {}
+        self.seen_cases = set()
+        self.unchanged_cases = []
+        self.num_cases = 0
+        self.case_counts = {'added': 0, 'changed': 0, 'unchanged': 0,
+                            'moved': 0, 'removed': 0}
+        self.book_stats = books.BookStats()
+        self.log = parse_file.get_logger()
+        self.stage_times = None
+        self.parse_time = 0.0
+        self.encode_time = 0.0
+        self.write_queue_size = write_queue_size
+        self.write_queue = None
+        self.case_writer = batch.BatchWriter(
+            db.cases,
+            replace_field='_id',
+            batch_size=batch_size,
+            error_handler=error_handler,
+            describe=lambda c: 'case %s' % c['_id'],
+            )
+        self.participant_writer = batch.BatchWriter(
+            db.participants,
+            replace_field='case',
+            batch_size=batch_size,
+            error_handler=error_handler,
+            describe=lambda p: 'participant %s for case %s' % (
+                p['full_name'], p['case']),
+            )
+
+    def find_stored(self, case_ids=None):
+        """Look up the content hashes and positions of the cases
+        already loaded from the file, all of them or only the ones in
+        case_ids.
+        """
+        query = {'filename': self.filename}
+        if case_ids is not None:
+            query['_id'] = {'$in': case_ids}
+        for c in self.db.cases.find(query,
+                                    fields=['content_hash', 'position']):
+            self.stored_hashes[c['_id']] = c.get('content_hash')
+            self.stored_positions[c['_id']] = c.get('position')
+
+    def load(self, cases):
+        """Add the cases, and flush. The time spent waiting for each
+        case is counted as parsing.
+        """
+        if self.write_queue_size:
+            self.write_queue = batch.WriteQueue(self.write_queue_size)
+            self.case_writer.write_queue = self.write_queue
+            self.participant_writer.write_queue = self.write_queue
+        try:
+            start = time.time()
+            for case in cases:
+                self.parse_time += time.time() - start
+                self.add(case)
+                start = time.time()
+            self.parse_time += time.time() - start
+        finally:
+            self.flush()
+
+    def add(self, case):
+        "Count a case and queue it to be written if it changed."
+        log = self.log
+        log.info('New case: %s/%s', case['book'], case['number'])
+        self.num_cases += 1
+
+        case['_id'] = get_case_id(case)
+        # A second copy would stop the batch it is written in.
+        if case['_id'] in self.seen_cases:
+            msg = 'Case %s is in %s more than once, ' \
+                'keeping the first one' % (case['_id'], self.filename)
+            log.error('%s', msg)
+            self.error_handler(msg)
+            return
+        self.seen_cases.add(case['_id'])
+        # pick a "date" for the case
+        case['date'] = case.get('hearing_date') or case.get('arrest_date')
+        case['position'] = get_case_position(case)
+        self.book_stats.add(case)
+
+        # associate the case record with the job for auditing
+        case['load_job_id'] = self.load_job_id
+        case['last_load_job_id'] = self.load_job_id
+        case['filename'] = self.filename
+
+        if case['_id'] in self.stored_hashes:
+            stored_hash = self.stored_hashes.pop(case['_id'])
+            if stored_hash == case['content_hash']:
+                stored_position = self.stored_positions.pop(case['_id'])
+                if stored_position == case['position']:
+                    self.case_counts['unchanged'] += 1
+                    self.unchanged_cases.append(case['_id'])
+                    return
+                # The lines stored with the case point to the wrong
+                # part of the file, but the participants are right.
+                self.case_counts['moved'] += 1
+                self.case_writer.add(case)
+                return
+            self.case_counts['changed'] += 1
+            # The old participants are removed even if the case has
+            # none now.
+            self.participant_writer.replace(case['_id'])
+        else:
+            self.case_counts['added'] += 1
+
+        # Store the case
+        self.case_writer.add(case)
+
+        # Add participant info. The old participants of the case are
+        # replaced. A person listed twice in the same role is only
+        # stored once, and the last listing wins, as it did when each
+        # one was upserted.
+        start = time.time()
+        participants = collections.OrderedDict()
+        for p in get_encoded_participants(case, self.error_handler):
+            #log.info('new participant: %r', p)
+            p['case_id'] = case['_id']
+            p['case_number'] = case['number']
+            p['date'] = case['date']
+            participants[p['full_name'], p['role']] = p
+        self.encode_time += time.time() - start
+        for p in participants.values():
+            self.participant_writer.add(p)
+
+    def flush(self):
+        "Write the queued cases and participants."
+        self.case_writer.flush()
+        self.participant_writer.flush()
+        if self.write_queue is not None:
+            # Anything written after this goes straight to the
+            # database.
+            queue, self.write_queue = self.write_queue, None
+            self.case_writer.write_queue = None
+            self.participant_writer.write_queue = None
+            queue.put(self._finish_writes)
+            queue.close()
+            self.stage_times = queue.stats()
+            self.log.info('parse stage %(parse_busy).2fs busy, '
+                          '%(parse_wait).2fs waiting; '
+                          'write stage %(write_busy).2fs busy, '
+                          '%(write_wait).2fs waiting',
+                          self.stage_times)
+        self.log.info('wrote %d cases in %d batches, '
+                      '%d participants in %d batches',
+                      self.case_writer.num_written,
+                      self.case_writer.num_batches,
+                      self.participant_writer.num_written,
+                      self.participant_writer.num_batches)
+
+    def mark_unchanged(self):
+        """Stamp the unchanged cases with the job id in
+        last_load_job_id, as the ones written are, batch_size at a
+        time.
+        """
+        ids = self.unchanged_cases
+        for i in range(0, len(ids), self.batch_size):
+            self.db.cases.update(
+                {'_id': {'$in': ids[i:i + self.batch_size]}},
+                {'$set': {'last_load_job_id': self.load_job_id}},
+                multi=True,
+                safe=True,
+                )
+
+    @property
+    def num_written(self):
+        "The number of cases and participants written."
+        return (self.case_writer.num_written +
+                self.participant_writer.num_written)
+
+    def times(self):
+        "Return the seconds spent parsing, encoding, and writing."
+        return {'parse': self.parse_time,
+                'encode': self.encode_time,
+                'write': (self.case_writer.write_time +
+                          self.participant_writer.write_time),
+                }
+
+    def _finish_writes(self):
+        # The write thread has its own socket. Wait for the writes sent
+        # on it to be done before going on, and give it back to the
+        # pool.
+        self.db.command('getlasterror')
+        self.db.connection.end_request()
+
+
+def get_case_id(case):
+    "Return the database id for a case."
+    return '%s/%s' % (case['book'], case['number'])
+
+
+def remove_cases(db, case_ids, error_handler):
+    """Remove the cases and their participants, and return the number
+    removed.
+    """
+    if not case_ids:
+        return 0
+    log = parse_file.get_logger()
+    log.info('removing %d cases', len(case_ids))
+    try:
+        db.cases.remove({'_id': {'$in': case_ids}})
+        db.participants.remove({'case': {'$in': case_ids}})
+    except Exception as err:
+        log.error('Could not remove cases: %s', err)
+        error_handler(unicode(err))
+        return 0
+    return len(case_ids)
+
+
+def report_parse_error(error_handler, filename, error):
+    "Pass a parse error from a Parser to the error_handler."
+    num, line, message = error
+    # The line number is left out of the message so the same error on
+    # different lines is recorded once.
+    error_handler('Parse error in %s "%s" (%s)' % (filename, line, message),
+                  line=num)
+
+
+def flush_errors(error_handler, load_job_id):
+    "Write the errors saved up by the error_handler, if it does that."
+    flush = getattr(error_handler, 'flush', None)
+    if flush is None:
+        return
+    try:
+        flush()
+    except Exception as err:
+        parse_file.get_logger().error(
+            'Could not store the errors for job %s: %s', load_job_id, err)
 
 
 FIELDS_TO_ENCODE = ['first_name', 'middle_name', 'last_name']
 
 
+def get_first_line(case):
+    """Return the number of the first line of the case in its file,
+    or None if it is not known.
+    """
+    lines = case.get('lines')
+    if not lines:
+        return None
+    if isinstance(lines, dict):
+        return lines['first']
+    return lines[0][0]
+
+
+def get_case_position(case):
+    """Return where a case is in its file, as the number of its first
+    line and the byte offset of the line if the lines are kept as a
+    range.
+    """
+    lines = case.get('lines')
+    if isinstance(lines, dict):
+        return [lines['first'], lines['start']]
+    return [get_first_line(case), None]
+
+
 def get_encoded_participants(case, error_handler):
     """Return participant documents with encoded names.
+
+    Each document has the names as they were parsed, and the encoded
+    names under encoded.<encoder name>.<field> for each of the
+    encodings.ENCODERS.
+
+    Errors are reported with the number of the first line of the case.
     """
     log = parse_file.get_logger()
+    line = get_first_line(case)
     for participant in case['participants']:
+        result = {'case': case['_id'],
+                  'encoded': {},
+                  }
+        result.update(participant)
         for encoder_name, encoder in encodings.ENCODERS.items():
-            result = {'encoding': encoder_name,
-                      'case': case['_id'],
-                      }
-            result.update(participant)
+            encoded = result['encoded'][encoder_name] = {}
             for field in FIELDS_TO_ENCODE:
                 try:
                     orig = participant[field]
-                    encoded = encoder(orig) if orig else ['']
-                    result[field] = encoded
+                    encoded[field] = encoder(orig) if orig else ['']
                 except Exception as err:
-                    msg = 'Error encoding %s to %s for %s/%s "%s" (%s)' % \
-                        (field, encoder_name, case['book'], case['number'],
-                         participant[field], err)
-                    log.error(msg)
-                    error_handler(msg)
-            yield result
+                    msg = 'Error encoding %s to %s "%s" (%s)' % \
+                        (field, encoder_name, participant[field], err)
+                    log.error('%s for %s/%s', msg,
+                              case['book'], case['number'])
+                    error_handler(msg, line=line)
+        yield result
+
+
+def upgrade_participants(docs):
+    """Convert the participant documents for one case from the old
+    layout, with a separate document for each encoding, to the layout
+    made by get_encoded_participants(). Documents that are already
+    converted are returned as they are.
+    """
+    merged = collections.OrderedDict()
+    for doc in docs:
+        if 'encoding' not in doc:
+            yield doc
+            continue
+        doc = dict(doc)
+        del doc['_id']
+        encoding = doc.pop('encoding')
+        # The upserts kept one document per person, role, and encoding.
+        key = (doc['full_name'], doc['role'])
+        participant = merged.setdefault(key, {'encoded': {}})
+        encoded = participant['encoded'][encoding] = {}
+        for field in FIELDS_TO_ENCODE:
+            value = doc.pop(field, None)
+            # A name that could not be encoded was stored as it was.
+            if isinstance(value, list):
+                encoded[field] = value
+            if encoding == 'exact':
+                participant[field] = value[0] if isinstance(value, list) \
+                    else value
+        participant.update(doc)
+    for participant in merged.values():
+        for field in FIELDS_TO_ENCODE:
+            participant.setdefault(field, '')
+        yield participant
@@ -8,23 +8,38 @@
 from pyparsing import *
 
 # Import system modules
+import collections
 import datetime
 import fileinput
+import hashlib
+import heapq
 import logging
+import re
+import threading
 import time
+import timeit
 
 # Import local modules
+from docket.records import Case, Participant, Sentence
 
 
 # Module
 
 log = logging.getLogger(__name__)
 
+# Change this when the parser produces different output for the same
+# input, so saved results are not reused (see docket.parsecache).
+PARSER_VERSION = 3
+
 
 def show_parse_action(f):
     """Decorator to show what is going on in a parse action.
+
+    Nothing is formatted unless debug logging is enabled.
     """
     def action(*args):
+        if not log.isEnabledFor(logging.DEBUG):
+            return f(*args)
         if len(args) >= 3:
             s, loc, toks = args[-3:]
             log.debug('%s(s=%r, loc=%s, toks=%s)',
@@ -38,19 +53,63 @@ def show_parse_action(f):
     return action
 
 
+class DateCache(object):
+    """Remembers the dates converted from day, month, and year tokens.
+
+    The same hearing dates show up over and over in a book, so this
+    saves calling strptime() for each one. The cache is emptied when
+    it reaches max_size entries.
+    """
+
+    def __init__(self, max_size=2048):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._dates = {}
+
+    def convert(self, day, month, year):
+        "Return the datetime for the date tokens."
+        key = (day, month, year)
+        try:
+            date = self._dates[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return date
+        self.misses += 1
+        date_string = ' '.join(key)
+        for bad, good in [('Sept', 'Sep'), ('July', 'Jul')]:
+            date_string = date_string.replace(bad, good)
+        parsed_time = time.strptime(date_string, '%d %b %Y')
+        date = datetime.datetime(*parsed_time[:3])
+        if len(self._dates) >= self.max_size:
+            self._dates.clear()
+        self._dates[key] = date
+        return date
+
+    def clear(self):
+        "Forget the cached dates and reset the counters."
+        self._dates.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        "Return the hit and miss counters as a dict."
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._dates),
+                }
+
+DATE_CACHE = DateCache()
+
 # day month year
 DATE = Word(nums) + Word(alphas) + Word(nums)
 
 
 @show_parse_action
 def parse_date(s, loc, toks):
-    date_string = ' '.join(toks)
-    log.debug('parsing date string %r', date_string)
-    for bad, good in [('Sept', 'Sep'), ('July', 'Jul')]:
-        date_string = date_string.replace(bad, good)
-    parsed_time = time.strptime(date_string, '%d %b %Y')
-    date = datetime.datetime(*parsed_time[:3])
-    return date
+    return DATE_CACHE.convert(*toks)
 DATE.setParseAction(parse_date)
 DATE.setName('date')
 
@@ -185,124 +244,693 @@ WITNESS = (mk_keyword('w')
            ).setName('witness')
 
 
-class Parser(object):
+# The keyword at the start of each line of a case record, and the
+# grammar and Parser method used to process the rest of the line. The
+# order matches the order alternatives are tried in when the keyword
+# is not recognized, so error messages come out the same either way.
+FIELDS = [
+    ('b', BOOK, 'feed_book'),
+    ('pg', PAGE, 'feed_page'),
+    ('c', CASE, 'feed_case'),
+    ('ad', ARREST_DATE, 'feed_ad'),
+    ('hd', HEARING_DATE, 'feed_hd'),
+    ('d', DEFENDANT, 'feed_d'),
+    ('dv', DEFENDANT_VEHICLE, 'feed_dv'),
+    ('v', VIOLATION, 'feed_v'),
+    ('l', LOCATION, 'feed_l'),
+    ('ao', ARRESTING_OFFICER, 'feed_ao'),
+    ('w', WITNESS, 'feed_w'),
+    ('dw', DEFENSE_WITNESS, 'feed_dw'),
+    ('p', PLEA, 'feed_p'),
+    ('sr', SENTENCE_RENDERED, 'feed_sr'),
+    ('ss', SENTENCE_SERVED, 'feed_ss'),
+    ('sc', SENTENCE_CONTEMPT, 'feed_sc'),
+    ('n', CASE_NOTE, 'feed_n'),
+    ('o', OUTCOME, 'feed_o'),
+    ('g', GENDER, 'feed_g'),
+    ('r', RACE, 'feed_r'),
+    ('op', OTHER_PERSON, 'feed_op'),
+    ]
+
+# Encoding of VTR files, used to find the byte offsets of lines
+ENCODING = 'utf-8'
+
+# The keywords always parsed in skim mode, to follow the cases
+SKIM_KEYWORDS = frozenset(['b', 'pg', 'c'])
+
+# Matches the leading keyword of a line the same way the
+# CaselessKeyword instances created by mk_keyword() do.
+KEYWORD = re.compile('[%s]*' % re.escape(Keyword.DEFAULT_KEYWORD_CHARS))
+
+FIELD_GRAMMARS = dict((keyword, grammar)
+                      for keyword, grammar, action in FIELDS)
+FIELD_ACTIONS = dict((keyword, action)
+                     for keyword, grammar, action in FIELDS)
+
+# Lines are dispatched on their keyword to a single field grammar. The
+# combined grammar is only used for lines with an unknown keyword, to
+# produce the error message.
+CASE_RECORD = MatchFirst([grammar for keyword, grammar, action in FIELDS])
+
+# The grammar elements are shared by all parsers, but pyparsing reuses
+# its exception objects, so only one thread at a time can use them.
+GRAMMAR_LOCK = threading.Lock()
+
+
+class Tokens(dict):
+    """Named and positional tokens from a parsing engine, standing in
+    for a pyparsing ParseResults.
+    """
+
+    def __init__(self, positional=(), **named):
+        super(Tokens, self).__init__(named)
+        self.positional = list(positional)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, long)):
+            return self.positional[key]
+        return super(Tokens, self).__getitem__(key)
+
+
+def parse_field_pyparsing(keyword, line):
+    """Parse the line with the grammar for its keyword and return the
+    tokens.
+    """
+    grammar = FIELD_GRAMMARS.get(keyword, CASE_RECORD)
+    with GRAMMAR_LOCK:
+        try:
+            results = grammar.parseString(line)
+        except ParseException as err:
+            # Copy the exception before another thread changes it.
+            raise ParseException(err.pstr, err.loc, err.msg,
+                                 err.parserElement)
+    # ParseResults cannot be pickled, so return the same plain Tokens
+    # as the regex engine.
+    named = {}
+    for name, value in results.items():
+        if isinstance(value, ParseResults):
+            value = value.asList()
+        named[name] = value
+    return Tokens(results.asList(), **named)
+
+
+# Regular expression engine
+#
+# The functions below recognize the same field grammars as the
+# pyparsing elements above, using precompiled regular expressions. They
+# step through the line one token at a time, skipping whitespace the
+# way pyparsing does, and return the tokens under the same names so the
+# Parser.feed_*() methods work with either engine.
+
+
+class Scanner(object):
+    """Tracks the position in a line while matching its tokens.
+    """
+
+    def __init__(self, line, keyword):
+        # pyparsing expands tabs before parsing
+        self.line = line.expandtabs()
+        self.loc = len(keyword)
+
+    def optional(self, regex):
+        "Match regex at the current position and move past it."
+        match = regex.match(self.line, self.loc)
+        if match is not None:
+            self.loc = match.end()
+        return match
+
+    def required(self, regex, expected):
+        "Like optional(), but raise ParseException if there is no match."
+        match = self.optional(regex)
+        if match is None:
+            raise ParseException(self.line, self.loc, 'Expected ' + expected)
+        return match
+
+# Skip whitespace before a token. The lookahead keeps the regex from
+# backtracking into the whitespace when the token can start with a
+# space.
+SKIP_WHITE = r'[ \t\r\n]*(?![ \t\r\n])'
+
+
+def mk_token(pattern, flags=0):
+    """Given a regex for a token, produce the compiled regex to skip
+    whitespace and then recognize it.
+    """
+    return re.compile(SKIP_WHITE + '(?:' + pattern + ')', flags)
+
+NOTE_PATTERN = r'\(' + SKIP_WHITE + r'([^()]+)\)'
+RE_NUMBER = mk_token(r'([0-9]+)')
+RE_AMOUNT = mk_token(r'([0-9.]+)')
+RE_PRINTABLES = mk_token(r'([!-~]+)')
+RE_SLASH = mk_token(r'/')
+RE_DATE = mk_token(r'([0-9]+)' + SKIP_WHITE +
+                   r'([A-Za-z]+)' + SKIP_WHITE +
+                   r'([0-9]+)')
+RE_NOTE = mk_token(NOTE_PATTERN)
+RE_SPACED_NOTE = re.compile(r'[ \t\r\n]+' + SKIP_WHITE + NOTE_PATTERN)
+RE_REST_OF_LINE = re.compile(r'[ \t\r\n]+(.*)')
+RE_FULLNAME = mk_token(r'(([^(=]+(\s+|$))+)')
+NAME_CHARS_PATTERN = '([%s]+)' % re.escape(NAME_CHARS)
+RE_ALIAS = mk_token('alias=' + SKIP_WHITE + NAME_CHARS_PATTERN, re.I)
+RE_TITLE = mk_token('title=' + SKIP_WHITE + NAME_CHARS_PATTERN, re.I)
+RE_SUFFIX = mk_token('suffix=' + SKIP_WHITE + NAME_CHARS_PATTERN, re.I)
+# Alternatives are listed in the order oneOf() tries them, with
+# longer words ahead of their prefixes.
+RE_SENTENCE_TYPE = mk_token('(c|f|j|l|m|o|pd|p|r|w)', re.I)
+RE_SENTENCE_OTHER = mk_token('o' + SKIP_WHITE + NOTE_PATTERN, re.I)
+RE_SENTENCE_WORD = mk_token('(guilty|dismissed|pd)', re.I)
+RE_GENDER = mk_token('(m|f)', re.I)
+RE_RACE = mk_token('(w|c)', re.I)
+RE_PLEA = mk_token('(guilty|g|ng|nc|not guilty)', re.I)
+RE_OUTCOME = mk_token('(guilty|guitly|g|ng|dismissed|d|suspended|s'
+                      '|not guilty)', re.I)
+
+
+def re_name(keyword, line):
+    scanner = Scanner(line, keyword)
+    toks = Tokens(
+        fullname=scanner.required(RE_FULLNAME, 'name').group(1),
+        )
+    for name, regex in [('alias', RE_ALIAS),
+                        ('title', RE_TITLE),
+                        ('suffix', RE_SUFFIX),
+                        ]:
+        match = scanner.optional(regex)
+        if match:
+            toks[name] = match.group(1)
+    match = scanner.optional(RE_NOTE)
+    if match:
+        toks['note'] = [match.group(1)]
+    if not toks['fullname'].strip():
+        raise ParseException(scanner.line, scanner.loc, 'Expected name')
+    return Tokens([parse_participant(scanner.line, scanner.loc, toks)])
+
+
+def re_date(keyword, line):
+    scanner = Scanner(line, keyword)
+    match = scanner.required(RE_DATE, 'date')
+    return Tokens(date=parse_date(scanner.line, scanner.loc, match.groups()))
+
+
+def re_rest_of_line(name):
+    """Given a token name, produce the function to recognize a field
+    with white space and then the rest of the line as its value.
+    """
+    def parse_rest(keyword, line):
+        scanner = Scanner(line, keyword)
+        match = scanner.required(RE_REST_OF_LINE, 'white space')
+        return Tokens(**{name: match.group(1)})
+    return parse_rest
+
+
+def re_choice(name, regex):
+    """Given a token name and regex of alternatives, produce the
+    function to recognize a field with one of the values.
+    """
+    def parse_choice(keyword, line):
+        scanner = Scanner(line, keyword)
+        value = scanner.required(regex, name).group(1).lower()
+        return Tokens([value], **{name: value})
+    return parse_choice
+
+
+def re_book(keyword, line):
+    scanner = Scanner(line, keyword)
+    year = scanner.required(RE_NUMBER, 'year').group(1)
+    scanner.required(RE_SLASH, '"/"')
+    number = scanner.required(RE_NUMBER, 'number').group(1)
+    return Tokens(year=year, number=number)
+
+
+def re_page(keyword, line):
+    scanner = Scanner(line, keyword)
+    return Tokens(number=scanner.required(RE_NUMBER, 'number').group(1))
+
+
+def re_case(keyword, line):
+    scanner = Scanner(line, keyword)
+    return Tokens(number=scanner.required(RE_PRINTABLES, 'number').group(1))
+
+
+def re_violation(keyword, line):
+    scanner = Scanner(line, keyword)
+    toks = Tokens(
+        violation=scanner.required(RE_PRINTABLES, 'violation').group(1),
+        )
+    match = scanner.optional(RE_SPACED_NOTE)
+    if match:
+        toks['note'] = [match.group(1)]
+    return toks
+
+
+def re_sentence_rendered(keyword, line):
+    scanner = Scanner(line, keyword)
+    match = scanner.optional(RE_SENTENCE_OTHER)
+    if match:
+        return Tokens(type3='o', note2=[match.group(1)])
+    match = scanner.optional(RE_SENTENCE_WORD)
+    if match:
+        return Tokens(type2=match.group(1).lower())
+    toks = Tokens()
+    for name, regex in [('amount', RE_AMOUNT),
+                        ('type1', RE_SENTENCE_TYPE),
+                        ('note1', RE_NOTE),
+                        ]:
+        match = scanner.optional(regex)
+        if match:
+            toks[name] = match.group(1)
+    if 'type1' in toks:
+        toks['type1'] = toks['type1'].lower()
+    if 'note1' in toks:
+        toks['note1'] = [toks['note1']]
+    return toks
+
+
+def re_sentence_served(keyword, line):
+    scanner = Scanner(line, keyword)
+    toks = Tokens()
+    match = scanner.optional(RE_AMOUNT)
+    if match:
+        toks['amount'] = match.group(1)
+    match = scanner.optional(RE_SENTENCE_TYPE)
+    if match:
+        toks['type'] = match.group(1).lower()
+    match = scanner.optional(RE_DATE)
+    if match:
+        toks['date'] = parse_date(scanner.line, scanner.loc, match.groups())
+    match = scanner.optional(RE_NOTE)
+    if match:
+        toks['note'] = [match.group(1)]
+    return toks
+
+
+def re_sentence_contempt(keyword, line):
+    scanner = Scanner(line, keyword)
+    toks = Tokens(amount=scanner.required(RE_AMOUNT, 'amount').group(1))
+    match = scanner.optional(RE_SENTENCE_TYPE)
+    if match:
+        toks['type'] = match.group(1).lower()
+    match = scanner.optional(RE_NOTE)
+    if match:
+        toks['note'] = [match.group(1)]
+    return toks
+
+
+# Map the field keywords to the regex engine functions that recognize
+# the rest of the line.
+RE_FIELDS = {
+    'b': re_book,
+    'pg': re_page,
+    'c': re_case,
+    'ad': re_date,
+    'hd': re_date,
+    'd': re_name,
+    'dv': re_rest_of_line('vehicle'),
+    'v': re_violation,
+    'l': re_rest_of_line('location'),
+    'ao': re_name,
+    'w': re_name,
+    'dw': re_name,
+    'p': re_choice('plea', RE_PLEA),
+    'sr': re_sentence_rendered,
+    'ss': re_sentence_served,
+    'sc': re_sentence_contempt,
+    'n': re_rest_of_line('note'),
+    'o': re_choice('outcome', RE_OUTCOME),
+    'g': re_choice('gender', RE_GENDER),
+    'r': re_choice('race', RE_RACE),
+    'op': re_name,
+    }
+
+
+
+def parse_field_regex(keyword, line):
+    """Parse the line with the regex engine function for its keyword
+    and return the tokens.
+    """
+    try:
+        parse_field = RE_FIELDS[keyword]
+    except KeyError:
+        raise ParseException(line, 0, 'Unknown keyword %r' % keyword)
+    return parse_field(keyword, line)
+
+# The parsing engines, and the function each uses to turn a line into
+# tokens. pyparsing is the reference implementation.
+ENGINES = {
+    'pyparsing': parse_field_pyparsing,
+    'regex': parse_field_regex,
+    }
+
+
+# Event stream
+#
+# A Tokenizer turns each line of input into an Event without looking
+# at any other line, so it keeps no state about books, pages, or
+# cases. The Parser builds the cases by feeding the events to its
+# feed_*() methods in order. Other consumers can use the events
+# directly to check or count the fields without building cases.
+
+Event = collections.namedtuple(
+    'Event',
+    ['kind',     # what the line holds, from EVENT_KINDS or below
+     'num',      # line number
+     'keyword',  # lower case keyword at the start of the line
+     'line',     # the line without surrounding white space
+     'tokens',   # Tokens from the engine, or the message for an ERROR
+     'start',    # byte offsets of the line in the source, or None
+     'end',
+     ])
+
+# Event kinds for lines that are not parsed
+BLANK = 'blank'
+SKIPPED = 'skipped'  # the keyword is not being parsed (skim mode)
+ERROR = 'error'
+
+# The kind of Event produced for each keyword
+EVENT_KINDS = {
+    'b': 'book',
+    'pg': 'page',
+    'c': 'case',
+    'ad': 'date',
+    'hd': 'date',
+    'd': 'participant',
+    'dv': 'field',
+    'v': 'field',
+    'l': 'field',
+    'ao': 'participant',
+    'w': 'participant',
+    'dw': 'participant',
+    'p': 'field',
+    'sr': 'sentence',
+    'ss': 'sentence',
+    'sc': 'sentence',
+    'n': 'note',
+    'o': 'field',
+    'g': 'field',
+    'r': 'field',
+    'op': 'participant',
+    }
+
+
+_new_event = tuple.__new__
+
+
+class Tokenizer(object):
+    """Turns lines of VTR input into Events.
+
+    engine names the function from ENGINES used to parse the lines.
+    When keywords is set, lines starting with other keywords produce
+    SKIPPED events instead of being parsed. The book, page, and case
+    lines are always parsed.
+    """
+
+    def __init__(self, engine='pyparsing', keywords=None):
+        try:
+            self.parse_field = ENGINES[engine]
+        except KeyError:
+            raise ValueError('Unknown parser engine %r' % engine)
+        self.engine = engine
+        if keywords is not None:
+            keywords = frozenset(k.lower() for k in keywords) | SKIM_KEYWORDS
+        self.keywords = keywords
+
+    def tokenize_line(self, num, line, start=None, end=None):
+        """Return the Event for one line, which should already have
+        the white space stripped.
+        """
+        if not line:
+            kind, keyword, tokens = BLANK, '', None
+        else:
+            keyword = KEYWORD.match(line).group().lower()
+            if self.keywords is not None and keyword not in self.keywords:
+                kind, tokens = SKIPPED, None
+            else:
+                try:
+                    tokens = self.parse_field(keyword, line)
+                    kind = EVENT_KINDS[keyword]
+                except (ParseException, ValueError) as err:
+                    kind, tokens = ERROR, unicode(err)
+        # Calling Event() costs as much as the rest of this method.
+        return _new_event(Event, (kind, num, keyword, line, tokens,
+                                  start, end))
+
+    def tokenize(self, numbered_lines, offset=None):
+        """Generate the Events for an iterable of (line number, string)
+        pairs. If offset is not None, it is the byte offset of the first
+        line in the source file, and the events include the offsets of
+        their lines. The lines must keep their line endings for the
+        offsets to be right.
+        """
+        tokenize_line = self.tokenize_line
+        for num, line in numbered_lines:
+            if offset is None:
+                yield tokenize_line(num, line.strip())
+            else:
+                start = offset
+                offset += len(line.encode(ENCODING))
+                yield tokenize_line(num, line.strip(), start, offset)
+
+
+def tokenize(lines, engine='pyparsing', keywords=None):
+    """Generate the Events for the lines of VTR input, numbered from 1.
+    """
+    return Tokenizer(engine, keywords).tokenize(enumerate(lines, 1))
+
+
+class ParseStats(object):
+    """Counts and timings for the lines handled by a traced Parser.
+
+    Times are in seconds. parse_times holds the time spent turning
+    lines into tokens for each keyword, and action_times holds the
+    time spent in each feed_*() method.
+    """
+
+    def __init__(self, num_slowest=10):
+        self.num_slowest = num_slowest
+        self.counts = collections.defaultdict(int)
+        self.errors = collections.defaultdict(int)
+        self.parse_times = collections.defaultdict(float)
+        self.action_times = collections.defaultdict(float)
+        self._slowest = []  # heap of (seconds, line number, line)
+
+    def record(self, num, keyword, line, parse_time, action_time=0.0,
+               failed=False):
+        "Add the timings for one line of input."
+        self.counts[keyword] += 1
+        if failed:
+            self.errors[keyword] += 1
+        self.parse_times[keyword] += parse_time
+        if action_time:
+            action = FIELD_ACTIONS.get(keyword, keyword)
+            self.action_times[action] += action_time
+        item = (parse_time + action_time, num, line)
+        if len(self._slowest) < self.num_slowest:
+            heapq.heappush(self._slowest, item)
+        elif item > self._slowest[0]:
+            heapq.heapreplace(self._slowest, item)
+
+    @property
+    def slowest(self):
+        "The (seconds, line number, line) of the slowest lines, slowest first."
+        return sorted(self._slowest, reverse=True)
+
+    @property
+    def total_time(self):
+        "Seconds spent parsing and feeding all of the lines."
+        return sum(self.parse_times.values()) + sum(self.action_times.values())
+
+    def as_dict(self):
+        "Return the stats as plain data, for reporting job results."
+        return {'counts': dict(self.counts),
+                'errors': dict(self.errors),
+                'parse_times': dict(self.parse_times),
+                'action_times': dict(self.action_times),
+                'slowest': self.slowest,
+                }
+
+    def report(self):
+        "Return a list of lines describing where the time went."
+        return format_parse_stats(self.as_dict())
+
+
+def format_parse_stats(stats):
+    """Return a list of lines describing where the time went, given
+    the output of ParseStats.as_dict().
+    """
+    counts = stats['counts']
+    errors = stats['errors']
+    parse_times = stats['parse_times']
+    action_times = stats['action_times']
+
+    def action_time(keyword):
+        return action_times.get(FIELD_ACTIONS.get(keyword), 0.0)
+
+    lines = ['%-4s %8s %6s %10s %10s' %
+             ('key', 'lines', 'errors', 'parse', 'action')]
+    by_time = sorted(counts,
+                     key=lambda k: parse_times[k] + action_time(k),
+                     reverse=True,
+                     )
+    for keyword in by_time:
+        lines.append('%-4s %8d %6d %10.4f %10.4f' % (
+            keyword or '-',
+            counts[keyword],
+            errors.get(keyword, 0),
+            parse_times[keyword],
+            action_time(keyword),
+            ))
+    for seconds, num, line in stats['slowest']:
+        lines.append('slow line %d (%.4f): %s' % (num, seconds, line))
+    return lines
+
+
+class ErrorCollector(object):
+    """Keeps track of the errors found while parsing.
+
+    Each error is a (line number, line, message) tuple. If there is an
+    error_sink, it is called with each error as it is found instead of
+    adding the error to self.errors. After max_errors errors, the rest
+    are only counted in dropped_errors.
+
+    If error_recorder is set, it is called with every error, including
+    the ones that are dropped.
+    """
+
+    def __init__(self, error_sink=None, max_errors=None):
+        self.error_sink = error_sink
+        self.max_errors = max_errors
+        self.error_recorder = None
+        self.errors = []
+        self.error_count = 0
+        self.dropped_errors = 0
+
+    def add_error(self, num, line, message):
+        "Report a new error."
+        if self.error_recorder is not None:
+            self.error_recorder((num, line, message))
+        self.error_count += 1
+        if self.max_errors is not None and self.error_count > self.max_errors:
+            self.dropped_errors += 1
+        elif self.error_sink is not None:
+            self.error_sink((num, line, message))
+        else:
+            self.errors.append((num, line, message))
+
+
+class Parser(ErrorCollector):
     """Vague text record parser.
     """
 
-    def __init__(self):
-        self.case_record_parser = (
-            BOOK.copy().setParseAction(self.feed_book)
-            | PAGE.copy().setParseAction(self.feed_page)
-            | CASE.copy().setParseAction(self.feed_case)
-            | ARREST_DATE.copy().setParseAction(self.feed_ad)
-            | HEARING_DATE.copy().setParseAction(self.feed_hd)
-            | DEFENDANT.copy().setParseAction(self.feed_d)
-            | DEFENDANT_VEHICLE.copy().setParseAction(self.feed_dv)
-            | VIOLATION.copy().setParseAction(self.feed_v)
-            | LOCATION.copy().setParseAction(self.feed_l)
-            | ARRESTING_OFFICER.copy().setParseAction(self.feed_ao)
-            | WITNESS.copy().setParseAction(self.feed_w)
-            | DEFENSE_WITNESS.copy().setParseAction(self.feed_dw)
-            | PLEA.copy().setParseAction(self.feed_p)
-            | SENTENCE_RENDERED.copy().setParseAction(self.feed_sr)
-            | SENTENCE_SERVED.copy().setParseAction(self.feed_ss)
-            | SENTENCE_CONTEMPT.copy().setParseAction(self.feed_sc)
-            | CASE_NOTE.copy().setParseAction(self.feed_n)
-            | OUTCOME.copy().setParseAction(self.feed_o)
-            | GENDER.copy().setParseAction(self.feed_g)
-            | RACE.copy().setParseAction(self.feed_r)
-            | OTHER_PERSON.copy().setParseAction(self.feed_op)
-            )
+    def __init__(self, engine='pyparsing', trace=False, source=None,
+                 records=False, keywords=None, error_sink=None,
+                 max_errors=None):
+        super(Parser, self).__init__(error_sink, max_errors)
+        # The grammar is built once, when the module is imported. The
+        # parser only holds the state for the input being parsed. The
+        # lines are turned into Events by self.tokenizer, and the cases
+        # are built from the events (see assemble()).
+        # When trace is true, self.stats is a ParseStats instance
+        # with the counts and timings for the lines parsed.
+        # When source is set, cases refer to their lines in the
+        # source file instead of holding copies (see prepare_case()).
+        # When records is true, the cases are Case records instead of
+        # dicts (see docket.records). When keywords is set, only the
+        # lines starting with those keywords are parsed, along with the
+        # book, page, and case lines (see assemble()). See
+        # ErrorCollector for error_sink and max_errors.
+        self.tokenizer = Tokenizer(engine, keywords)
+        self.engine = engine
         self.book = None
         self.yield_book = False
         self.page = None
         self.case = None
         self.next_case = None
-        self.errors = []
         self._lines = []
+        self._content = hashlib.sha1()  # the text of the current case
+        self.stats = ParseStats() if trace else None
+        self.source = source
+        self.offset = 0  # byte offset of the next line in the source
+        self.records = records
+        self.keywords = self.tokenizer.keywords
+        self._parse_time = 0.0  # seconds to tokenize the current line
+        self._actions = dict((keyword, getattr(self, action))
+                             for keyword, action in FIELD_ACTIONS.items())
+        if records:
+            self.case_type = Case
+            self.participant_type = Participant
+            self.sentence_type = Sentence
+        else:
+            self.case_type = self.participant_type = self.sentence_type = dict
         return
 
-    @show_parse_action
     def feed_book(self, s, loc, toks):
         "Start a new book"
         self.book = '%s/%s' % (toks['year'], toks['number'])
         log.info('Set book to %s', self.book)
 
-    @show_parse_action
     def feed_page(self, s, loc, toks):
         "Start a new page in the book"
         self.page = int(toks['number'])
 
-    @show_parse_action
     def feed_case(self, s, loc, toks):
         "Start a new case and prepare the previous one to be emitted."
         if self.case:
             self.next_case = self.case
-        self.case = {'book': self.book,
-                     'number': toks['number'],
-                     'page': self.page,
-                     'participants': [],
-                     'sentence_rendered': [],
-                     'sentence_served': [],
-                     'sentence_contempt': [],
-                     'defendant': '',
-                     }
-
-    @show_parse_action
+        self.case = self.case_type(book=self.book,
+                                   number=toks['number'],
+                                   page=self.page,
+                                   participants=[],
+                                   sentence_rendered=[],
+                                   sentence_served=[],
+                                   sentence_contempt=[],
+                                   defendant='',
+                                   )
+
     def feed_ad(self, s, loc, toks):
         "Arrest date"
         self.case['arrest_date'] = toks['date']
 
-    @show_parse_action
     def feed_hd(self, s, loc, toks):
         "Hearing date"
         self.case['hearing_date'] = toks['date']
 
     def add_participant(self, role, toks):
         "Add a person's name to the case"
-        new_participant = {'role': role}
+        new_participant = self.participant_type(role=role)
         new_participant.update(toks)
         log.debug('adding participant %s', new_participant)
         self.case['participants'].append(new_participant)
 
-    @show_parse_action
     def feed_d(self, s=None, loc=None, toks=None):
         "Defendant"
         self.add_participant('defendant', toks[0])
         self.case['defendant'] = toks[0]['full_name']
 
-    @show_parse_action
     def feed_w(self, s, loc, toks):
         "Witness"
         self.add_participant('witness', toks[0])
 
-    @show_parse_action
     def feed_dw(self, s, loc, toks):
         "Defense witness"
         self.add_participant('defense witness', toks[0])
 
-    @show_parse_action
     def feed_ao(self, s=None, loc=None, toks=None):
         "Arresting officer"
         self.add_participant('arresting officer', toks[0])
 
-    @show_parse_action
     def feed_dv(self, s, loc, toks):
         "Defendant vehicle"
         self.case['vehicle'] = toks['vehicle']
 
-    @show_parse_action
     def feed_v(self, s, loc, toks):
         "Violation code"
         self.case['violation'] = toks['violation']
         self.case['violation_note'] = toks.get('note', [''])[0]
 
-    @show_parse_action
     def feed_l(self, s, loc, toks):
         "Location"
         self.case['location'] = toks['location']
 
-    @show_parse_action
     def feed_p(self, s, loc, toks):
         "Plea"
         found_plea = toks['plea'].lower()
@@ -314,12 +942,10 @@ class Parser(object):
                  }.get(found_plea, found_plea)
         self.case['plea'] = plea
 
-    @show_parse_action
     def feed_n(self, s, loc, toks):
         "Case note"
         self.case.setdefault('note', []).append(toks['note'])
 
-    @show_parse_action
     def feed_o(self, s, loc, toks):
         "Outcome"
         outcomes = {'g': 'guilty',
@@ -343,7 +969,6 @@ class Parser(object):
         'w': ('labor', 'days'),
         }
 
-    @show_parse_action
     def feed_sr(self, s, loc, toks):
         amount = float(toks.get('amount', 0))
 
@@ -364,18 +989,17 @@ class Parser(object):
             found_sent_type,
             (found_sent_type, 'unknown')
             )
-        new_sent = {'type': converted_sent_type,
-                    'units': sent_units,
-                    'amount': amount,
-                    'note': note,
-                    }
+        new_sent = self.sentence_type(type=converted_sent_type,
+                                      units=sent_units,
+                                      amount=amount,
+                                      note=note,
+                                      )
 
         if converted_sent_type == 'other' and not note:
             raise ValueError('Invalid sentence rendered, no note for "other"')
 
         self.case['sentence_rendered'].append(new_sent)
 
-    @show_parse_action
     def feed_ss(self, s, loc, toks):
         found_sent_type = toks.get('type')
         converted_sent_type, sent_units = self.SENTENCE_TYPES.get(
@@ -383,17 +1007,16 @@ class Parser(object):
             (found_sent_type, 'unknown')
             )
 
-        new_sent = {
-            'amount': float(toks.get('amount', 0)),
-            'type': converted_sent_type,
-            'units': sent_units,
-            'note': toks.get('note', [''])[0],
-            'date': toks.get('date', None),
-            }
+        new_sent = self.sentence_type(
+            amount=float(toks.get('amount', 0)),
+            type=converted_sent_type,
+            units=sent_units,
+            note=toks.get('note', [''])[0],
+            date=toks.get('date', None),
+            )
 
         self.case['sentence_served'].append(new_sent)
 
-    @show_parse_action
     def feed_sc(self, s, loc, toks):
         found_sent_type = toks.get('type', 'f')
         converted_sent_type, sent_units = self.SENTENCE_TYPES.get(
@@ -401,41 +1024,39 @@ class Parser(object):
             (found_sent_type, 'unknown')
             )
 
-        new_sent = {
-            'amount': float(toks.get('amount', 0)),
-            'type': converted_sent_type,
-            'units': sent_units,
-            'note': toks.get('note', [''])[0],
-            }
+        new_sent = self.sentence_type(
+            amount=float(toks.get('amount', 0)),
+            type=converted_sent_type,
+            units=sent_units,
+            note=toks.get('note', [''])[0],
+            )
 
         self.case['sentence_contempt'].append(new_sent)
 
-    @show_parse_action
     def feed_g(self, s, loc, toks):
         "Defendant's gender"
         self.case['gender'] = toks['gender'].lower()
 
-    @show_parse_action
     def feed_r(self, s, loc, toks):
         "Defendant's race"
         self.case['race'] = toks[-1].lower()
 
-    @show_parse_action
     def feed_op(self, s=None, loc=None, toks=None):
         "Other person"
         self.add_participant('other', toks[0])
 
     def validate_case(self, case, line_num):
+        if self.keywords is not None and 'd' not in self.keywords:
+            return
         defendants = [p
                       for p in case['participants']
                       if p['role'] == 'defendant'
                       ]
         if not defendants:
-            self.errors.append((line_num,
-                                '',
-                                'No defendant found for %s' % case['number'],
-                                )
-                               )
+            self.add_error(line_num,
+                           '',
+                           'No defendant found for %s' % case['number'],
+                           )
         return
 
     def prepare_case(self, case, line_num):
@@ -455,45 +1076,304 @@ class Parser(object):
                         )
         # Merge the notes
         case['note'] = '\n'.join(case.get('note', []))
+        # Identify the text of the case, to find the cases that change
+        # when a file is loaded again. The book and page come from
+        # earlier lines, so they are added here. So are the parser
+        # version and the way the lines are kept, so the cases are
+        # written again when either one changes.
+        content = self._content
+        content.update((u'%s\n%s\n%s\n%s\n' % (
+            case.get('book'), case.get('page'), PARSER_VERSION,
+            'lines' if self.source is None else 'ranges',
+            )).encode(ENCODING))
+        case['content_hash'] = content.hexdigest()
         # Record the raw version of the input that lead to this case
-        case['lines'] = self._lines[:]
+        if self.source is None:
+            case['lines'] = self._lines[:]
+        else:
+            first = self._lines[0]
+            last = self._lines[-1]
+            case['lines'] = {'source': self.source,
+                             'first': first[0],
+                             'last': last[0],
+                             'start': first[1],
+                             'end': last[2],
+                             }
         return
 
+    def parse_line(self, keyword, line):
+        "Parse one line of input, starting with the keyword."
+        toks = self.tokenizer.parse_field(keyword, line)
+        getattr(self, FIELD_ACTIONS[keyword])(line, 0, toks)
+
+    def feed(self, event):
+        """Update the parser state from an Event, raising ValueError
+        for an ERROR.
+        """
+        if event.kind == ERROR:
+            raise ValueError(event.tokens)
+        self._actions[event.keyword](event.line, 0, event.tokens)
+
+    def trace_event(self, event):
+        "Like feed(), but add the timings to self.stats."
+        if event.kind == ERROR:
+            self.stats.record(event.num, event.keyword, event.line,
+                              self._parse_time, failed=True)
+            raise ValueError(event.tokens)
+        start = timeit.default_timer()
+        failed = True
+        try:
+            self.feed(event)
+            failed = False
+        finally:
+            self.stats.record(event.num, event.keyword, event.line,
+                              self._parse_time,
+                              timeit.default_timer() - start,
+                              failed)
+
+    def _timed(self, events):
+        "Pass the events through, saving the time taken to produce each."
+        timer = timeit.default_timer
+        events = iter(events)
+        while True:
+            start = timer()
+            event = next(events)
+            self._parse_time = timer() - start
+            yield event
+
     def parse(self, lines, continueOnError=True):
         """The public API.
 
         The lines argument should be an iterable that returns strings
-        (a file, fileinput, list, etc.).
+        (a file, fileinput, list, etc.). If the parser has a source,
+        the lines must be read from the start of that file and keep
+        their line endings, so the byte offsets are right.
 
         If continueOnError is true the parser logs any
         errors and keeps going.
         """
-        for num, line in enumerate(lines, 1):
-            line = line.strip()
-            log.debug(line)
-            if line:
-                try:
-                    self.case_record_parser.parseString(line)
-                    if self.next_case:
-                        self.prepare_case(self.next_case, num)
-                        yield self.next_case
-                        self.next_case = None
-                        self._lines = self._lines[-1:]  # preserve the "case" line
-                    self._lines.append((num, line))
-                except (ParseException, ValueError) as err:
-                    self.errors.append((num, line, unicode(err)))
-                    log.error('Parse error processing %r: %s', line, err)
-                    if not continueOnError:
-                        raise
-                    continue
+        return self.parse_numbered(enumerate(lines, 1), continueOnError)
+
+    def parse_numbered(self, numbered_lines, continueOnError=True,
+                       finish=True):
+        """Like parse(), but numbered_lines should be an iterable that
+        returns (line number, string) pairs. See assemble() for finish.
+        """
+        offset = self.offset if self.source is not None else None
+        events = self.tokenizer.tokenize(numbered_lines, offset)
+        return self.assemble(events, continueOnError, finish)
+
+    def assemble(self, events, continueOnError=True, finish=True):
+        """Generate the cases built from an iterable of Events, in
+        line order, such as the output of Tokenizer.tokenize().
+
+        If finish is false the case still open at the end of the input
+        is not returned, because the input continues elsewhere.
+
+        SKIPPED lines are kept with their cases, but not checked for
+        errors. The cases only have the fields from the lines that were
+        parsed, and they are not checked for a defendant unless "d" is
+        one of the parser's keywords.
+        """
+        stats = self.stats
+        source = self.source
+        actions = self._actions
+        if stats is not None:
+            events = self._timed(events)
+        for event in events:
+            kind, num, keyword, line, tokens, start, end = event
+            if source is None:
+                raw = (num, line)
             else:
-                self._lines.append((num, line))
+                raw = (num, start, end)
+                self.offset = end
+            if kind == BLANK:
+                self._lines.append(raw)
+                continue
+            if kind == SKIPPED:
+                self._lines.append(raw)
+                self._content.update(line.encode(ENCODING) + '\n')
+                continue
+            try:
+                if stats is not None:
+                    self.trace_event(event)
+                elif kind == ERROR:
+                    raise ValueError(tokens)
+                else:
+                    actions[keyword](line, 0, tokens)
+                if self.next_case:
+                    self.prepare_case(self.next_case, num)
+                    yield self.next_case
+                    self.next_case = None
+                    self._lines = self._lines[-1:]  # preserve the "case" line
+                    self._content = hashlib.sha1()
+                self._lines.append(raw)
+                self._content.update(line.encode(ENCODING) + '\n')
+            except (ParseException, ValueError) as err:
+                self.add_error(num, line, unicode(err))
+                log.error('Parse error processing %r: %s', line, err)
+                # Fixing the line is a change to the case
+                self._content.update(line.encode(ENCODING) + '\n')
+                if not continueOnError:
+                    raise
+                continue
 
         # Make sure we yield the last case in the input
-        if self.case:
+        if self.case and finish:
             self.prepare_case(self.case, num)
             yield self.case
 
+
+# Parallel parsing
+#
+# A file is split into chunks at book and page lines, and the chunks
+# are parsed separately, by the load_chunk tasks. A case is owned by the chunk where
+# its "c" line appears, but the Parser only finishes a case when it
+# sees the next "c" line, and it keeps the line before a "c" line with
+# the new case. To get the same results as parsing the whole file, each
+# chunk starts at the "c" line of the last case from the previous chunk
+# and runs through the first "c" line of the next chunk. The extra
+# cases and errors are thrown away when the chunk is parsed.
+
+# Approximate number of lines in each chunk
+CHUNK_SIZE = 5000
+
+Chunk = collections.namedtuple(
+    'Chunk',
+    ['lines',          # (line number, string) pairs to parse
+     'book',           # the book and page at the start of the lines
+     'page',
+     'start',          # the first line number owned by the chunk
+     'end',            # the first line number of the next chunk, or None
+     'previous_case',  # the line starting the last case before start
+     'first_case',     # the line starting the first case after start
+     'stop',           # the line starting the first case after end
+     'offset',         # the byte offset of the first line in the source
+     'options',        # keyword arguments for the Parser
+     ])
+
+
+def split_chunks(lines, chunk_size=CHUNK_SIZE, **options):
+    """Split the lines of a VTR file into Chunks that can be parsed
+    separately by parse_chunk(). The options are passed to the Parser
+    for each chunk.
+    """
+    source = options.get('source')
+    # Use a parser to follow the book and page, and to find the "c"
+    # lines that really start a case, without parsing anything else.
+    tracker = Parser(engine=options.get('engine', 'pyparsing'))
+    buffered = []
+    book = page = None
+    start = 1
+    end = None
+    previous_case = first_case = None
+    last_case = next_chunk_case = None
+    offset = 0
+    for num, line in enumerate(lines, 1):
+        stripped = line.strip()
+        keyword = KEYWORD.match(stripped).group().lower()
+        new_case = False
+        if keyword in ('b', 'pg', 'c'):
+            if (keyword != 'c' and end is None
+                and last_case and last_case[0] >= start
+                and num - start >= chunk_size):
+                # Start the next chunk here
+                end = num
+                next_chunk_case = last_case
+            try:
+                tracker.parse_line(keyword, stripped)
+            except (ParseException, ValueError):
+                pass
+            else:
+                new_case = (keyword == 'c')
+        buffered.append((num, line))
+        if not new_case:
+            continue
+        if end is not None:
+            # This case is the first one in the next chunk, and
+            # finishes the last case of this chunk.
+            yield Chunk(buffered, book, page, start, end,
+                        previous_case, first_case, num, offset, options)
+            previous_case, book, page = next_chunk_case
+            if source is not None:
+                offset += sum(len(l.encode(ENCODING))
+                              for n, l in buffered
+                              if n < previous_case)
+            buffered = [l for l in buffered if l[0] >= previous_case]
+            start = end
+            end = None
+            first_case = num
+        last_case = (num, tracker.book, tracker.page)
+    if buffered:
+        yield Chunk(buffered, book, page, start, None,
+                    previous_case, first_case, None, offset, options)
+
+
+def parse_chunk(chunk):
+    """Parse one Chunk and return a list of the cases it owns and a
+    list of the errors it found.
+    """
+    parser = Parser(**chunk.options)
+    parser.book = chunk.book
+    parser.page = chunk.page
+    parser.offset = chunk.offset
+    # The case started on the stop line belongs to the next chunk.
+    cases = list(parser.parse_numbered(chunk.lines,
+                                       finish=chunk.stop is None))
+    if chunk.previous_case is not None:
+        # The first case was only parsed to set up the state.
+        del cases[0]
+    errors = []
+    for err in parser.errors:
+        num = err[0]
+        # Errors for lines before the chunk, lines past the end, and
+        # for finishing the previous case are reported by the other
+        # chunks. The last case owned by the chunk is finished at the
+        # stop line.
+        if num < chunk.start or num == chunk.first_case:
+            continue
+        if chunk.end is not None and num >= chunk.end and num != chunk.stop:
+            continue
+        errors.append(err)
+    return cases, errors
+
+
+def compare_engines(lines, engine='regex'):
+    """Parse the lines with the reference pyparsing engine and another
+    engine, and return a list of messages describing any differences.
+    """
+    lines = list(lines)
+    reference = Parser(engine='pyparsing')
+    expected = list(reference.parse(lines))
+    candidate = Parser(engine=engine)
+    actual = list(candidate.parse(lines))
+    differences = []
+    for ref_case, case in map(None, expected, actual):
+        if ref_case is None:
+            differences.append('%s: extra case %s/%s' %
+                               (engine, case['book'], case['number']))
+        elif case is None:
+            differences.append('%s: missing case %s/%s' %
+                               (engine, ref_case['book'], ref_case['number']))
+        elif ref_case != case:
+            for key in sorted(set(ref_case) | set(case)):
+                if ref_case.get(key) != case.get(key):
+                    differences.append(
+                        '%s: case %s/%s field %s: expected %r, got %r' %
+                        (engine, ref_case['book'], ref_case['number'],
+                         key, ref_case.get(key), case.get(key)))
+    expected_errors = [e[:2] for e in reference.errors]
+    actual_errors = [e[:2] for e in candidate.errors]
+    for num, line in expected_errors:
+        if (num, line) not in actual_errors:
+            differences.append('%s: no error reported for line %s %r' %
+                               (engine, num, line))
+    for num, line in actual_errors:
+        if (num, line) not in expected_errors:
+            differences.append('%s: unexpected error for line %s %r' %
+                               (engine, num, line))
+    return differences
+
 if __name__ == '__main__':
     import pprint
     logging.basicConfig(level=logging.INFO,
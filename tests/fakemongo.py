@@ -0,0 +1,204 @@
+"""An in-memory stand-in for the parts of a pymongo database the
+loader uses, so the tasks can be tested without a server.
+
+Like the server, an unacknowledged insert stops at the first duplicate
+_id without raising, and an acknowledged one (safe=True) raises
+DuplicateKeyError.
+"""
+
+import copy
+
+from pymongo.errors import DuplicateKeyError
+
+
+def get_values(doc, key):
+    "Return the values at a dotted key, looking through lists."
+    values = [doc]
+    for part in key.split('.'):
+        found = []
+        for value in values:
+            if isinstance(value, list):
+                found.extend(v.get(part) for v in value
+                             if isinstance(v, dict) and part in v)
+            elif isinstance(value, dict) and part in value:
+                found.append(value[part])
+        values = found
+    return values
+
+
+def matches(doc, spec):
+    "Does doc match the query spec?"
+    for key, cond in (spec or {}).items():
+        values = get_values(doc, key)
+        if isinstance(cond, dict) and cond and \
+                all(k.startswith('$') for k in cond):
+            for op, arg in cond.items():
+                if op == '$in':
+                    ok = any(v in arg for v in values) or \
+                        (not values and None in arg)
+                elif op == '$nin':
+                    ok = not any(v in arg for v in values)
+                elif op == '$ne':
+                    ok = arg not in values
+                elif op == '$exists':
+                    ok = bool(values) == bool(arg)
+                else:
+                    raise NotImplementedError(op)
+                if not ok:
+                    return False
+        elif cond not in values and not (cond is None and not values):
+            return False
+    return True
+
+
+class Cursor(list):
+
+    def count(self):
+        return len(self)
+
+    def sort(self, key_or_list):
+        for key, direction in reversed(key_or_list):
+            list.sort(self, key=lambda d: d.get(key),
+                      reverse=direction < 0)
+        return self
+
+
+class Collection(object):
+
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.docs = []
+        self.num_writes = 0
+
+    def find(self, spec=None, fields=None):
+        docs = [copy.deepcopy(d) for d in self.docs if matches(d, spec)]
+        if fields is not None:
+            docs = [dict((k, v) for k, v in d.items()
+                         if k == '_id' or k in fields)
+                    for d in docs]
+        return Cursor(docs)
+
+    def find_one(self, spec=None):
+        docs = self.find(spec)
+        return docs[0] if docs else None
+
+    def count(self):
+        return len(self.docs)
+
+    def _get(self, doc_id):
+        for doc in self.docs:
+            if doc['_id'] == doc_id:
+                return doc
+        return None
+
+    def insert(self, doc_or_docs, safe=False):
+        self.num_writes += 1
+        docs = doc_or_docs
+        if isinstance(docs, dict):
+            docs = [docs]
+        for doc in docs:
+            if '_id' not in doc:
+                self.db.last_id += 1
+                doc['_id'] = self.db.last_id
+            if self._get(doc['_id']) is not None:
+                if safe:
+                    raise DuplicateKeyError('duplicate key %s' % doc['_id'])
+                return
+            self.docs.append(copy.deepcopy(doc))
+
+    def save(self, doc, safe=False):
+        self.num_writes += 1
+        self.remove({'_id': doc['_id']})
+        self.docs.append(copy.deepcopy(doc))
+
+    def remove(self, spec=None, safe=False):
+        self.num_writes += 1
+        self.docs = [d for d in self.docs if not matches(d, spec)]
+
+    def update(self, spec, document, upsert=False, multi=False,
+               safe=False):
+        self.num_writes += 1
+        found = [d for d in self.docs if matches(d, spec)]
+        if not multi:
+            found = found[:1]
+        if not found and upsert:
+            doc = dict((k, v) for k, v in spec.items()
+                       if not isinstance(v, dict))
+            self.insert(doc)
+            found = [self._get(doc['_id'])]
+        for doc in found:
+            self._apply(doc, document)
+
+    def _apply(self, doc, document):
+        if not any(k.startswith('$') for k in document):
+            doc_id = doc['_id']
+            doc.clear()
+            doc.update(copy.deepcopy(document))
+            doc['_id'] = doc_id
+            return
+        for op, changes in document.items():
+            for key, value in copy.deepcopy(changes).items():
+                if op == '$set':
+                    doc[key] = value
+                elif op == '$unset':
+                    doc.pop(key, None)
+                elif op == '$inc':
+                    doc[key] = doc.get(key, 0) + value
+                elif op == '$push':
+                    doc.setdefault(key, []).append(value)
+                elif op == '$pushAll':
+                    doc.setdefault(key, []).extend(value)
+                elif op == '$addToSet':
+                    if value not in doc.setdefault(key, []):
+                        doc[key].append(value)
+                elif op == '$pull':
+                    doc[key] = [v for v in doc.get(key, [])
+                                if not matches(v, value)]
+                else:
+                    raise NotImplementedError(op)
+
+    def find_and_modify(self, query, update, upsert=False, new=False):
+        before = self.find_one(query)
+        self.update(query, update, upsert=upsert)
+        if new:
+            return self.find_one(query)
+        return before
+
+    def rename(self, new_name, dropTarget=False):
+        self.db.collections[new_name] = self
+        del self.db.collections[self.name]
+        self.name = new_name
+
+    def drop(self):
+        self.db.collections.pop(self.name, None)
+
+
+class Connection(object):
+
+    def end_request(self):
+        pass
+
+
+class Database(object):
+
+    def __init__(self):
+        self.collections = {}
+        self.connection = Connection()
+        self.last_id = 0
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = Collection(self, name)
+        return self.collections[name]
+
+    def command(self, name):
+        return {'ok': 1.0}
+
+    def collection_names(self):
+        return list(self.collections)
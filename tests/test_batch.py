@@ -0,0 +1,151 @@
+"""Tests for writing documents in batches.
+"""
+
+from docket import batch
+from tests import fakemongo
+
+
+class FakeCollection(object):
+    """Records the calls made by a BatchWriter.
+    """
+
+    name = 'fake'
+
+    def __init__(self, bad=()):
+        self.calls = []
+        self.docs = []
+        self.bad = bad  # values of 'n' that cannot be written
+
+    def remove(self, spec):
+        self.calls.append(('remove', spec))
+
+    def insert(self, docs, safe=False):
+        self.calls.append(('insert', len(docs)))
+        for i, doc in enumerate(docs):
+            doc.setdefault('_id', id(doc))
+            if doc['n'] in self.bad:
+                # Like the server, an unacknowledged insert stops
+                # without saying so.
+                if safe:
+                    raise ValueError('cannot write %s' % doc['n'])
+                return
+            self.docs.append(doc)
+
+    def save(self, doc, safe=False):
+        self.calls.append(('save', doc['n']))
+        if doc['n'] in self.bad and safe:
+            raise ValueError('cannot write %s' % doc['n'])
+        if doc not in self.docs:
+            self.docs.append(doc)
+
+
+def write(collection, docs, **kwds):
+    errors = []
+    writer = batch.BatchWriter(collection, error_handler=errors.append,
+                               **kwds)
+    for doc in docs:
+        writer.add(doc)
+    writer.flush()
+    return writer, errors
+
+
+def test_batches():
+    c = FakeCollection()
+    docs = [{'case': i // 3, 'n': i} for i in range(10)]
+    writer, errors = write(c, docs, replace_field='case', batch_size=4)
+    assert [call for call in c.calls if call[0] == 'insert'] == \
+        [('insert', 4), ('insert', 4), ('insert', 2)]
+    assert writer.num_batches == 3
+    assert writer.num_written == 10
+    assert c.docs == docs
+    assert errors == []
+
+
+def test_remove_each_value_once():
+    # The documents for case 1 span the first two batches, so the
+    # ones from the first batch must not be removed by the second.
+    c = FakeCollection()
+    docs = [{'case': i // 3, 'n': i} for i in range(8)]
+    write(c, docs, replace_field='case', batch_size=4)
+    removes = [call[1] for call in c.calls if call[0] == 'remove']
+    assert removes == [{'case': {'$in': [0, 1]}},
+                       {'case': {'$in': [2]}}]
+
+
+def test_replace_without_documents():
+    c = FakeCollection()
+    writer, errors = write(c, [{'case': 1, 'n': 0}], replace_field='case')
+    writer.replace(2)
+    writer.replace(1)  # already replaced
+    writer.flush()
+    assert c.calls[-1] == ('remove', {'case': {'$in': [2]}})
+    assert writer.num_batches == 2
+
+
+def test_nothing_to_write():
+    c = FakeCollection()
+    writer, errors = write(c, [])
+    assert c.calls == []
+    assert writer.num_batches == 0
+
+
+def test_failed_batch_reported_per_document():
+    c = FakeCollection(bad=[2, 5])
+    docs = [{'_id': i, 'n': i} for i in range(4)]
+    writer, errors = write(c, docs, batch_size=10,
+                           describe=lambda d: 'doc %s' % d['n'])
+    assert errors == ['Could not store doc 2: cannot write 2']
+    assert [d['n'] for d in c.docs] == [0, 1, 3]
+    assert writer.num_written == 3
+
+
+def test_duplicate_id():
+    # The server stops an insert at a duplicate _id, so the documents
+    # after it are only written if the insert says it failed.
+    c = fakemongo.Database().cases
+    docs = [{'_id': 1}, {'_id': 2}, {'_id': 1}, {'_id': 3}]
+    writer, errors = write(c, docs, batch_size=10, replace_field='_id')
+    assert sorted(d['_id'] for d in c.find()) == [1, 2, 3]
+    assert writer.num_written == 4
+
+
+def test_write_queue_same_calls():
+    docs = [{'case': i // 3, 'n': i} for i in range(10)]
+    expected = FakeCollection()
+    write(expected, [dict(d) for d in docs], replace_field='case',
+          batch_size=4)
+    c = FakeCollection()
+    queue = batch.WriteQueue(size=1)
+    writer, errors = write(c, docs, replace_field='case', batch_size=4,
+                           write_queue=queue)
+    queue.close()
+    assert c.calls == expected.calls
+    assert writer.num_written == 10
+
+
+def test_write_queue_order():
+    written = []
+    queue = batch.WriteQueue(size=2)
+    for i in range(20):
+        queue.put(written.append, i)
+    queue.close()
+    assert written == range(20)
+    assert sorted(queue.stats()) == ['parse_busy', 'parse_wait',
+                                     'write_busy', 'write_wait']
+
+
+def test_write_queue_error():
+    def fail():
+        raise ValueError('no')
+    written = []
+    queue = batch.WriteQueue(size=1)
+    queue.put(fail)
+    queue.put(written.append, 1)
+    try:
+        queue.close()
+    except ValueError:
+        pass
+    else:
+        assert False, 'the error was not raised'
+    # The thread kept going after the error.
+    assert written == [1]
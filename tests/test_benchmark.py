@@ -0,0 +1,63 @@
+# -*- encoding: utf-8 -*-
+"""Tests for the parser benchmark.
+"""
+
+from docket import benchmark, corpus
+
+import os
+import shutil
+import tempfile
+
+
+BASELINE = {'lines_per_sec': 1000.0,
+            'cases_per_sec': 100.0,
+            'peak_rss_kb': 20000,
+            }
+
+
+def result(**kwds):
+    r = dict(BASELINE, engine='regex')
+    r.update(kwds)
+    return r
+
+
+def test_no_regression():
+    assert benchmark.compare(result(), BASELINE) == []
+
+
+def test_within_tolerance():
+    r = result(lines_per_sec=950.0, peak_rss_kb=21000)
+    assert benchmark.compare(r, BASELINE, 0.1) == []
+
+
+def test_slower():
+    r = result(lines_per_sec=800.0)
+    regressions = benchmark.compare(r, BASELINE, 0.1)
+    assert len(regressions) == 1
+    assert 'lines_per_sec' in regressions[0]
+
+
+def test_more_memory():
+    r = result(peak_rss_kb=30000)
+    regressions = benchmark.compare(r, BASELINE, 0.1)
+    assert len(regressions) == 1
+    assert 'peak_rss_kb' in regressions[0]
+
+
+def test_faster_is_not_a_regression():
+    r = result(lines_per_sec=5000.0, cases_per_sec=500.0, peak_rss_kb=100)
+    assert benchmark.compare(r, BASELINE, 0.0) == []
+
+
+def test_run():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'corpus.vtr')
+        corpus.write_corpus(filename, 20, error_rate=0.1)
+        r = benchmark.run(filename, engine='regex', repeat=1)
+    finally:
+        shutil.rmtree(tmpdir)
+    assert r['cases'] == 20
+    assert r['errors'] > 0
+    assert r['lines_per_sec'] > 0
+    assert r['fields']['counts']['c'] == 20
@@ -0,0 +1,84 @@
+"""Tests for the book statistics.
+"""
+
+import datetime
+
+from docket import books
+
+
+def make_case(book, page, date):
+    return {'book': book, 'page': page, 'date': date}
+
+
+def test_stats():
+    stats = books.BookStats()
+    stats.add(make_case('1902/6', 170, datetime.datetime(1903, 3, 30)))
+    stats.add(make_case('1902/6', 168, None))
+    stats.add(make_case('1902/6', 171, datetime.datetime(1903, 3, 28)))
+    stats.add(make_case('1902/7', 1, datetime.datetime(1903, 4, 1)))
+    assert list(stats.books) == ['1902/6', '1902/7']
+    assert stats.books['1902/6'] == {
+        'num_cases': 3,
+        'first_page': 168,
+        'last_page': 171,
+        'first_date': datetime.datetime(1903, 3, 28),
+        'last_date': datetime.datetime(1903, 3, 30),
+        }
+
+
+def test_stats_without_dates():
+    stats = books.BookStats()
+    stats.add(make_case('1902/6', 170, None))
+    assert stats.books['1902/6']['first_date'] is None
+    assert stats.books['1902/6']['last_date'] is None
+
+
+def test_summarize():
+    book = {'files': [
+        {'filename': 'a.vtr', 'num_cases': 3,
+         'first_page': 1, 'last_page': 10,
+         'first_date': None, 'last_date': None,
+         },
+        {'filename': 'b.vtr', 'num_cases': 2,
+         'first_page': 11, 'last_page': 12,
+         'first_date': datetime.datetime(1903, 1, 2),
+         'last_date': datetime.datetime(1903, 5, 6),
+         },
+        ]}
+    assert books.summarize(book) == {
+        'num_cases': 5,
+        'first_page': 1,
+        'last_page': 12,
+        'first_date': datetime.datetime(1903, 1, 2),
+        'last_date': datetime.datetime(1903, 5, 6),
+        }
+
+
+def test_summarize_old_book():
+    # Books loaded before the statistics were kept have no files.
+    assert books.summarize({'_id': '1902/6', 'year': 1902}) == {
+        'num_cases': 0,
+        'first_page': None,
+        'last_page': None,
+        'first_date': None,
+        'last_date': None,
+        }
+
+
+def test_merge():
+    stats = books.BookStats()
+    stats.add(make_case('1902/6', 170, None))
+    other = books.BookStats()
+    other.add(make_case('1902/6', 168, datetime.datetime(1903, 3, 30)))
+    other.add(make_case('1902/7', 1, None))
+    for book, book_stats in other.books.items():
+        stats.merge(book, book_stats)
+    assert list(stats.books) == ['1902/6', '1902/7']
+    assert stats.books['1902/6'] == {
+        'num_cases': 2,
+        'first_page': 168,
+        'last_page': 170,
+        'first_date': datetime.datetime(1903, 3, 30),
+        'last_date': datetime.datetime(1903, 3, 30),
+        }
+    assert stats.books['1902/7'] == other.books['1902/7']
@@ -0,0 +1,47 @@
+# -*- encoding: utf-8 -*-
+"""Tests for the synthetic VTR corpus generator.
+"""
+
+from docket import corpus, vtr
+
+
+def parse(lines):
+    p = vtr.Parser(trace=True)
+    cases = list(p.parse(lines))
+    return p, cases
+
+
+def test_repeatable():
+    first = list(corpus.Generator(seed=3).lines(20))
+    second = list(corpus.Generator(seed=3).lines(20))
+    assert first == second
+    assert first != list(corpus.Generator(seed=4).lines(20))
+
+
+def test_parses_cleanly():
+    p, cases = parse(corpus.Generator().lines(200))
+    assert len(cases) == 200
+    assert p.errors == []
+
+
+def test_every_keyword():
+    p, cases = parse(corpus.Generator().lines(500))
+    assert set(p.stats.counts) == set(vtr.FIELD_GRAMMARS)
+
+
+def test_name_options():
+    text = u'\n'.join(corpus.Generator().lines(500))
+    for option in [u'alias=', u'title=', u'suffix=']:
+        assert option in text
+
+
+def test_malformed_lines():
+    p, cases = parse(corpus.Generator(error_rate=0.1).lines(200))
+    assert len(cases) == 200
+    assert p.error_count > 100
+    assert set(p.stats.errors) - set(vtr.FIELD_GRAMMARS)
+
+
+def test_engines_agree():
+    lines = list(corpus.Generator(error_rate=0.05).lines(200))
+    assert vtr.compare_engines(lines) == []
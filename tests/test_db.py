@@ -0,0 +1,168 @@
+"""Tests for the database connections, error handler, and job records.
+"""
+
+import datetime
+import pickle
+
+from docket import db
+
+
+class FakeConnection(object):
+
+    def __init__(self, host, port, max_pool_size):
+        self.args = (host, port, max_pool_size)
+
+    def __getattr__(self, name):
+        return (self, name)
+
+
+def with_fake_connection(func):
+    def wrapper():
+        orig_connection, orig_getpid = db.Connection, db.os.getpid
+        db.Connection = FakeConnection
+        db._connections.clear()
+        try:
+            func()
+        finally:
+            db.Connection, db.os.getpid = orig_connection, orig_getpid
+            db._connections.clear()
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+
+@with_fake_connection
+def test_shared():
+    assert db.get_connection() is db.get_connection()
+
+
+@with_fake_connection
+def test_by_server():
+    a = db.get_connection('a', 1)
+    b = db.get_connection('b', 1, pool_size=2)
+    assert a is not b
+    assert b.args == ('b', 1, 2)
+
+
+@with_fake_connection
+def test_new_after_fork():
+    parent = db.get_connection()
+    db.os.getpid = lambda: -1
+    child = db.get_connection()
+    assert child is not parent
+    assert child is db.get_connection()
+    # The parent's connection is forgotten.
+    assert len(db._connections) == 1
+
+
+@with_fake_connection
+def test_factory():
+    factory = db.DBFactory('docket', host='h', port=2, pool_size=3)
+    conn, name = factory()
+    assert name == 'docket'
+    assert conn.args == ('h', 2, 3)
+    assert factory() == (conn, name)
+    # Factories are sent to the workers.
+    copied = pickle.loads(pickle.dumps(factory))
+    assert copied() == (conn, name)
+
+
+class FakeErrors(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def insert(self, docs):
+        self.calls.append(('insert', [dict(d) for d in docs]))
+
+    def update(self, spec, doc):
+        self.calls.append(('update', spec, doc))
+
+
+class FakeDB(object):
+
+    def __init__(self):
+        self.errors = FakeErrors()
+
+
+def make_handler(**kwds):
+    fake = FakeDB()
+    return db.ErrorHandler(lambda: fake, 'job', 'file.vtr', **kwds), fake
+
+
+def test_errors_buffered():
+    handler, fake = make_handler()
+    handler('a')
+    assert fake.errors.calls == []
+    handler.flush()
+    assert fake.errors.calls == [('insert', [{'job_id': 'job',
+                                              'filename': 'file.vtr',
+                                              'message': 'a',
+                                              'count': 1,
+                                              'lines': [],
+                                              }])]
+
+
+def test_errors_collapsed():
+    handler, fake = make_handler()
+    for line in [3, 5, 9]:
+        handler('a', line=line)
+    handler('b')
+    handler.flush()
+    docs = fake.errors.calls[0][1]
+    assert [(d['message'], d['count'], d['lines']) for d in docs] == \
+        [('a', 3, [3, 5, 9]), ('b', 1, [])]
+
+
+def test_errors_buffer_size():
+    handler, fake = make_handler(buffer_size=2)
+    handler('a')
+    handler('b')
+    handler('a')
+    assert fake.errors.calls == []
+    handler('c')
+    assert len(fake.errors.calls) == 1
+    assert [d['message'] for d in fake.errors.calls[0][1]] == ['a', 'b']
+
+
+def test_errors_after_flush():
+    # A message already written is counted in the same record.
+    handler, fake = make_handler()
+    handler('a', line=1)
+    handler.flush()
+    handler('a', line=2)
+    handler.flush()
+    assert fake.errors.calls[1] == (
+        'update',
+        {'job_id': 'job', 'message': 'a'},
+        {'$inc': {'count': 1}, '$pushAll': {'lines': [2]}},
+        )
+
+
+def test_errors_max_lines():
+    handler, fake = make_handler(max_lines=2)
+    for line in range(5):
+        handler('a', line=line)
+    handler.flush()
+    handler('a', line=10)
+    handler.flush()
+    assert fake.errors.calls[0][1][0]['lines'] == [0, 1]
+    assert fake.errors.calls[0][1][0]['count'] == 5
+    assert fake.errors.calls[1][2]['$pushAll'] == {'lines': []}
+
+
+def test_job_rates():
+    start = datetime.datetime(2012, 1, 1, 12, 0, 0)
+    job = {'start': start,
+           'end': start + datetime.timedelta(seconds=4),
+           'num_cases': 100,
+           'bytes_read': 2000,
+           }
+    assert db.get_job_rates(job) == {'elapsed': 4.0,
+                                     'cases_per_second': 25.0,
+                                     'bytes_per_second': 500.0,
+                                     }
+
+
+def test_job_rates_unfinished():
+    job = {'start': datetime.datetime(2012, 1, 1), 'status': 'running'}
+    assert db.get_job_rates(job) is None
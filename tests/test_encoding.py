@@ -4,31 +4,95 @@ from docket import encodings
 from docket import tasks
 
 
-def check_one_participant(participant, case):
-    assert 'encoding' in participant
-    assert participant['case'] == case['_id']
+CASE = {'participants': [{'first_name': u'Douglas',
+                          'middle_name': u'Richard',
+                          'last_name': u'Hellmann',
+                          'full_name': u'Douglas Richard Hellmann',
+                          'role': 'defendant',
+                          },
+                         ],
+        'book': 'test',
+        'number': '0',
+        '_id': 'case-id-goes-here',
+        }
 
 
-def test():
+def encode(case):
     errors = []
-    c = {'participants': [{'first_name': u'Douglas',
-                           'middle_name': u'Richard',
-                           'last_name': u'Hellmann',
-                           },
-                          ],
-         'book': 'test',
-         'number': '0',
-         '_id': 'case-id-goes-here',
-         }
     encoded_participants = list(
-        tasks.get_encoded_participants(c,
+        tasks.get_encoded_participants(case,
                                        error_handler=errors.append,
                                        )
         )
-    actual_encodings = set(p['encoding'] for p in encoded_participants)
-    assert actual_encodings == set(encodings.ENCODERS.keys())
-    for p in encoded_participants:
-        yield check_one_participant, p, c
+    return encoded_participants, errors
+
+
+def check_one_encoding(participant, name):
+    for field in tasks.FIELDS_TO_ENCODE:
+        assert participant['encoded'][name][field] == \
+            encodings.ENCODERS[name](participant[field])
+
+
+def test():
+    encoded_participants, errors = encode(CASE)
+    assert errors == []
+    assert len(encoded_participants) == 1
+    p = encoded_participants[0]
+    assert p['case'] == CASE['_id']
+    assert p['first_name'] == u'Douglas'
+    assert set(p['encoded']) == set(encodings.ENCODERS.keys())
+    for name in encodings.ENCODERS:
+        yield check_one_encoding, p, name
+
+
+def old_documents(participant):
+    "Make the documents stored for participant by the old loader."
+    docs = []
+    for name in sorted(participant['encoded']):
+        doc = dict(participant, encoding=name, _id=len(docs))
+        del doc['encoded']
+        doc.update(participant['encoded'][name])
+        docs.append(doc)
+    return docs
+
+
+def test_upgrade():
+    participant = encode(CASE)[0][0]
+    docs = old_documents(participant)
+    upgraded = list(tasks.upgrade_participants(docs))
+    assert upgraded == [participant]
+
+
+def test_upgrade_converted():
+    participant = encode(CASE)[0][0]
+    participant['_id'] = 'id'
+    assert list(tasks.upgrade_participants([participant])) == [participant]
+
+
+def test_upgrade_several():
+    case = dict(CASE)
+    case['participants'] = CASE['participants'] + [
+        {'first_name': u'Tom', 'middle_name': '', 'last_name': u'Thomas',
+         'full_name': u'Tom Thomas', 'role': 'witness'},
+        ]
+    participants, errors = encode(case)
+    docs = []
+    for p in participants:
+        docs.extend(old_documents(p))
+    assert list(tasks.upgrade_participants(docs)) == participants
+
+
+def test_name_query():
+    q = encodings.make_name_query('normalized', first_name=u'Doug.',
+                                  last_name='')
+    assert q == {'encoded.normalized.first_name': u'doug'}
+
+
+def test_name_query_several_encodings():
+    q = encodings.make_name_query('metaphone', last_name=u'Schmidt')
+    assert q == {'encoded.metaphone.last_name':
+                 {'$in': encodings.metaphone(u'Schmidt')}}
+    assert len(encodings.metaphone(u'Schmidt')) == 2
 
 
 def test_fields():
@@ -0,0 +1,107 @@
+# -*- encoding: utf-8 -*-
+"""Tests for the on-disk parse cache.
+"""
+
+from docket import corpus, parsecache, source, vtr
+
+import os
+import shutil
+import tempfile
+
+
+def setup():
+    global tmpdir
+    tmpdir = tempfile.mkdtemp()
+
+
+def teardown():
+    shutil.rmtree(tmpdir)
+
+
+def make_cache(name):
+    return parsecache.ParseCache(os.path.join(tmpdir, name))
+
+
+def write_corpus(name, seed=0):
+    filename = os.path.join(tmpdir, name)
+    corpus.write_corpus(filename, 30, seed=seed, error_rate=0.05)
+    return filename
+
+
+def parse(cache, filename, **kwds):
+    parser = vtr.Parser(**kwds)
+    with source.MappedFile(filename) as f:
+        cases = list(cache.parse(filename, parser, f))
+    return parser, cases
+
+
+def test_hit():
+    cache = make_cache('hit')
+    filename = write_corpus('hit.vtr')
+    parser1, cases1 = parse(cache, filename)
+    key = cache.key(filename, parser1)
+    assert key in cache
+    parser2, cases2 = parse(cache, filename)
+    assert cases2 == cases1
+    assert parser2.errors == parser1.errors
+    assert parser2.error_count == parser1.error_count > 0
+
+
+def test_same_as_parser():
+    cache = make_cache('same')
+    filename = write_corpus('same.vtr')
+    with source.MappedFile(filename) as f:
+        parser = vtr.Parser()
+        expected = list(parser.parse(f))
+    for i in range(2):
+        p, cases = parse(cache, filename)
+        assert cases == expected
+        assert p.errors == parser.errors
+
+
+def test_cached_errors_go_to_sink():
+    cache = make_cache('sink')
+    filename = write_corpus('sink.vtr')
+    parser1, cases1 = parse(cache, filename, max_errors=2)
+    assert parser1.dropped_errors > 0
+    found = []
+    parser2, cases2 = parse(cache, filename, error_sink=found.append)
+    # All of the errors are saved, even the ones that were dropped
+    assert len(found) == parser1.error_count
+    assert found[:2] == parser1.errors
+
+
+def test_changed_file():
+    cache = make_cache('changed')
+    filename = write_corpus('changed.vtr')
+    parser1, cases1 = parse(cache, filename)
+    write_corpus('changed.vtr', seed=1)
+    parser2, cases2 = parse(cache, filename)
+    assert cases2 != cases1
+    assert len(os.listdir(cache.directory)) == 2
+
+
+def test_options_in_key():
+    cache = make_cache('options')
+    filename = write_corpus('options.vtr')
+    keys = set(cache.key(filename, vtr.Parser(**kwds))
+               for kwds in [{},
+                            {'engine': 'regex'},
+                            {'records': True},
+                            {'source': filename},
+                            ])
+    assert len(keys) == 4
+    other = parsecache.ParseCache(cache.directory,
+                                  version=vtr.PARSER_VERSION + 1)
+    assert other.key(filename, vtr.Parser()) not in keys
+
+
+def test_incomplete_not_saved():
+    cache = make_cache('incomplete')
+    filename = write_corpus('incomplete.vtr')
+    parser = vtr.Parser()
+    with source.MappedFile(filename) as f:
+        cases = cache.parse(filename, parser, f)
+        next(cases)
+        cases.close()
+    assert os.listdir(cache.directory) == []
@@ -0,0 +1,76 @@
+# -*- encoding: utf-8 -*-
+"""Tests for the compact case records.
+"""
+
+from docket import corpus, records, vtr
+
+from nose.tools import assert_raises
+
+import pickle
+
+from tests.test_vtr_engines import CORPUS
+
+
+def parse(lines, **kwds):
+    p = vtr.Parser(**kwds)
+    cases = list(p.parse(lines))
+    return cases, p.errors
+
+
+def check_same_as_dicts(lines, engine):
+    expected_cases, expected_errors = parse(lines, engine=engine)
+    cases, errors = parse(lines, engine=engine, records=True)
+    assert all(isinstance(c, records.Case) for c in cases)
+    assert [c.to_document() for c in cases] == expected_cases
+    assert errors == expected_errors
+
+
+def test_same_as_dicts():
+    generated = list(corpus.Generator().lines(50))
+    for engine in sorted(vtr.ENGINES):
+        yield check_same_as_dicts, CORPUS.splitlines(), engine
+        yield check_same_as_dicts, generated, engine
+
+
+def test_nested_documents():
+    cases, errors = parse(CORPUS.splitlines(), records=True)
+    doc = cases[0].to_document()
+    assert isinstance(doc['participants'][0], dict)
+    assert isinstance(doc['sentence_rendered'][0], dict)
+
+
+def test_missing_field():
+    s = records.Sentence(type='fine')
+    assert 'date' not in s
+    assert s.get('date') is None
+    assert_raises(KeyError, lambda: s['date'])
+    assert s.to_document() == {'type': 'fine'}
+
+
+def test_setdefault():
+    c = records.Case()
+    c.setdefault('note', []).append('one')
+    c.setdefault('note', []).append('two')
+    assert c['note'] == ['one', 'two']
+
+
+def test_unknown_field():
+    p = records.Participant()
+    assert_raises(KeyError, p.__setitem__, 'no_such_field', 1)
+
+
+def test_pickle():
+    cases, errors = parse(CORPUS.splitlines(), records=True)
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        copy = pickle.loads(pickle.dumps(cases[1], protocol))
+        assert copy == cases[1]
+        assert copy.participants[0].role == 'defendant'
+
+
+def test_chunks():
+    lines = CORPUS.splitlines()
+    expected, errors = parse(lines, records=True)
+    cases = []
+    for chunk in vtr.split_chunks(lines, 1, records=True):
+        cases.extend(vtr.parse_chunk(chunk)[0])
+    assert cases == expected
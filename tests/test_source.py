@@ -0,0 +1,207 @@
+# -*- encoding: utf-8 -*-
+"""Tests for reading VTR input files.
+"""
+
+from docket import source, vtr
+
+from nose.plugins.skip import SkipTest
+
+import bz2
+import codecs
+import gzip
+import os
+import shutil
+import tempfile
+
+
+TEXT = u"""b 1902/6
+pg 170\r
+c 172\r\nd Charley Thomas
+d Renée Smith\x0cl Hoyt Street
+n note\rn other note n third note
+
+ad 30 Mar 1903"""
+
+
+def setup():
+    global tmpdir
+    tmpdir = tempfile.mkdtemp()
+
+
+def teardown():
+    shutil.rmtree(tmpdir)
+
+
+def write_file(name, text):
+    filename = os.path.join(tmpdir, name)
+    with open(filename, 'wb') as f:
+        f.write(text.encode('utf-8'))
+    return filename
+
+
+def test_same_lines_as_codecs():
+    filename = write_file('lines.vtr', TEXT)
+    with codecs.open(filename, 'r', encoding='utf-8') as f:
+        expected = list(f)
+    with source.MappedFile(filename) as f:
+        actual = list(f)
+    assert actual == expected
+    assert all(isinstance(l, unicode) for l in actual)
+
+
+def check_block_size(filename, block_size, expected):
+    f = source.MappedFile(filename)
+    f.block_size = block_size
+    try:
+        assert list(f) == expected
+    finally:
+        f.close()
+
+
+def test_block_boundaries():
+    filename = write_file('blocks.vtr', TEXT)
+    with codecs.open(filename, 'r', encoding='utf-8') as f:
+        expected = list(f)
+    for block_size in range(1, len(TEXT) + 2):
+        yield check_block_size, filename, block_size, expected
+
+
+def test_trailing_newline():
+    filename = write_file('trailing.vtr', u'b 1902/6\nc 1\n')
+    with source.MappedFile(filename) as f:
+        assert list(f) == [u'b 1902/6\n', u'c 1\n']
+
+
+def test_empty_file():
+    filename = write_file('empty.vtr', u'')
+    with source.MappedFile(filename) as f:
+        assert list(f) == []
+
+
+def write_compressed(name, text, compressor):
+    filename = os.path.join(tmpdir, name)
+    f = compressor(filename, 'wb')
+    try:
+        f.write(text.encode('utf-8'))
+    finally:
+        f.close()
+    return filename
+
+
+def xz_file(filename, mode):
+    if source.lzma is None:
+        raise SkipTest('no lzma module')
+    return source.lzma.LZMAFile(filename, mode)
+
+COMPRESSORS = [('gz', gzip.GzipFile),
+               ('bz2', bz2.BZ2File),
+               ('xz', xz_file),
+               ]
+
+
+def check_compressed(ext, compressor):
+    filename = write_compressed('lines.vtr.' + ext, TEXT, compressor)
+    with source.open_lines(filename) as f:
+        assert isinstance(f, source.CompressedFile)
+        actual = list(f)
+    assert actual == TEXT.splitlines(True)
+
+
+def test_compressed():
+    for ext, compressor in COMPRESSORS:
+        yield check_compressed, ext, compressor
+
+
+def check_compressed_block_size(filename, block_size, expected):
+    f = source.CompressedFile(filename, gzip.GzipFile)
+    f.block_size = block_size
+    try:
+        assert list(f) == expected
+    finally:
+        f.close()
+
+
+def test_compressed_block_boundaries():
+    filename = write_compressed('blocks.vtr.gz', TEXT, gzip.GzipFile)
+    expected = TEXT.splitlines(True)
+    for block_size in range(1, len(TEXT) + 2):
+        yield check_compressed_block_size, filename, block_size, expected
+
+
+def test_not_compressed():
+    filename = write_file('plain.vtr', TEXT)
+    with source.open_lines(filename) as f:
+        assert isinstance(f, source.MappedFile)
+
+
+def test_compressed_empty_file():
+    filename = write_compressed('empty.vtr.gz', u'', gzip.GzipFile)
+    with source.open_lines(filename) as f:
+        assert list(f) == []
+
+
+CASES = u"""
+b 1902/6
+pg 170
+c 172
+d Renée Smith
+ad 31 Foo 1903
+
+c 173
+d Charley Thomas
+x unknown
+pg 171
+c 174
+d Tom Thomas
+"""
+
+
+def parse_cases(filename, **kwds):
+    parser = vtr.Parser(**kwds)
+    with source.open_lines(filename) as f:
+        return list(parser.parse(f))
+
+
+def test_read_lines():
+    filename = write_file('cases.vtr', CASES)
+    copied = parse_cases(filename)
+    ranges = parse_cases(filename, source=filename)
+    assert len(ranges) == len(copied) == 3
+    for c, r in zip(copied, ranges):
+        assert r['lines']['source'] == filename
+        lines = source.read_lines(r['lines'])
+        assert lines[0] == c['lines'][0]
+        assert lines[-1] == c['lines'][-1]
+        # Lines with errors are not copied, but they are in the range
+        assert [l for l in lines if l in c['lines']] == c['lines']
+
+
+def test_read_lines_compressed():
+    filename = write_file('plain-cases.vtr', CASES)
+    compressed = write_compressed('cases.vtr.bz2', CASES, bz2.BZ2File)
+    expected = parse_cases(filename, source=filename)
+    actual = parse_cases(compressed, source=compressed)
+    assert [c['lines']['start'] for c in actual] == \
+        [c['lines']['start'] for c in expected]
+    for c, e in zip(actual, expected):
+        assert source.read_lines(c['lines']) == source.read_lines(e['lines'])
+
+
+def test_read_lines_copied():
+    lines = [(1, u'b 1902/6')]
+    assert source.read_lines(lines) is lines
+
+
+def parse_chunks(filename, chunk_size):
+    cases = []
+    with source.MappedFile(filename) as f:
+        for chunk in vtr.split_chunks(f, chunk_size, source=filename):
+            cases.extend(vtr.parse_chunk(chunk)[0])
+    return cases
+
+
+def test_chunk_ranges():
+    filename = write_file('chunks.vtr', CASES)
+    expected = parse_cases(filename, source=filename)
+    for chunk_size in range(1, len(CASES.splitlines()) + 1):
+        assert parse_chunks(filename, chunk_size) == expected
@@ -0,0 +1,84 @@
+"""Tests for the loader tasks.
+"""
+
+from docket import tasks
+
+
+def make_result(start, num_cases, books, **kwds):
+    result = {'start': start,
+              'errors': [],
+              'num_errors': 0,
+              'dropped_errors': 0,
+              'num_cases': num_cases,
+              'num_found': num_cases,
+              'num_written': num_cases * 2,
+              'times': {'parse': 1.0, 'encode': 0.5, 'write': 0.25},
+              'case_counts': {'added': num_cases, 'changed': 0,
+                              'unchanged': 0, 'moved': 0, 'removed': 0},
+              'books': books,
+              }
+    result.update(kwds)
+    return result
+
+
+def book(num_cases, first_page, last_page):
+    return {'num_cases': num_cases,
+            'first_page': first_page,
+            'last_page': last_page,
+            'first_date': None,
+            'last_date': None,
+            }
+
+
+def test_merge_chunk_results():
+    # The results arrive in the order the chunks finish.
+    results = [
+        make_result(100, 2, [['1', book(2, 2, 3)]],
+                    num_errors=2, dropped_errors=1, errors=['b']),
+        make_result(1, 2, [['1', book(2, 1, 2)]],
+                    num_errors=1, errors=['a']),
+        ]
+    merged = tasks.merge_chunk_results(results)
+    assert merged['num_cases'] == 4
+    assert merged['num_found'] == 4
+    assert merged['case_counts']['added'] == 4
+    assert merged['num_written'] == 8
+    assert merged['times'] == {'parse': 2.0, 'encode': 1.0, 'write': 0.5}
+    assert merged['num_errors'] == 3
+    assert merged['dropped_errors'] == 1
+    assert merged['errors'] == ['a', 'b']
+    assert merged['books'].books == {'1': book(4, 1, 3)}
+
+
+def test_merge_failed_chunk():
+    # A chunk that could not start only has its errors.
+    results = [make_result(1, 2, []),
+               {'start': 9, 'errors': ['no database']},
+               ]
+    merged = tasks.merge_chunk_results(results)
+    assert merged['num_cases'] == 2
+    assert merged['errors'] == ['no database']
+
+
+def test_merge_no_chunks():
+    merged = tasks.merge_chunk_results([])
+    assert merged['num_cases'] == 0
+
+
+def test_job_record():
+    results = {'status': 'done', 'num_cases': 3, 'books': {},
+               'errors': ['a'],
+               }
+    record = tasks.job_record(results)
+    assert record['status'] == 'done'
+    assert record['num_cases'] == 3
+    assert record['times'] is None
+    assert 'books' not in record
+    assert 'errors' not in record
+    assert 'end' in record
+
+
+def test_first_line():
+    assert tasks.get_first_line({'lines': [(5, u'c 1'), (6, u'd x')]}) == 5
+    assert tasks.get_first_line({'lines': {'first': 7, 'last': 9}}) == 7
+    assert tasks.get_first_line({}) is None
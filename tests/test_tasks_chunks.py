@@ -0,0 +1,175 @@
+# -*- encoding: utf-8 -*-
+"""Tests for loading a file in chunks.
+"""
+
+from docket import tasks
+from tests.test_tasks_load import INPUT, Errors, Load, counts, \
+    check_lost_participants
+
+
+class ChunkLoad(Load):
+    """Loads a file in chunks, running the tasks here in the order
+    given by the reorder function.
+    """
+
+    def __init__(self):
+        super(ChunkLoad, self).__init__()
+        self.finished = []
+        self.db_factory = lambda: self.db
+
+    def __call__(self, text, chunk_size=4, reorder=list, **kwds):
+        with open(self.filename, 'w') as f:
+            f.write(text.encode('utf-8'))
+        self.num_jobs += 1
+        self.errors = Errors()
+        self.db.jobs.insert({'_id': self.num_jobs, 'status': 'queued'})
+        started = []
+        tasks.load_chunk.delay = lambda *args, **kwds: \
+            started.append((args, kwds))
+        tasks.finish_chunks.apply_async = lambda args, kwds, task_id: \
+            self.finished.append(tasks.finish_chunks(**kwds))
+        try:
+            tasks.start_chunks(self.filename, lambda: self.db_factory(),
+                               self.num_jobs, self.errors,
+                               chunk_size=chunk_size, **kwds)
+            for args, kwds in reorder(started):
+                tasks.load_chunk(*args, **kwds)
+        finally:
+            del tasks.load_chunk.delay
+            del tasks.finish_chunks.apply_async
+        assert len(self.finished) == self.num_jobs
+        return self.finished[-1]
+
+
+def with_load(func):
+    def wrapper():
+        load = ChunkLoad()
+        try:
+            func(load)
+        finally:
+            load.cleanup()
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+
+@with_load
+def test_load(load):
+    results = load(INPUT)
+    assert results['status'] == 'done'
+    assert counts(results) == (3, 0, 0, 0, 0)
+    assert load.db.cases.count() == 3
+    assert load.db.participants.count() == 3
+    job = load.db.jobs.find_one({'_id': 1})
+    assert job['status'] == 'done'
+    assert job['num_chunks'] == job['chunks_done'] == 2
+    # The results of the chunks are removed when they are merged.
+    assert load.db.chunks.count() == 0
+
+
+def stored_cases(load):
+    cases = load.db.cases.find().sort([('_id', 1)])
+    for case in cases:
+        del case['filename']
+        # Only the chunks stamp the unchanged cases.
+        del case['last_load_job_id']
+    return cases
+
+
+@with_load
+def test_same_as_serial(load):
+    serial = Load()
+    try:
+        for text in [INPUT,
+                     INPUT,
+                     INPUT.replace('c 173', 'c 175'),
+                     INPUT.replace('Charley Thomas', 'Charley Thomas\nn new'),
+                     ]:
+            expected = serial(text)
+            # The last chunk finishes first.
+            results = load(text, reorder=reversed)
+            assert counts(results) == counts(expected)
+            assert stored_cases(load) == stored_cases(serial)
+    finally:
+        serial.cleanup()
+
+
+@with_load
+def test_removed(load):
+    load(INPUT)
+    results = load(INPUT.replace('c 173', 'c 175'))
+    assert counts(results) == (1, 0, 2, 0, 1)
+    assert load.db.cases.find_one({'_id': '1902/6/173'}) is None
+    assert load.db.participants.find({'case': '1902/6/173'}) == []
+    # The unchanged cases were stamped by the job that found them.
+    case = load.db.cases.find_one({'_id': '1902/6/172'})
+    assert case['load_job_id'] == 1
+    assert case['last_load_job_id'] == 2
+
+
+@with_load
+def test_lost_participants(load):
+    check_lost_participants(load)
+
+
+@with_load
+def test_duplicates(load):
+    results = load(INPUT + u'c 172\nd Charley Thomas\n')
+    assert results['errors'] == []
+    assert load.errors.messages == ['1 cases are in %s more than once' %
+                                    load.filename]
+
+
+@with_load
+def test_failed_chunk(load):
+    load(INPUT)
+    calls = []
+
+    def db_factory():
+        calls.append(1)
+        # The second chunk cannot get to the database to load its
+        # cases, but can to say it is done.
+        if len(calls) == 4:
+            raise RuntimeError('no database')
+        return load.db
+    load.db_factory = db_factory
+    results = load(INPUT.replace('c 173', 'c 175'))
+    assert results['status'] == 'failed'
+    assert 'no database' in results['errors'][0]
+    assert load.db.jobs.find_one({'_id': 2})['status'] == 'failed'
+    # Nothing is removed when a chunk fails.
+    assert results['case_counts']['removed'] == 0
+    assert load.db.cases.find_one({'_id': '1902/6/173'}) is not None
+
+
+@with_load
+def test_missing_chunk(load):
+    # A chunk that cannot save its results is still counted as done.
+    insert = load.db.chunks.insert
+
+    def fail_once(doc, safe=False):
+        load.db.chunks.insert = insert
+        raise RuntimeError('no room')
+    load.db.chunks.insert = fail_once
+    results = load(INPUT)
+    assert results['status'] == 'failed'
+    assert results['errors'] == ['The results of 1 chunks of %s are '
+                                 'missing' % load.filename]
+
+
+@with_load
+def test_finish_fails(load):
+    load(INPUT)
+    find = load.db.cases.find
+
+    def fail(spec=None, fields=None):
+        if 'last_load_job_id' in (spec or {}):
+            raise RuntimeError('lost the server')
+        return find(spec, fields)
+    load.db.cases.find = fail
+    results = load(INPUT.replace('c 173', 'c 175'))
+    assert results['status'] == 'failed'
+    assert results['errors'] == ['Could not finish loading %s: '
+                                 'lost the server' % load.filename]
+    assert load.db.jobs.find_one({'_id': 2})['status'] == 'failed'
+    # Once by each chunk, and once at the end.
+    assert load.errors.flushed == 3
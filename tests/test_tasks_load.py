@@ -0,0 +1,269 @@
+# -*- encoding: utf-8 -*-
+"""Tests for loading a file into the database and loading it again.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+
+from docket import source, tasks
+from tests import fakemongo
+
+
+INPUT = u"""b 1902/6
+pg 170
+c 172
+d Charley Thomas
+sr 5 F
+c 173
+d Murphey Lane
+sr 5 F
+pg 171
+c 174
+d Tom Thomas
+sr 5 F
+"""
+
+
+class Errors(object):
+
+    def __init__(self):
+        self.messages = []
+        self.flushed = 0
+
+    def __call__(self, message, line=None):
+        self.messages.append(message)
+
+    def flush(self):
+        self.flushed += 1
+
+
+class Load(object):
+    "A file to load into a fake database, again and again."
+
+    def __init__(self):
+        self.dirname = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dirname, 'test.vtr')
+        self.db = fakemongo.Database()
+        self.num_jobs = 0
+
+    def cleanup(self):
+        shutil.rmtree(self.dirname)
+
+    def __call__(self, text, **kwds):
+        with open(self.filename, 'w') as f:
+            f.write(text.encode('utf-8'))
+        self.num_jobs += 1
+        self.errors = Errors()
+        return tasks.parse_file(self.filename, lambda: self.db,
+                                self.num_jobs, self.errors, **kwds)
+
+    def lines(self, case_id):
+        case = self.db.cases.find_one({'_id': case_id})
+        return [text for num, text in source.read_lines(case['lines'])]
+
+
+def with_load(func):
+    def wrapper():
+        load = Load()
+        try:
+            func(load)
+        finally:
+            load.cleanup()
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+
+def counts(results):
+    c = results['case_counts']
+    return (c['added'], c['changed'], c['unchanged'], c['moved'],
+            c['removed'])
+
+
+@with_load
+def test_added(load):
+    results = load(INPUT)
+    assert results['status'] == 'done'
+    assert counts(results) == (3, 0, 0, 0, 0)
+    assert sorted(c['_id'] for c in load.db.cases.find()) == \
+        ['1902/6/172', '1902/6/173', '1902/6/174']
+    assert load.db.participants.count() == 3
+    assert load.errors.flushed == 1
+
+
+@with_load
+def test_unchanged(load):
+    load(INPUT)
+    results = load(INPUT)
+    assert counts(results) == (0, 0, 3, 0, 0)
+    assert results['num_written'] == 0
+    # The cases still refer to the job that wrote them.
+    assert load.db.cases.find_one({'_id': '1902/6/172'})['load_job_id'] == 1
+
+
+@with_load
+def test_changed(load):
+    load(INPUT)
+    results = load(INPUT.replace('Murphey', 'Murphy'))
+    assert counts(results) == (0, 1, 2, 0, 0)
+    names = [p['full_name']
+             for p in load.db.participants.find({'case': '1902/6/173'})]
+    assert names == ['Murphy Lane']
+
+
+LOST_PARTICIPANTS = u"""b 1902/6
+pg 170
+c 1
+d Charley Thomas
+w Bob Smith
+c 2
+d Tom Thomas
+"""
+
+
+def check_lost_participants(load):
+    load(LOST_PARTICIPANTS)
+    assert len(load.db.participants.find({'case': '1902/6/1'})) == 2
+    # A correction takes the people out of case 1.
+    results = load(LOST_PARTICIPANTS.replace(
+        'd Charley Thomas\nw Bob Smith\n', ''))
+    # Case 2 moved up.
+    assert counts(results) == (0, 1, 0, 1, 0)
+    assert load.db.cases.find_one({'_id': '1902/6/1'})['participants'] == []
+    assert load.db.participants.find({'case': '1902/6/1'}) == []
+    assert len(load.db.participants.find({'case': '1902/6/2'})) == 1
+
+
+@with_load
+def test_lost_participants(load):
+    check_lost_participants(load)
+
+
+@with_load
+def test_removed(load):
+    load(INPUT)
+    results = load(INPUT.replace('c 173', 'c 175'))
+    assert counts(results) == (1, 0, 2, 0, 1)
+    assert load.db.cases.find_one({'_id': '1902/6/173'}) is None
+    assert load.db.participants.find({'case': '1902/6/173'}) == []
+
+
+def check_moved(load, **kwds):
+    load(INPUT, **kwds)
+    before = [load.lines('1902/6/173'), load.lines('1902/6/174')]
+    # The new line changes case 172 and moves the others down.
+    results = load(INPUT.replace('Charley Thomas', 'Charley Thomas\nn new'),
+                   **kwds)
+    assert counts(results) == (0, 1, 0, 2, 0)
+    # Only the cases are written again, not their participants.
+    assert results['num_written'] == 4
+    assert [load.lines('1902/6/173'), load.lines('1902/6/174')] == before
+    case = load.db.cases.find_one({'_id': '1902/6/174'})
+    assert case['load_job_id'] == 2
+
+
+@with_load
+def test_moved(load):
+    check_moved(load)
+
+
+@with_load
+def test_moved_ranges(load):
+    check_moved(load, line_ranges=True)
+
+
+@with_load
+def test_switch_to_ranges(load):
+    load(INPUT)
+    results = load(INPUT, line_ranges=True)
+    assert counts(results) == (0, 3, 0, 0, 0)
+    assert isinstance(load.db.cases.find_one()['lines'], dict)
+
+
+@with_load
+def test_missing_position(load):
+    # Cases stored without a position are written again once.
+    load(INPUT)
+    load.db.cases.update({'_id': '1902/6/172'},
+                         {'$unset': {'position': 1}})
+    results = load(INPUT)
+    assert counts(results) == (0, 0, 2, 1, 0)
+    assert load(INPUT)['case_counts']['unchanged'] == 3
+
+
+@with_load
+def test_missing_file(load):
+    load(INPUT)
+    os.unlink(load.filename)
+    load.db.jobs.insert({'_id': 9, 'status': 'queued'})
+    results = tasks.parse_file(load.filename, lambda: load.db, 9,
+                               Errors())
+    assert results['status'] == 'failed'
+    assert load.db.jobs.find_one({'_id': 9})['status'] == 'failed'
+    # Nothing is removed when the file cannot be read.
+    assert load.db.cases.count() == 3
+
+
+@with_load
+def test_unexpected_error(load):
+    # An error from the write thread is raised when it is stopped.
+    def command(name):
+        raise RuntimeError('lost the server')
+    load.db.command = command
+    load.db.jobs.insert({'_id': 1, 'status': 'queued'})
+    results = load(INPUT, write_queue_size=2)
+    assert results['status'] == 'failed'
+    assert results['errors'] == ['Could not load %s: lost the server' %
+                                 load.filename]
+    assert load.db.jobs.find_one({'_id': 1})['status'] == 'failed'
+    assert load.errors.flushed == 1
+
+
+def write_threads():
+    return [t for t in threading.enumerate() if t.name == 'write-queue']
+
+
+@with_load
+def test_no_write_thread_left(load):
+    before = write_threads()
+    # The file is not there yet.
+    tasks.parse_file(load.filename, lambda: load.db, 1, Errors(),
+                     write_queue_size=2)
+    tasks.CaseLoader(load.db, load.filename, 1, Errors(),
+                     write_queue_size=2)
+    load(INPUT, write_queue_size=2)
+    assert write_threads() == before
+
+
+def test_case_loader():
+    db = fakemongo.Database()
+    errors = Errors()
+    loader = tasks.CaseLoader(db, 'test.vtr', 1, errors, batch_size=2)
+    case = {'book': '1902/6', 'number': '172', 'page': 170,
+            'content_hash': 'a', 'lines': [(3, u'c 172')],
+            'participants': [],
+            }
+    loader.load([dict(case), dict(case, number='173')])
+    assert loader.case_counts['added'] == 2
+    assert loader.num_written == 2
+
+    loader = tasks.CaseLoader(db, 'test.vtr', 2, errors, batch_size=2)
+    loader.find_stored(['1902/6/172'])
+    assert loader.stored_hashes == {'1902/6/172': 'a'}
+    assert loader.stored_positions == {'1902/6/172': [3, None]}
+    # A second copy of a case is reported and skipped.
+    loader.load([dict(case), dict(case)])
+    assert loader.case_counts['unchanged'] == 1
+    assert loader.stored_hashes == {}
+    assert len(errors.messages) == 1
+
+
+def test_remove_cases():
+    db = fakemongo.Database()
+    db.cases.insert([{'_id': 'a'}, {'_id': 'b'}, {'_id': 'c'}])
+    db.participants.insert([{'case': 'a'}, {'case': 'b'}, {'case': 'c'}])
+    assert tasks.remove_cases(db, ['a', 'b'], Errors()) == 2
+    assert db.cases.find() == [{'_id': 'c'}]
+    assert [p['case'] for p in db.participants.find()] == ['c']
+    assert tasks.remove_cases(db, [], Errors()) == 0
@@ -0,0 +1,102 @@
+# -*- encoding: utf-8 -*-
+"""Tests for the content hash of each case.
+"""
+
+from docket import vtr
+
+
+INPUT = u"""
+b 1902/6
+pg 170
+c 172
+d Charley Thomas
+sr 5 F
+c 173
+d Murphey Lane
+p maybe
+
+pg 171
+c 174
+d Tom Thomas
+""".splitlines()
+
+
+def hashes(lines):
+    p = vtr.Parser()
+    return dict((c['number'], c['content_hash']) for c in p.parse(lines))
+
+
+def test_every_case():
+    h = hashes(INPUT)
+    assert sorted(h) == ['172', '173', '174']
+    assert len(set(h.values())) == 3
+
+
+def test_stable():
+    assert hashes(INPUT) == hashes(INPUT)
+
+
+def test_blank_lines():
+    lines = INPUT[:4] + [u'', u'  '] + INPUT[4:]
+    assert hashes(lines) == hashes(INPUT)
+
+
+def test_moved_lines():
+    # A new line changes its own case, but not the cases after it
+    # that are moved down.
+    lines = INPUT[:5] + [u'n new note'] + INPUT[5:]
+    before = hashes(INPUT)
+    after = hashes(lines)
+    assert after['172'] != before['172']
+    assert after['173'] == before['173']
+    assert after['174'] == before['174']
+
+
+def test_changed_line():
+    lines = [l.replace('Murphey', 'Murphy') for l in INPUT]
+    before = hashes(INPUT)
+    after = hashes(lines)
+    assert after['173'] != before['173']
+    assert after['172'] == before['172']
+    assert after['174'] == before['174']
+
+
+def test_fixed_error():
+    lines = [l.replace('p maybe', 'p guilty') for l in INPUT]
+    assert hashes(lines)['173'] != hashes(INPUT)['173']
+
+
+def test_changed_page():
+    lines = [l.replace('pg 171', 'pg 172') for l in INPUT]
+    assert hashes(lines)['174'] != hashes(INPUT)['174']
+
+
+def test_chunks():
+    expected = list(vtr.Parser().parse(INPUT))
+    for chunk_size in range(1, len(INPUT) + 1):
+        cases = []
+        for chunk in vtr.split_chunks(INPUT, chunk_size):
+            cases.extend(vtr.parse_chunk(chunk)[0])
+        assert cases == expected
+
+
+def test_line_ranges():
+    # Switching to line ranges changes what is stored for each case.
+    p = vtr.Parser(source='test.vtr')
+    ranges = dict((c['number'], c['content_hash'])
+                  for c in p.parse(INPUT))
+    before = hashes(INPUT)
+    for number in before:
+        assert ranges[number] != before[number]
+
+
+def test_parser_version():
+    before = hashes(INPUT)
+    orig = vtr.PARSER_VERSION
+    vtr.PARSER_VERSION = orig + 1
+    try:
+        after = hashes(INPUT)
+    finally:
+        vtr.PARSER_VERSION = orig
+    for number in before:
+        assert after[number] != before[number]
@@ -0,0 +1,67 @@
+"""Tests for the date conversion cache in the VTR parser.
+"""
+
+import datetime
+
+from docket import vtr
+
+from nose.tools import assert_raises
+
+
+def test_convert():
+    cache = vtr.DateCache()
+    assert cache.convert('30', 'Mar', '1903') == datetime.datetime(1903, 3, 30)
+
+
+def test_convert_sept_july():
+    cache = vtr.DateCache()
+    assert cache.convert('1', 'Sept', '1903') == datetime.datetime(1903, 9, 1)
+    assert cache.convert('1', 'July', '1903') == datetime.datetime(1903, 7, 1)
+
+
+def test_hits_and_misses():
+    cache = vtr.DateCache()
+    cache.convert('30', 'Mar', '1903')
+    cache.convert('30', 'Mar', '1903')
+    cache.convert('31', 'Mar', '1903')
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+    assert stats['size'] == 2
+
+
+def test_bounded():
+    cache = vtr.DateCache(max_size=2)
+    for day in range(1, 10):
+        cache.convert(str(day), 'Mar', '1903')
+    assert cache.stats()['size'] <= 2
+
+
+def test_invalid_date_not_cached():
+    cache = vtr.DateCache()
+    assert_raises(ValueError, cache.convert, '30', 'Foo', '1903')
+    assert_raises(ValueError, cache.convert, '30', 'Foo', '1903')
+    assert cache.stats()['size'] == 0
+
+
+def test_clear():
+    cache = vtr.DateCache()
+    cache.convert('30', 'Mar', '1903')
+    cache.clear()
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'size': 0}
+
+
+def test_parser_uses_cache():
+    vtr.DATE_CACHE.clear()
+    p = vtr.Parser()
+    list(p.parse(u"""
+b 1902/6
+pg 170
+c 172
+ad 30 Mar 1903
+hd 01 Apr 1903
+c 173
+ad 30 Mar 1903
+hd 01 Apr 1903
+""".splitlines()))
+    assert vtr.DATE_CACHE.stats()['hits'] == 2
@@ -0,0 +1,97 @@
+# -*- encoding: utf-8 -*-
+"""Tests for dispatching lines to field parsers based on the keyword.
+"""
+
+from docket import vtr
+
+
+INPUT = u"""
+b 1902/6
+pg 170
+c 172
+ad 30 Mar 1903
+hd 01 Apr 1903
+d Charley Thomas
+dv abc 123
+v 360 (note)
+l Hoyt Street
+ao Hamilton
+w J. T. Hamilton
+dw C. A. Lambert title=Mrs.
+op Jerry Brown suffix=Jr.
+p guilty
+sr 5 F
+ss 5 PD 02 Apr 1903 (paid)
+sc 5 W
+n a note
+o dismissed
+g m
+r W
+c
+ad 30 Foo 1903
+d
+dv
+sr o
+p maybe
+x something
+cx 1
+pg abc
+B 1902/7
+C 1
+D Someone Else
+"""
+
+
+def parse_match_first(keyword, line):
+    "Try every field grammar in turn on the line."
+    return vtr.CASE_RECORD.parseString(line)
+
+
+class MatchFirstParser(vtr.Parser):
+    """Use the combined grammar for every line instead of dispatching
+    on the keyword.
+    """
+
+    def __init__(self):
+        super(MatchFirstParser, self).__init__()
+        self.tokenizer.parse_field = parse_match_first
+
+
+def parse_all(p):
+    cases = list(p.parse(INPUT.splitlines()))
+    return cases, p.errors
+
+
+def test_same_results_as_match_first():
+    dispatched = vtr.Parser()
+    match_first = MatchFirstParser()
+    expected_cases, expected_errors = parse_all(match_first)
+    actual_cases, actual_errors = parse_all(dispatched)
+    assert actual_cases == expected_cases
+    assert actual_errors == expected_errors
+
+
+def test_every_field_has_a_keyword():
+    assert len(vtr.FIELD_GRAMMARS) == len(vtr.FIELDS)
+
+
+def test_keyword_case_insensitive():
+    p = vtr.Parser()
+    cases = list(p.parse(u"""
+B 1900/1
+C 1
+D Charley Thomas
+""".splitlines()))
+    assert cases[0]['book'] == '1900/1'
+    assert cases[0]['defendant'] == 'Charley Thomas'
+
+
+def test_unknown_keyword_error():
+    p = vtr.Parser()
+    list(p.parse(u"""
+b 1900/1
+c 1
+x something
+""".splitlines()))
+    assert len(p.errors) == 2
+    assert p.errors[0][:2] == (4, 'x something')
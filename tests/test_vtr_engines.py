@@ -0,0 +1,117 @@
+# -*- encoding: utf-8 -*-
+"""Tests for the regex parsing engine and its conformance with pyparsing.
+"""
+
+from docket import vtr
+
+from nose.tools import assert_raises
+
+import datetime
+
+
+CORPUS = u"""
+b 1902/6
+
+pg 170
+c 172
+ad 30 Mar 1903
+hd 01 Apr 1903
+d Charley Thomas
+v 360
+l Hoyt Street
+ao Hamilton
+w J. T. Hamilton
+w A. J. Watson
+p guilty
+sr 5 F
+ss 5 PD
+
+pg 170
+c 174
+ad 30 Mar 1903
+hd 01 Apr 1903
+d Murphey Lane title=Mr. suffix=Jr. (note goes here)
+dw C. A. Lambert alias=Lamb title=Mrs.
+op Someone Else
+dv abc 123
+v 360 (some additional info)
+l College & River Streets
+p NG
+sr 5 F
+sr 1.25 C
+sr 12.5 W
+sr Dismissed
+sr o (explain what this means)
+sr J ("that the Def be confined")
+ss W (Turned over to Streets)
+ss 6 PD 02 Apr 1903 (Paid back by J. W. Barnett of the above fine)
+ss 1 Jan 2012
+sc 5
+sc 5 W (note)
+n note 1
+n note 2
+o not guilty
+g F
+r C
+
+b 1902/7
+pg 1
+c 1
+d Tom Thomas
+sr o
+ad 31 Foo 1903
+hd 1 Sept 1903
+p maybe
+o nothing
+pg abc
+c
+d (note)
+x unknown keyword
+B 1902/8
+C 2
+D William Griffith (alias William Bolton)
+"""
+
+
+def test_no_differences():
+    differences = vtr.compare_engines(CORPUS.splitlines())
+    assert differences == [], differences
+
+
+def test_regex_engine():
+    p = vtr.Parser(engine='regex')
+    cases = list(p.parse(u"""
+b 1902/6
+pg 170
+c 172
+ad 30 Mar 1903
+d Charley M. Thomas title=Mr.
+ss 6 PD 02 Apr 1903 (paid)
+""".splitlines()))
+    case = cases[0]
+    assert case['book'] == '1902/6'
+    assert case['page'] == 170
+    assert case['arrest_date'] == datetime.datetime(1903, 3, 30)
+    part = case['participants'][0]
+    assert part['middle_name'] == 'M.'
+    assert part['title'] == 'Mr.'
+    ss = case['sentence_served'][0]
+    assert ss['type'] == 'paid'
+    assert ss['amount'] == 6.0
+    assert ss['date'] == datetime.datetime(1903, 4, 2)
+    assert ss['note'] == 'paid'
+
+
+def test_regex_engine_errors():
+    p = vtr.Parser(engine='regex')
+    list(p.parse(u"""
+b 1902/6
+c 172
+d Charley Thomas
+ad 30 Mar
+""".splitlines()))
+    assert [e[:2] for e in p.errors] == [(5, 'ad 30 Mar')]
+
+
+def test_unknown_engine():
+    assert_raises(ValueError, vtr.Parser, engine='no-such-engine')
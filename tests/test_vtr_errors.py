@@ -0,0 +1,69 @@
+# -*- encoding: utf-8 -*-
+"""Tests for collecting the errors found by the parser.
+"""
+
+from docket import vtr
+
+from tests.test_vtr_engines import CORPUS
+
+
+def parse(**kwds):
+    p = vtr.Parser(**kwds)
+    cases = list(p.parse(CORPUS.splitlines()))
+    return p, cases
+
+
+def test_collected():
+    p, cases = parse()
+    assert len(p.errors) == p.error_count == 8
+    assert p.dropped_errors == 0
+
+
+def test_sink():
+    expected, expected_cases = parse()
+    found = []
+    p, cases = parse(error_sink=found.append)
+    assert found == expected.errors
+    assert p.errors == []
+    assert p.error_count == len(found)
+    assert cases == expected_cases
+
+
+def test_sink_called_while_parsing():
+    found = []
+    p = vtr.Parser(error_sink=found.append)
+    cases = p.parse(CORPUS.splitlines())
+    # The errors all come after the first two cases
+    for i in range(2):
+        next(cases)
+    assert found == []
+    list(cases)
+    assert found
+
+
+def test_max_errors():
+    expected, expected_cases = parse()
+    p, cases = parse(max_errors=3)
+    assert p.errors == expected.errors[:3]
+    assert p.error_count == 8
+    assert p.dropped_errors == 5
+    assert cases == expected_cases
+
+
+def test_max_errors_with_sink():
+    found = []
+    p, cases = parse(error_sink=found.append, max_errors=0)
+    assert found == []
+    assert p.dropped_errors == p.error_count == 8
+
+
+def test_validation_errors():
+    found = []
+    p = vtr.Parser(error_sink=found.append)
+    list(p.parse(u"""
+b 1902/6
+c 1
+c 2
+d Someone
+""".splitlines()))
+    assert found == [(4, '', 'No defendant found for 1')]
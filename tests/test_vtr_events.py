@@ -0,0 +1,92 @@
+# -*- encoding: utf-8 -*-
+"""Tests for the event stream under the parser.
+"""
+
+import cPickle as pickle
+
+from docket import corpus, vtr
+
+from tests.test_vtr_engines import CORPUS
+
+
+INPUT = u"""
+b 1902/6
+pg 170
+c 172
+ad 30 Mar 1903
+d Charley Thomas
+sr 5 F
+p maybe
+n a note
+""".splitlines()
+
+
+def test_one_event_per_line():
+    events = list(vtr.tokenize(INPUT))
+    assert [e.num for e in events] == range(1, len(INPUT) + 1)
+
+
+def test_kinds():
+    events = list(vtr.tokenize(INPUT))
+    assert [e.kind for e in events] == [
+        vtr.BLANK, 'book', 'page', 'case', 'date', 'participant',
+        'sentence', vtr.ERROR, 'note',
+        ]
+
+
+def test_tokens():
+    events = list(vtr.tokenize(INPUT))
+    assert events[3].tokens['number'] == '172'
+    assert events[5].tokens[0]['last_name'] == 'Thomas'
+    assert events[5].keyword == 'd'
+
+
+def test_error_message():
+    for engine in vtr.ENGINES:
+        event = list(vtr.tokenize(INPUT, engine=engine))[7]
+        p = vtr.Parser(engine=engine)
+        list(p.parse(INPUT))
+        assert p.errors == [(event.num, event.line, event.tokens)]
+
+
+def test_skipped():
+    events = list(vtr.tokenize(INPUT, keywords=['ad']))
+    assert [e.kind for e in events if e.kind == vtr.SKIPPED] == \
+        [vtr.SKIPPED] * 4
+
+
+def test_stateless():
+    # A line comes out the same without the lines before it.
+    t = vtr.Tokenizer()
+    events = list(t.tokenize(enumerate(INPUT, 1)))
+    for event in events:
+        assert t.tokenize_line(event.num, event.line) == event
+
+
+def test_offsets():
+    lines = [l + u'\n' for l in INPUT]
+    events = list(vtr.Tokenizer().tokenize(enumerate(lines, 1), 0))
+    data = u''.join(lines).encode('utf-8')
+    for event in events:
+        assert data[event.start:event.end].strip() == event.line
+
+
+def test_assemble_matches_parse():
+    for engine in vtr.ENGINES:
+        expected = vtr.Parser(engine=engine)
+        expected_cases = list(expected.parse(CORPUS.splitlines()))
+        p = vtr.Parser(engine=engine)
+        events = vtr.tokenize(CORPUS.splitlines(), engine=engine)
+        assert list(p.assemble(events)) == expected_cases
+        assert p.errors == expected.errors
+
+
+def test_pickle():
+    # Events can be made in other processes.
+    lines = list(corpus.Generator(seed=1, error_rate=0.05).lines(50))
+    for engine in vtr.ENGINES:
+        events = list(vtr.tokenize(lines, engine=engine))
+        copied = pickle.loads(pickle.dumps(events, pickle.HIGHEST_PROTOCOL))
+        assert copied == events
+        expected = list(vtr.Parser(engine=engine).assemble(events))
+        assert list(vtr.Parser(engine=engine).assemble(copied)) == expected
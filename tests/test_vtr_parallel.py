@@ -0,0 +1,100 @@
+# -*- encoding: utf-8 -*-
+"""Tests for parsing VTR input in chunks.
+"""
+
+from docket import vtr
+
+
+INPUT = u"""
+b 1902/6
+
+pg 170
+c 172
+ad 30 Mar 1903
+d Charley Thomas
+sr 5 F
+
+pg 170
+c 173
+ad 30 Mar 1903
+sr o
+v 360
+
+pg 171
+d Stray Defendant
+c 174
+d Murphey Lane
+pg abc
+ss W (Turned over to Streets)
+b 1902/7
+
+pg 1
+
+
+c 1
+d Tom Thomas
+c
+c 2
+ad 31 Foo 1903
+b 1902/8
+pg 2
+x unknown
+c 3
+d William Griffith
+pg 3
+c 4
+pg 4
+c 5
+d Bob Williams
+n note
+""".splitlines()
+
+
+def parse_serial(lines):
+    p = vtr.Parser()
+    cases = list(p.parse(lines))
+    return cases, p.errors
+
+
+def parse_chunks(lines, chunk_size):
+    cases = []
+    errors = []
+    for chunk in vtr.split_chunks(lines, chunk_size):
+        chunk_cases, chunk_errors = vtr.parse_chunk(chunk)
+        cases.extend(chunk_cases)
+        errors.extend(chunk_errors)
+    errors.sort(key=lambda e: e[0])
+    return cases, errors
+
+
+def check_chunk_size(chunk_size, expected_cases, expected_errors):
+    cases, errors = parse_chunks(INPUT, chunk_size)
+    assert cases == expected_cases
+    assert errors == expected_errors
+
+
+def test_chunks_match_serial():
+    expected_cases, expected_errors = parse_serial(INPUT)
+    for chunk_size in range(1, len(INPUT) + 2):
+        yield check_chunk_size, chunk_size, expected_cases, expected_errors
+
+
+def test_split_at_book_and_page():
+    chunks = list(vtr.split_chunks(INPUT, 1))
+    assert len(chunks) > 1
+    for chunk in chunks[1:]:
+        keyword = INPUT[chunk.start - 1].split()[0]
+        assert keyword in ('b', 'pg')
+
+
+def test_state_carried():
+    chunks = list(vtr.split_chunks(INPUT, 1))
+    last = chunks[-1]
+    assert last.book == '1902/8'
+    assert last.page == 3
+
+
+def test_single_chunk():
+    chunks = list(vtr.split_chunks(INPUT, len(INPUT)))
+    assert len(chunks) == 1
+    assert chunks[0].lines == list(enumerate(INPUT, 1))
@@ -0,0 +1,88 @@
+# -*- encoding: utf-8 -*-
+"""Tests for parsing only some of the keywords.
+"""
+
+from docket import corpus, vtr
+
+
+INPUT = u"""
+b 1902/6
+pg 170
+c 172
+ad 30 Mar 1903
+d Charley Thomas
+sr 5 F
+p maybe
+c 173
+ad 31 Mar 1903
+v 360
+
+pg 171
+c 174
+ad 1 Apr 1903
+hd 2 Apr 1903
+d Murphey Lane
+ss W (Turned over to Streets)
+""".splitlines()
+
+
+def parse(lines, **kwds):
+    p = vtr.Parser(**kwds)
+    cases = list(p.parse(lines))
+    return cases, p.errors
+
+
+def test_case_boundaries():
+    full, _ = parse(INPUT)
+    skim, _ = parse(INPUT, keywords=[])
+    assert [(c['book'], c['page'], c['number']) for c in skim] == \
+        [(c['book'], c['page'], c['number']) for c in full]
+
+
+def test_selected_fields():
+    full, _ = parse(INPUT)
+    skim, _ = parse(INPUT, keywords=['ad', 'd'])
+    for f, s in zip(full, skim):
+        assert s.get('arrest_date') == f.get('arrest_date')
+        assert s.get('defendant') == f.get('defendant')
+        assert 'hearing_date' not in s
+        assert 'sentence' not in s
+
+
+def test_skipped_lines_not_checked():
+    _, errors = parse(INPUT, keywords=['ad'])
+    assert errors == []
+
+
+def test_parsed_lines_checked():
+    _, errors = parse(INPUT, keywords=['p'])
+    assert [e[0] for e in errors] == [8]
+
+
+def test_defendant_checked():
+    # Case 173 has no defendant
+    _, errors = parse(INPUT, keywords=['d'])
+    assert len(errors) == 1
+    assert 'defendant' in errors[0][2]
+
+
+def test_lines_kept():
+    # Lines that fail to parse are left out of a full parse, so only
+    # compare valid input.
+    lines = [l for l in INPUT if l != u'p maybe']
+    full, _ = parse(lines)
+    skim, _ = parse(lines, keywords=[])
+    assert [c['lines'] for c in skim] == [c['lines'] for c in full]
+
+
+def test_chunks_match_serial():
+    lines = list(corpus.Generator(seed=3, error_rate=0.05).lines(60))
+    serial, serial_errors = parse(lines, keywords=['ad', 'd'])
+    cases = []
+    errors = []
+    for chunk in vtr.split_chunks(lines, 40, keywords=['ad', 'd']):
+        chunk_cases, chunk_errors = vtr.parse_chunk(chunk)
+        cases.extend(chunk_cases)
+        errors.extend(chunk_errors)
+    assert cases == serial
+    assert errors == serial_errors
@@ -0,0 +1,36 @@
+# -*- encoding: utf-8 -*-
+"""Tests for parsing in several threads at once with the shared grammar.
+"""
+
+import threading
+
+from docket import vtr
+
+from tests.test_vtr_engines import CORPUS
+
+
+def parse(engine, results):
+    p = vtr.Parser(engine=engine)
+    for i in range(20):
+        cases = list(p.parse(CORPUS.splitlines()))
+        results.append((cases, p.errors))
+        p = vtr.Parser(engine=engine)
+
+
+def check_threads(engine):
+    expected = []
+    parse(engine, expected)
+    results = [[] for i in range(4)]
+    threads = [threading.Thread(target=parse, args=(engine, r))
+               for r in results]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for r in results:
+        assert r == expected
+
+
+def test_threads():
+    for engine in sorted(vtr.ENGINES):
+        yield check_threads, engine
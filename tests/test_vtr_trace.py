@@ -0,0 +1,67 @@
+# -*- encoding: utf-8 -*-
+"""Tests for tracing the parser.
+"""
+
+from docket import vtr
+
+from tests.test_vtr_engines import CORPUS
+
+
+def parse(**kwds):
+    p = vtr.Parser(**kwds)
+    cases = list(p.parse(CORPUS.splitlines()))
+    return p, cases
+
+
+def test_off_by_default():
+    p, cases = parse()
+    assert p.stats is None
+
+
+def test_same_results():
+    expected, expected_cases = parse()
+    traced, cases = parse(trace=True)
+    assert cases == expected_cases
+    assert traced.errors == expected.errors
+
+
+def test_counts():
+    p, cases = parse(trace=True)
+    assert p.stats.counts['c'] == 5  # keywords are not case sensitive
+    assert p.stats.counts['sr'] == 8
+    total = sum(p.stats.counts.values())
+    assert total == len([l for l in CORPUS.splitlines() if l.strip()])
+
+
+def test_errors():
+    p, cases = parse(trace=True)
+    assert p.stats.errors['ad'] == 1
+    assert p.stats.errors['x'] == 1
+    # Errors from the feed methods are counted, too
+    assert p.stats.errors['sr'] == 1
+    assert sum(p.stats.errors.values()) == len(p.errors)
+
+
+def test_action_times():
+    p, cases = parse(trace=True)
+    assert 'feed_sr' in p.stats.action_times
+    assert 'sr' in p.stats.parse_times
+    assert p.stats.total_time > 0
+
+
+def test_slowest():
+    p = vtr.Parser(trace=True)
+    p.stats = vtr.ParseStats(num_slowest=3)
+    list(p.parse(CORPUS.splitlines()))
+    slowest = p.stats.slowest
+    assert len(slowest) == 3
+    assert slowest == sorted(slowest, reverse=True)
+    for seconds, num, line in slowest:
+        assert CORPUS.splitlines()[num - 1].strip() == line
+
+
+def test_report():
+    p, cases = parse(trace=True)
+    report = p.stats.report()
+    assert report[0].split() == ['key', 'lines', 'errors', 'parse', 'action']
+    assert report == vtr.format_parse_stats(p.stats.as_dict())